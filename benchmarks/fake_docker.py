@@ -0,0 +1,357 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import hashlib
+import json
+import os
+import random
+import sys
+import tarfile
+import time
+
+from contextlib import contextmanager
+from io import BytesIO
+
+# Resolve the scenario settings shared by every invocation of the fake binaries
+STATE_PATH = os.environ['FAKE_DOCKER_STATE']
+SERVICES = os.environ.get('FAKE_DOCKER_SERVICES', 'app').split(',')
+LATENCY = float(os.environ.get('FAKE_DOCKER_LATENCY', 0))
+RESTARTS = int(os.environ.get('FAKE_DOCKER_RESTARTS', 0))
+RESTART_INTERVAL = float(os.environ.get('FAKE_DOCKER_RESTART_INTERVAL', 0.5))
+LOG_LINES = int(os.environ.get('FAKE_DOCKER_LOG_LINES', 10))
+LOG_LINE_SIZE = int(os.environ.get('FAKE_DOCKER_LOG_LINE_SIZE', 80))
+RESOURCES = int(os.environ.get('FAKE_DOCKER_RESOURCES', 10))
+PULL_TIME = float(os.environ.get('FAKE_DOCKER_PULL_TIME', 0))
+HEALTH_DELAY = float(os.environ.get('FAKE_DOCKER_HEALTH_DELAY', 0))
+GOSS_EXITS = [int(code) for code in os.environ.get('FAKE_DOCKER_GOSS_EXITS', '0').split(',')]
+POLL_INTERVAL = 0.05
+
+
+@contextmanager
+def locked_state():
+    # Serialize access to the shared state across concurrent invocations
+    with open(os.path.join(STATE_PATH, 'state.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = read_state()
+        yield state
+
+        # Replace the state atomically so that readers never see a partial file
+        path = os.path.join(STATE_PATH, 'state.json.tmp')
+        with open(path, 'w') as f:
+            json.dump(state, f)
+        os.replace(path, os.path.join(STATE_PATH, 'state.json'))
+
+
+def read_state():
+    try:
+        with open(os.path.join(STATE_PATH, 'state.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'containers': {}, 'validations': {}}
+
+
+def get_missing_images(images):
+    # Images are only missing when pulls are being simulated and they have not been pulled yet
+    pulled = read_state().get('images', [])
+    return [image for image in images if PULL_TIME and image not in pulled]
+
+
+def pull_images(images):
+    with locked_state() as state:
+        state['images'] = sorted(set(state.get('images', []) + list(images)))
+
+
+def format_time(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + '.{:09d}Z'.format(
+        int(timestamp % 1 * 1e9))
+
+
+def get_restarts(container, now=None):
+    # Containers restart at a fixed interval after being created until the configured number of restarts is reached
+    if not container['running']:
+        return container['restarts']
+    elapsed = (now or time.time()) - container['created']
+    return min(RESTARTS, int(elapsed / RESTART_INTERVAL))
+
+
+def is_healthy(container):
+    # Containers become healthy a fixed time after they were created
+    return container['running'] and time.time() - container['created'] >= HEALTH_DELAY
+
+
+def get_state(container):
+    restarts = get_restarts(container)
+    started = container['created'] + restarts * RESTART_INTERVAL
+
+    # Only report a health status when a healthcheck is being simulated
+    health = {'Health': {'Status': 'healthy' if is_healthy(container) else 'starting'}} if HEALTH_DELAY else {}
+
+    return dict(health, **{
+        'Status': 'running' if container['running'] else 'exited',
+        'Running': container['running'],
+        'Restarting': False,
+        'OOMKilled': False,
+        'ExitCode': 0,
+        'Error': '',
+        'StartedAt': format_time(started),
+        'FinishedAt': format_time(started) if restarts else '0001-01-01T00:00:00Z',
+        'RestartCount': restarts,
+    })
+
+
+def inspect(container_id, container):
+    return {
+        'Id': container_id,
+        'Image': 'sha256:{}'.format(hashlib.sha256(container['service'].encode('utf-8')).hexdigest()),
+        'State': get_state(container),
+        'HostConfig': {'NanoCpus': 0, 'CpuQuota': 0, 'CpuPeriod': 0, 'CpusetCpus': ''},
+        'Config': {'Labels': {
+            'com.docker.compose.project': container['project'],
+            'com.docker.compose.service': container['service'],
+            'com.docker.compose.oneoff': 'False',
+        }},
+    }
+
+
+def get_project_containers(state, project):
+    return {cid: c for cid, c in state['containers'].items() if c['project'] == project}
+
+
+def write_logs(service):
+    # Write the configured volume of log output for the service
+    line = 'x' * LOG_LINE_SIZE
+    for index in range(LOG_LINES):
+        sys.stdout.write('{} | {} {}\n'.format(service, index, line))
+
+
+def render_document():
+    return 'file:\n' + ''.join('  /fake/file{}:\n    exists: true\n'.format(index) for index in range(RESOURCES))
+
+
+def validate(project, service, args):
+    # Determine the exit code from the sequence of exit codes for the service
+    with locked_state() as state:
+        key = '{}/{}'.format(project, service)
+        attempt = state['validations'].get(key, 0)
+        state['validations'][key] = attempt + 1
+    exit_code = GOSS_EXITS[min(attempt, len(GOSS_EXITS) - 1)]
+
+    # Report the results in the requested format, failing the first resource when the attempt fails
+    if '--format=json' in args:
+        results = [{'resource-type': 'File', 'resource-id': '/fake/file{}'.format(index), 'property': 'exists',
+                    'successful': exit_code == 0 or index > 0, 'skipped': False, 'duration': 1000}
+                   for index in range(RESOURCES)]
+        sys.stdout.write(json.dumps({'results': results, 'summary': {
+            'test-count': RESOURCES, 'failed-count': 0 if exit_code == 0 else 1, 'total-duration': 1000 * RESOURCES,
+        }}) + '\n')
+    else:
+        sys.stdout.write('.' * RESOURCES + '\n\nCount: {}, Failed: {}\n'.format(RESOURCES, 1 if exit_code else 0))
+
+    return exit_code
+
+
+def compose(args, plugin=False):
+    project = 'default'
+
+    # Parse the global options
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option in ['--project-name', '-p']:
+            project = args.pop(0)
+        elif option in ['--project-directory', '--file', '-f', '--ansi']:
+            args.pop(0)
+
+    command, args = args[0], args[1:]
+    positional = [arg for arg in args if not arg.startswith('-')]
+
+    if command == 'up':
+        # Pull any missing images one at a time
+        for image in get_missing_images(['fake/{}'.format(service) for service in positional or SERVICES]):
+            time.sleep(PULL_TIME)
+            pull_images([image])
+
+        with locked_state() as state:
+            for service in positional or SERVICES:
+                container_id = '{:064x}'.format(random.getrandbits(256))
+                state['containers'][container_id] = {'project': project, 'service': service, 'running': True,
+                                                     'created': time.time(), 'restarts': 0}
+
+    elif command == 'down':
+        with locked_state() as state:
+            for container_id in get_project_containers(state, project):
+                del state['containers'][container_id]
+
+    elif command in ['stop', 'start', 'restart']:
+        with locked_state() as state:
+            for container in get_project_containers(state, project).values():
+                if not positional or container['service'] in positional:
+                    if command == 'stop':
+                        container['restarts'], container['running'] = get_restarts(container), False
+                    else:
+                        container['running'], container['created'] = True, time.time()
+
+    elif command == 'pull':
+        # Pull all of the missing images concurrently
+        images = get_missing_images(['fake/{}'.format(service) for service in positional or SERVICES])
+        if images:
+            time.sleep(PULL_TIME)
+            pull_images(images)
+
+    elif command == 'config':
+        if '--services' in args:
+            sys.stdout.write(''.join('{}\n'.format(service) for service in SERVICES))
+        else:
+            sys.stdout.write('services:\n' + ''.join('  {}:\n    image: fake/{}\n'.format(service, service)
+                                                      for service in SERVICES))
+
+    elif command == 'ps':
+        containers = get_project_containers(read_state(), project)
+        if '--services' in args:
+            sys.stdout.write(''.join('{}\n'.format(s) for s in sorted({c['service'] for c in containers.values()})))
+        elif 'json' in args:
+            positional.remove('json')
+            sys.stdout.write(''.join(json.dumps({
+                'ID': cid, 'Service': c['service'], 'Project': project,
+                'State': 'running' if c['running'] else 'exited',
+            }) + '\n' for cid, c in containers.items() if not positional or c['service'] in positional))
+        else:
+            sys.stdout.write(''.join('{}\n'.format(cid) for cid, c in containers.items()
+                                     if not positional or c['service'] in positional))
+
+    elif command == 'logs':
+        if not plugin:
+            sys.stdout.write('Attaching to {}\n'.format(', '.join(positional or SERVICES)))
+        for service in positional or SERVICES:
+            write_logs(service)
+
+        # Keep following the logs until the containers of the project have stopped
+        if '--follow' in args:
+            sys.stdout.flush()
+            while any(c['running'] for c in get_project_containers(read_state(), project).values()):
+                time.sleep(POLL_INTERVAL)
+
+    elif command == 'exec':
+        service, command_args = positional[0], args[args.index(positional[0]) + 1:]
+        if 'render' in command_args:
+            sys.stdout.write(render_document())
+        elif 'validate' in command_args:
+            return validate(project, service, command_args)
+
+    return 0
+
+
+def docker(args):
+    command, args = args[0], args[1:]
+
+    if command == 'compose':
+        return compose(args, plugin=True)
+
+    elif command == 'image' and args[0] == 'inspect':
+        images = [arg for arg in args[1:] if not arg.startswith('-') and arg != '{{.Id}}']
+        missing = get_missing_images(images)
+        sys.stdout.write(''.join('sha256:{}\n'.format(hashlib.sha256(image.encode('utf-8')).hexdigest())
+                                 for image in images if image not in missing))
+        if missing:
+            sys.stderr.write('Error: No such image: {}\n'.format(missing[0]))
+            return 1
+
+    elif command == 'inspect':
+        containers = read_state()['containers']
+        targets = [arg for arg in args if not arg.startswith('-')]
+        sys.stdout.write(json.dumps([inspect(cid, containers[cid]) for cid in targets if cid in containers]) + '\n')
+        missing = [cid for cid in targets if cid not in containers]
+        if missing:
+            sys.stderr.write('Error: No such object: {}\n'.format(missing[0]))
+            return 1
+
+    elif command == 'ps':
+        filters = [args[index + 1] for index, arg in enumerate(args) if arg == '--filter']
+        projects = [f.split('=', 2)[2] for f in filters if f.startswith('label=com.docker.compose.project=')]
+        label = 'project' if 'com.docker.compose.project"' in args[-1] else 'service'
+        for container_id, container in read_state()['containers'].items():
+            if not projects or container['project'] in projects:
+                sys.stdout.write('{}\t{}\n'.format(container_id, container[label]))
+
+    elif command in ['network', 'volume'] and args[0] == 'ls':
+        # Networks and volumes are not simulated, so none are ever left behind
+        pass
+
+    elif command == 'events':
+        filters = [args[index + 1] for index, arg in enumerate(args) if arg == '--filter']
+        projects = [f.split('=', 2)[2] for f in filters if f.startswith('label=com.docker.compose.project=')]
+        seen = {}
+        healthy = set()
+
+        # Report the start of each container, every simulated restart and health change until terminated
+        while True:
+            for container_id, container in read_state()['containers'].items():
+                if projects and container['project'] not in projects:
+                    continue
+
+                actions = []
+                starts = get_restarts(container) + 1 if container['running'] else 0
+                for _ in range(seen.get(container_id, 0), starts):
+                    actions.extend(['die', 'start'] if seen.get(container_id) else ['start'])
+                    seen[container_id] = seen.get(container_id, 0) + 1
+                if HEALTH_DELAY and container_id not in healthy and is_healthy(container):
+                    actions.append('health_status: healthy')
+                    healthy.add(container_id)
+
+                for action in actions:
+                    sys.stdout.write(json.dumps({'Type': 'container', 'Action': action, 'id': container_id,
+                                                 'Actor': {'ID': container_id, 'Attributes': {
+                                                     'com.docker.compose.project': container['project'],
+                                                     'com.docker.compose.service': container['service']}}}) + '\n')
+            sys.stdout.flush()
+            time.sleep(POLL_INTERVAL)
+
+    elif command == 'cp':
+        source, target = args[-2], args[-1]
+        if source == '-':
+            # Keep the uploaded archive so that it can be copied back out
+            container_id = target.split(':', 1)[0]
+            with open(os.path.join(STATE_PATH, '{}.tar'.format(container_id)), 'wb') as f:
+                f.write(sys.stdin.buffer.read())
+        else:
+            container_id = source.split(':', 1)[0]
+            archive = BytesIO()
+            with tarfile.open(os.path.join(STATE_PATH, '{}.tar'.format(container_id))) as uploaded, \
+                    tarfile.open(fileobj=archive, mode='w') as tar:
+                for member in uploaded.getmembers():
+                    tar.addfile(member, uploaded.extractfile(member) if member.isfile() else None)
+            sys.stdout.buffer.write(archive.getvalue())
+
+    elif command == 'logs':
+        containers = read_state()['containers']
+        write_logs(containers[args[-1]]['service'] if args[-1] in containers else 'unknown')
+
+    return 0
+
+
+def main():
+    # Every invocation has already been recorded by the wrapper that executes the fake
+    program, args = sys.argv[1], sys.argv[2:]
+
+    # Simulate the latency of the docker daemon
+    time.sleep(LATENCY)
+
+    try:
+        return compose(list(args)) if program == 'docker-compose' else docker(list(args))
+    except BrokenPipeError:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
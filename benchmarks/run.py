@@ -0,0 +1,259 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from time import perf_counter, sleep, time
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Define the scenarios, each of which overrides the default settings of the fake binaries and dcgoss
+SCENARIOS = {
+    'single-service': {},
+    'many-services': {'FAKE_DOCKER_SERVICES': ','.join('service{}'.format(i) for i in range(8))},
+    'large-logs': {'FAKE_DOCKER_LOG_LINES': '200000'},
+    'slow-convergence': {'FAKE_DOCKER_GOSS_EXITS': '1,1,1,1,1,0'},
+    'restarts': {'FAKE_DOCKER_RESTARTS': '2', 'FAKE_DOCKER_RESTART_INTERVAL': '0.15'},
+    'healthcheck': {'FAKE_DOCKER_HEALTH_DELAY': '2'},
+    'slow-docker': {'FAKE_DOCKER_LATENCY': '0.05'},
+    'legacy-compose': {'GOSS_COMPOSE_BACKEND': 'legacy'},
+    'cold-images': {'FAKE_DOCKER_PULL_TIME': '0.5',
+                    'FAKE_DOCKER_SERVICES': ','.join('service{}'.format(i) for i in range(4))},
+    'many-resources': {'FAKE_DOCKER_RESOURCES': '2000'},
+    'edit': {'action': 'edit'},
+    'shutdown': {'action': 'shutdown', 'FAKE_DOCKER_SERVICES': ','.join('service{}'.format(i) for i in range(8))},
+    'fast-shutdown': {'action': 'shutdown', 'GOSS_TEARDOWN': 'fast',
+                      'FAKE_DOCKER_SERVICES': ','.join('service{}'.format(i) for i in range(8))},
+    'detached-shutdown': {'action': 'shutdown', 'GOSS_TEARDOWN': 'detach',
+                          'FAKE_DOCKER_SERVICES': ','.join('service{}'.format(i) for i in range(8))},
+}
+
+DEFAULTS = {
+    'action': 'run',
+    'GOSS_INITIAL_STARTUP': '0.2',
+    'GOSS_NO_CACHE': '1',
+    'GOSS_SLEEP': '0.05',
+    'NO_COLOR': '1',
+    'NO_HISTORY': '1',
+}
+
+GOSS_BINARY_SIZE = 4 * 1024 * 1024
+
+
+def create_fake_binaries(path):
+    bin_path = os.path.join(path, 'bin')
+    os.makedirs(bin_path)
+
+    # Create a docker and docker-compose executable that both run the fake with the current interpreter, recording
+    # each invocation as soon as it is spawned so that it is counted even when it is killed before the fake starts
+    for program in ['docker', 'docker-compose']:
+        executable = os.path.join(bin_path, program)
+        with open(executable, 'w') as f:
+            f.write('#!/bin/sh\nprintf \'%s %s\\n\' {} "$*" >> "$FAKE_DOCKER_STATE/calls.log"\n'
+                    'exec "{}" "{}" {} "$@"\n'.format(program, sys.executable,
+                                                    os.path.join(BENCHMARKS_PATH, 'fake_docker.py'), program))
+        os.chmod(executable, 0o755)
+
+    return bin_path
+
+
+def create_project(path, services):
+    project_path = os.path.join(path, 'project')
+    os.makedirs(project_path)
+
+    # Define a docker-compose file with the requested services
+    with open(os.path.join(project_path, 'docker-compose.yaml'), 'w') as f:
+        f.write("version: '3.7'\nservices:\n")
+        for service in services:
+            f.write('  {}:\n    image: fake/{}\n'.format(service, service))
+
+    # Define the goss files and a goss binary of a realistic size
+    with open(os.path.join(project_path, 'goss.yaml'), 'w') as f:
+        f.write('file:\n  /etc/passwd:\n    exists: true\n')
+    with open(os.path.join(project_path, 'goss'), 'wb') as f:
+        f.write(os.urandom(GOSS_BINARY_SIZE))
+
+    return project_path
+
+
+def wait_for_log_followers(calls_path, count):
+    deadline = time() + 10
+
+    # Wait for the log followers started with the services to be recorded, so that none are counted as part of the
+    # shutdown, returning the number of calls recorded so far
+    while True:
+        with open(calls_path) as f:
+            calls = f.readlines()
+        if sum(1 for call in calls if ' logs ' in call) >= count or time() > deadline:
+            return len(calls)
+        sleep(0.01)
+
+
+def run_worker(scenario, output_path):
+    import dcgoss
+    from dcgoss.scheduler import ProjectLock
+
+    # Suppress the output of dcgoss so that it does not dominate the benchmark output
+    logging.basicConfig(level=logging.CRITICAL)
+
+    settings = dict(DEFAULTS, **SCENARIOS[scenario])
+    path = os.environ['FAKE_DOCKER_PROJECT']
+    services = os.environ.get('FAKE_DOCKER_SERVICES', 'app').split(',')
+    calls_path = os.path.join(os.environ['FAKE_DOCKER_STATE'], 'calls.log')
+    dc = dcgoss._create(path, 300, float(settings['GOSS_SLEEP']))
+
+    if settings['action'] == 'shutdown':
+        # Only measure the shutdown of a running stack
+        dc._startup(*services)
+        calls_before = wait_for_log_followers(calls_path, len(dc.log_capture.followers) if dc.log_capture else 0)
+        start = perf_counter()
+        dc._shutdown()
+        exit_code = 0
+    else:
+        calls_before = 0
+        start = perf_counter()
+        exit_code = dc.edit(services[0]) if settings['action'] == 'edit' else dc.run(*services)
+
+    wall_time = perf_counter() - start
+
+    # Wait for a detached removal to finish, which holds the project lock until then, so that it is counted as well
+    lock = ProjectLock(dc.project_lock.locks_path, dc.project_lock.project_name, poll_interval=0.05)
+    lock.acquire(time() + 60)
+    lock.release(remove=True)
+
+    # Count the processes spawned while being measured, including those of the background removal
+    with open(calls_path) as f:
+        spawns = len(f.readlines()) - calls_before
+
+    # Report the peak RSS in bytes, which Linux reports in kilobytes
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024
+
+    with open(output_path, 'w') as f:
+        json.dump({'exit_code': exit_code, 'wall_time': wall_time, 'spawns': spawns, 'peak_rss': peak_rss}, f)
+
+
+def run_scenario(scenario):
+    settings = dict(DEFAULTS, **SCENARIOS[scenario])
+    path = tempfile.mkdtemp(prefix='dcgoss-bench-')
+
+    try:
+        # Prepare an isolated environment with the fake binaries on the path
+        env = dict(os.environ, **{k: v for k, v in settings.items() if k.isupper()})
+        env['FAKE_DOCKER_STATE'] = os.path.join(path, 'state')
+        env['FAKE_DOCKER_PROJECT'] = create_project(path, env.get('FAKE_DOCKER_SERVICES', 'app').split(','))
+        env['GOSS_PATH'] = os.path.join(env['FAKE_DOCKER_PROJECT'], 'goss')
+        env['PATH'] = '{}{}{}'.format(create_fake_binaries(path), os.pathsep, env['PATH'])
+        env['PYTHONPATH'] = os.path.dirname(BENCHMARKS_PATH)
+        os.makedirs(env['FAKE_DOCKER_STATE'])
+
+        # Execute the scenario in a separate process so that its peak RSS can be measured on its own
+        output_path = os.path.join(path, 'result.json')
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', scenario, output_path], env=env,
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, check=True)
+
+        with open(output_path) as f:
+            return json.load(f)
+
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+
+    # Flag any scenario that became slower or spawns more processes than the baseline
+    for scenario, result in results.items():
+        if scenario not in baseline:
+            continue
+        if result['wall_time'] > baseline[scenario]['wall_time'] * (1 + tolerance):
+            regressions.append('{}: wall time {:.2f}s -> {:.2f}s'.format(
+                scenario, baseline[scenario]['wall_time'], result['wall_time']))
+        if result['spawns'] > baseline[scenario]['spawns']:
+            regressions.append('{}: spawns {} -> {}'.format(
+                scenario, baseline[scenario]['spawns'], result['spawns']))
+
+    return regressions
+
+
+def main():
+    # Setup the argument parser
+    parser = argparse.ArgumentParser(description='Benchmark the orchestration overhead of dcgoss')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='scenarios to run, defaults to all scenarios ({})'.format(', '.join(sorted(SCENARIOS))))
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of times to run each scenario')
+    parser.add_argument('-o', '--output', type=str, help='write the results as JSON to a file')
+    parser.add_argument('-b', '--baseline', type=str, help='compare the results against a previous JSON output')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction by which the wall time may exceed the baseline')
+    parser.add_argument('--worker', nargs=2, help=argparse.SUPPRESS)
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(*args.worker)
+
+    # Validate that each of the requested scenarios exists
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error('unknown scenario: {}'.format(scenario))
+
+    results = {}
+    print('{:<18} {:>10} {:>10} {:>8} {:>10}'.format('Scenario', 'Median (s)', 'Max (s)', 'Spawns', 'RSS (MB)'))
+    for scenario in args.scenarios or sorted(SCENARIOS):
+        runs = [run_scenario(scenario) for _ in range(args.repeat)]
+        wall_times = [run['wall_time'] for run in runs]
+
+        # Summarize the repeated runs of the scenario
+        results[scenario] = {
+            'wall_time': statistics.median(wall_times),
+            'max_wall_time': max(wall_times),
+            'spawns': max(run['spawns'] for run in runs),
+            'peak_rss': max(run['peak_rss'] for run in runs),
+            'exit_codes': sorted({run['exit_code'] for run in runs}),
+        }
+        print('{:<18} {:>10.3f} {:>10.3f} {:>8} {:>10.1f}{}'.format(
+            scenario, results[scenario]['wall_time'], results[scenario]['max_wall_time'],
+            results[scenario]['spawns'], results[scenario]['peak_rss'] / 1024 / 1024,
+            '' if results[scenario]['exit_codes'] == [0] else '  (exit codes: {})'.format(
+                results[scenario]['exit_codes'])))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    # Fail when any scenario regressed against the baseline
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('Regression: {}'.format(regression))
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,16 +12,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+
+from tempfile import gettempdir
+
 from .dcgoss import DCGoss
 from .docker import Docker
+from .docker_api import DockerAPI
 from .docker_compose import DockerCompose
+from .docker_compose_plugin import DockerComposePlugin
+from .scheduler import RunScheduler
 
 __version__ = '0.1.4'
 
 
-def run(path, service, retry_timeout=300, retry_interval=0.2):
-    return DCGoss(path, Docker(), DockerCompose(path), retry_timeout, retry_interval).run(service)
+def _create_docker(docker_backend):
+    # Resolve the final docker backend
+    docker_backend = os.environ['GOSS_DOCKER_BACKEND'] if 'GOSS_DOCKER_BACKEND' in os.environ else docker_backend
+
+    if docker_backend == 'cli':
+        return Docker()
+    elif docker_backend == 'api':
+        return DockerAPI()
+    else:
+        raise ValueError('Unsupported docker backend: {}'.format(docker_backend))
+
+
+def _create_compose(path, project_name, compose_backend):
+    # Resolve the final docker-compose project name
+    project_name = os.environ['GOSS_PROJECT_NAME'] if 'GOSS_PROJECT_NAME' in os.environ else project_name
+
+    # Resolve the final docker-compose backend, preferring the compose plugin when it is installed
+    compose_backend = os.environ['GOSS_COMPOSE_BACKEND'] if 'GOSS_COMPOSE_BACKEND' in os.environ else compose_backend
+    if compose_backend == 'auto':
+        compose_backend = 'plugin' if DockerComposePlugin.is_available() else 'legacy'
+
+    if compose_backend == 'plugin':
+        return DockerComposePlugin(path, project_name)
+    elif compose_backend == 'legacy':
+        return DockerCompose(path, project_name)
+    else:
+        raise ValueError('Unsupported docker-compose backend: {}'.format(compose_backend))
+
+
+def _create_scheduler(max_concurrency, max_load, min_memory):
+    # Resolve the final scheduling limits
+    max_concurrency = int(os.environ['GOSS_MAX_CONCURRENCY'] if 'GOSS_MAX_CONCURRENCY' in os.environ
+                          else max_concurrency)
+    max_load = float(os.environ['GOSS_MAX_LOAD'] if 'GOSS_MAX_LOAD' in os.environ else max_load)
+    min_memory = float(os.environ['GOSS_MIN_MEMORY'] if 'GOSS_MIN_MEMORY' in os.environ else min_memory)
+
+    # Scheduling is disabled unless a concurrency limit has been set
+    if max_concurrency <= 0:
+        return None
+
+    # Resolve the final path to the shared slot table
+    slots_path = os.environ['GOSS_SLOTS_PATH'] if 'GOSS_SLOTS_PATH' in os.environ else '{}/dcgoss-slots'.format(
+        gettempdir())
+
+    return RunScheduler(slots_path, max_concurrency, max_load, min_memory)
+
+
+def _split_services(service):
+    # Accept a list of service names or a comma separated string, where none means all services
+    if isinstance(service, str):
+        return [name.strip() for name in service.split(',') if name.strip()]
+
+    return list(service or [])
+
+
+def _create(path, retry_timeout, retry_interval, docker_backend='cli', project_name=DockerCompose.DEFAULT_PROJECT_NAME,
+            compose_backend='auto', max_concurrency=0, max_load=0, min_memory=0, **options):
+    docker = _create_docker(docker_backend)
+    compose = _create_compose(path, project_name, compose_backend)
+    scheduler = _create_scheduler(max_concurrency, max_load, min_memory)
+    return DCGoss(path, docker, compose, retry_timeout, retry_interval, scheduler=scheduler, **options)
+
+
+def run(path, service, retry_timeout=300, retry_interval=0.2, **options):
+    return _create(path, retry_timeout, retry_interval, **options).run(*_split_services(service))
+
+
+def edit(path, service, retry_timeout=300, retry_interval=0.2, **options):
+    return _create(path, retry_timeout, retry_interval, **options).edit(service)
+
+
+def watch(path, service, retry_timeout=300, retry_interval=0.2, **options):
+    return _create(path, retry_timeout, retry_interval, **options).watch(service)
 
 
-def edit(path, service, retry_timeout=300, retry_interval=0.2):
-    return DCGoss(path, Docker(), DockerCompose(path), retry_timeout, retry_interval).edit(service)
+def stats(path, service, retry_timeout=300, retry_interval=0.2, **options):
+    # Only the run history is needed, so neither docker nor goss have to be present
+    return DCGoss.stats(DCGoss.get_history(path), service)
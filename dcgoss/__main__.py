@@ -18,28 +18,145 @@ import logging
 import dcgoss
 
 
-def main():
+def shard_count(value):
+    # Accept a positive number of shards or "auto", so that a service name is never taken for the count
+    if value.lower() != 'auto' and (not value.isdigit() or int(value) < 1):
+        raise argparse.ArgumentTypeError('invalid shard count: {!r}, use a positive number or "auto"'.format(value))
+
+    return value.lower()
+
+
+def parse_args(argv=None):
     # Setup the argument parser
     parser = argparse.ArgumentParser(prog='dcgoss', description='A docker-compose wrapper for goss')
-    parser.add_argument('action', type=str, choices=['run', 'edit'], help='action to execute')
-    parser.add_argument('service', type=str, help='docker-compose service name')
+    parser.add_argument('action', type=str, choices=['run', 'edit', 'watch', 'stats'], help='action to execute')
+    parser.add_argument('service', type=str, nargs='?',
+                        help='docker-compose service name, separate multiple names with commas to run them in parallel')
     parser.add_argument('path', type=str, nargs='?', default=os.getcwd(), help='docker-compose project path')
+    parser.add_argument('-a', '--all', action='store_true',
+                        help='run the tests for every service in the docker-compose project in parallel')
     parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + dcgoss.__version__)
     parser.add_argument('-t', '--retry-timeout', type=float, default=300,
                         help='time in seconds to make retry attempts before timing out '
                              '(equivalent to setting $GOSS_RETRY_TIMEOUT)')
     parser.add_argument('-i', '--retry-interval', type=float, default=0.2,
-                        help='time in seconds to wait between retry attempts '
+                        help='time in seconds to wait before the first retry attempt '
                              '(equivalent to setting $GOSS_SLEEP)')
+    parser.add_argument('--max-retry-interval', type=float, default=0,
+                        help='maximum time in seconds that the retry interval backs off to, defaulting to the initial '
+                             'retry interval (equivalent to setting $GOSS_MAX_SLEEP)')
+    parser.add_argument('--retry-backoff', type=float, default=2.0,
+                        help='factor by which the retry interval grows after each attempt '
+                             '(equivalent to setting $GOSS_BACKOFF)')
+    parser.add_argument('--retry-jitter', type=float, default=0.0,
+                        help='random fraction by which each retry interval is varied '
+                             '(equivalent to setting $GOSS_JITTER)')
+    parser.add_argument('--startup-timeout', type=float, default=0,
+                        help='time in seconds to wait for the service to start, limited by the retry timeout '
+                             '(equivalent to setting $GOSS_STARTUP_TIMEOUT)')
+    parser.add_argument('--wait-timeout', type=float, default=0,
+                        help='time in seconds to retry the goss wait tests, limited by the retry timeout '
+                             '(equivalent to setting $GOSS_WAIT_TIMEOUT)')
+    parser.add_argument('--validate-timeout', type=float, default=0,
+                        help='time in seconds to retry the goss tests, limited by the retry timeout '
+                             '(equivalent to setting $GOSS_VALIDATE_TIMEOUT)')
+    parser.add_argument('-b', '--docker-backend', type=str, choices=['cli', 'api'], default='cli',
+                        help='use the docker CLI or talk to the Docker Engine API over its unix socket '
+                             '(equivalent to setting $GOSS_DOCKER_BACKEND)')
+    parser.add_argument('--compose-backend', type=str, choices=['auto', 'plugin', 'legacy'], default='auto',
+                        help='use the docker compose plugin or the legacy docker-compose binary, preferring the plugin '
+                             'when it is installed (equivalent to setting $GOSS_COMPOSE_BACKEND)')
+    parser.add_argument('-m', '--mount', action='store_true',
+                        help='bind mount the goss binary and configuration read-only instead of copying them '
+                             'into the container, ignored when editing (equivalent to setting $GOSS_MOUNT)')
+    parser.add_argument('-p', '--project-name', type=str, default=dcgoss.DockerCompose.DEFAULT_PROJECT_NAME,
+                        help='docker-compose project name, use "auto" to generate a unique name for each run '
+                             '(equivalent to setting $GOSS_PROJECT_NAME)')
+    parser.add_argument('-c', '--max-concurrency', type=int, default=0,
+                        help='maximum number of runs that may execute at once on this host, where runs over the '
+                             'limit wait for a free slot (equivalent to setting $GOSS_MAX_CONCURRENCY)')
+    parser.add_argument('--max-load', type=float, default=0,
+                        help='wait while the 1 minute load average is above this value and other runs are in '
+                             'progress (equivalent to setting $GOSS_MAX_LOAD)')
+    parser.add_argument('--min-memory', type=float, default=0,
+                        help='wait while less than this many megabytes of memory are available and other runs are '
+                             'in progress (equivalent to setting $GOSS_MIN_MEMORY)')
+    parser.add_argument('-r', '--retry-failed', action='store_true',
+                        help='only retry the failing goss resources until they pass, then confirm with the full '
+                             'goss file (equivalent to setting $GOSS_RETRY_FAILED)')
+    parser.add_argument('-s', '--shards', type=shard_count, default='1', metavar='COUNT',
+                        help='split the goss file into this many shards that are validated concurrently, or "auto" '
+                             'to use the CPU quota of the container (equivalent to setting $GOSS_SHARDS)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='run the tests even when an identical run has already passed '
+                             '(equivalent to setting $GOSS_NO_CACHE)')
+    parser.add_argument('--trace', type=str, metavar='FILE',
+                        help='write a Chrome trace of the time spent in each phase and external command to a file and '
+                             'report a summary (equivalent to setting $GOSS_TRACE)')
+    parser.add_argument('--crash-loop-threshold', type=int, default=0, metavar='COUNT',
+                        help='fail once a service has crashed this many times, restarting exited containers during '
+                             'startup, where 0 disables crash loop detection (equivalent to setting '
+                             '$GOSS_CRASH_LOOP_THRESHOLD)')
+    parser.add_argument('--teardown', type=str, choices=['sync', 'fast', 'detach'], default='sync',
+                        help='stop and then remove the services (sync), remove them without a separate stop (fast) or '
+                             'remove them in the background after returning the result (detach) '
+                             '(equivalent to setting $GOSS_TEARDOWN)')
+    parser.add_argument('--stop-timeout', type=int, default=10, metavar='SECONDS',
+                        help='time that services are given to stop when removed by a fast or detached teardown '
+                             '(equivalent to setting $GOSS_STOP_TIMEOUT)')
+    parser.add_argument('--host-render', action='store_true',
+                        help='render the goss files on the host, caching the result, instead of within the container '
+                             'before each validation (equivalent to setting $GOSS_HOST_RENDER)')
+
+    # Parse the arguments, taking any positional arguments that follow the options as the service and path
+    args, extra = parser.parse_known_args(argv)
+    for value in extra:
+        if value.startswith('-') or args.path != parser.get_default('path'):
+            parser.error('unrecognized arguments: {}'.format(' '.join(extra)))
+        elif args.service is None:
+            args.service = value
+        else:
+            args.path = value
+
+    if args.all and args.action not in ['run', 'stats']:
+        parser.error('--all can only be used with the "run" and "stats" actions')
+
+    elif args.all:
+        # Accept the project path in place of the service name when running all services
+        if args.service and args.path == parser.get_default('path'):
+            args.path = args.service
 
-    # Parse the arguments
-    args = parser.parse_args()
+        args.service = None
+
+    elif not args.service and args.action != 'stats':
+        parser.error('a service name is required unless --all is specified')
+
+    elif args.action in ['edit', 'watch', 'stats'] and ',' in (args.service or ''):
+        parser.error('only a single service can be used with the "{}" action'.format(args.action))
+
+    return args
+
+
+def main():
+    args = parse_args()
 
     try:
         # Execute the requested action
-        return getattr(dcgoss, args.action)(args.path, args.service, args.retry_timeout, args.retry_interval)
+        return getattr(dcgoss, args.action)(args.path, args.service, args.retry_timeout, args.retry_interval,
+                                            docker_backend=args.docker_backend,
+                                            compose_backend=args.compose_backend, mount=args.mount,
+                                            project_name=args.project_name, max_concurrency=args.max_concurrency,
+                                            max_load=args.max_load, min_memory=args.min_memory,
+                                            retry_failed=args.retry_failed, shards=args.shards,
+                                            crash_loop_threshold=args.crash_loop_threshold,
+                                            max_retry_interval=args.max_retry_interval,
+                                            retry_backoff=args.retry_backoff, retry_jitter=args.retry_jitter,
+                                            startup_timeout=args.startup_timeout, wait_timeout=args.wait_timeout,
+                                            validate_timeout=args.validate_timeout, trace=args.trace,
+                                            no_cache=args.no_cache, teardown=args.teardown,
+                                            stop_timeout=args.stop_timeout, host_render=args.host_render)
 
-    except FileNotFoundError as e:
+    except (FileNotFoundError, PermissionError, ValueError) as e:
         logging.error(e)
         return 1
 
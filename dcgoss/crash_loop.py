@@ -0,0 +1,59 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+
+class CrashLoopDetector(object):
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.exits = {}
+        self.restart_counts = {}
+        self.baselines = {}
+        self.lock = threading.Lock()
+
+    def _observe(self, service, container_id, state):
+        with self.lock:
+            # Record each distinct exit of the containers for the service, ignoring containers that never exited
+            finished = state.get('FinishedAt') or ''
+            if finished and not finished.startswith('0001-'):
+                self.exits.setdefault(service, set()).add((container_id, finished))
+
+            # Record the restarts performed by the restart policy of the container
+            self.restart_counts[service] = max(self.restart_counts.get(service, 0), state.get('RestartCount') or 0)
+
+            # Return the number of crashes seen for the service since it was last considered stable
+            exits, restarts = self.baselines.get(service, (0, 0))
+            return max(len(self.exits.get(service, ())) - exits, self.restart_counts[service] - restarts)
+
+    def reset(self, service):
+        with self.lock:
+            # Only count the crashes that happen after the service was considered stable, keeping the exits seen so
+            # far to avoid counting them again
+            self.baselines[service] = (len(self.exits.get(service, ())), self.restart_counts.get(service, 0))
+
+    def check(self, service, container_id, state):
+        crashes = self._observe(service, container_id, state)
+
+        # Validate that the service has not crashed too many times
+        if self.threshold <= 0 or crashes < self.threshold:
+            return None
+
+        # Describe why the container is considered to be crash looping
+        diagnosis = 'Container crashed {} time(s) (exit code: {}, OOM killed: {})'.format(
+            crashes, state.get('ExitCode', 'unknown'), 'yes' if state.get('OOMKilled') else 'no')
+        if state.get('Error'):
+            diagnosis += ': {}'.format(state['Error'])
+
+        return diagnosis
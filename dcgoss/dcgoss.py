@@ -12,18 +12,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import dateutil.parser
+import hashlib
+import json
 import logging
 import os
 import platform
+import re
 import stat
 import subprocess
 import sys
+import tarfile
+import threading
 
-from shutil import copy, rmtree, which
-from tempfile import mkdtemp
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from shutil import copyfileobj, rmtree, which
+from tempfile import mkstemp
 from time import time, sleep
 
+from dcgoss.crash_loop import CrashLoopDetector
+from dcgoss.docker_api import DockerAPI
+from dcgoss.external_command import DEFAULT_MAX_CAPTURE, run_async
+from dcgoss.goss import Goss
+from dcgoss.goss_document import (count_resources, dump_document, filter_document, format_failures, format_summary,
+                                  get_failed_resources, load_document, merge_results, parse_results, split_document)
+from dcgoss.history import RunHistory
+from dcgoss.log_capture import LogCapture
+from dcgoss.project_snapshot import ProjectSnapshot
+from dcgoss.readiness import ReadinessWatcher
+from dcgoss.render_cache import RenderCache
+from dcgoss.result_cache import ResultCache
+from dcgoss.retry_policy import RetryPolicy
+from dcgoss.scheduler import ProjectLock
+from dcgoss.tracing import tracer
+
 
 # Define a custom log formatter
 class DCGossLogFormat(logging.Formatter):
@@ -63,9 +87,17 @@ root.addHandler(h_stderr)
 
 
 class DCGoss(object):
-    def __init__(self, path, docker, docker_compose, retry_timeout, retry_interval):
+    RENDERED_FILES = {'goss.yaml': 'goss_rendered.yaml', 'goss_wait.yaml': 'goss_wait_rendered.yaml'}
+    CONTAINER_RENDER_PATTERN = re.compile(rb'gossfile|\.Env\b|\b(getEnv|env|expandenv)\b')
+    MAX_ERROR_OUTPUT = 64 * 1024
+
+    def __init__(self, path, docker, docker_compose, retry_timeout, retry_interval, mount=False, scheduler=None,
+                 retry_failed=False, shards=1, crash_loop_threshold=0, max_retry_interval=0, retry_backoff=2.0,
+                 retry_jitter=0.0, startup_timeout=0, wait_timeout=0, validate_timeout=0, trace=None, no_cache=False,
+                 teardown='sync', stop_timeout=10, host_render=False):
         self.docker = docker
         self.compose = docker_compose
+        self.scheduler = scheduler
 
         # Resolve the final retry timeout value
         self.retry_timeout = float(self._get_envvar('GOSS_RETRY_TIMEOUT', retry_timeout))
@@ -73,6 +105,22 @@ class DCGoss(object):
         # Resolve the final retry interval value
         self.retry_interval = float(self._get_envvar('GOSS_SLEEP', retry_interval))
 
+        # Resolve the policy used to space out retries, which ramps up to the maximum interval with optional jitter
+        self.retry_policy = RetryPolicy(self.retry_interval,
+                                        float(self._get_envvar('GOSS_MAX_SLEEP', max_retry_interval)),
+                                        float(self._get_envvar('GOSS_BACKOFF', retry_backoff)),
+                                        float(self._get_envvar('GOSS_JITTER', retry_jitter)))
+
+        # Resolve the timeout of each phase, where 0 only limits the phase by the overall retry timeout
+        self.phase_timeouts = {
+            'startup': float(self._get_envvar('GOSS_STARTUP_TIMEOUT', startup_timeout)),
+            'wait': float(self._get_envvar('GOSS_WAIT_TIMEOUT', wait_timeout)),
+            'validate': float(self._get_envvar('GOSS_VALIDATE_TIMEOUT', validate_timeout)),
+        }
+
+        # Resolve the final interval at which goss files are checked for changes in watch mode
+        self.watch_interval = float(self._get_envvar('GOSS_WATCH_INTERVAL', 0.5))
+
         # Resolve the final initial startup delay value
         self.initial_startup = float(self._get_envvar('GOSS_INITIAL_STARTUP', 5))
 
@@ -91,8 +139,71 @@ class DCGoss(object):
         # Resolve the final path to an optional wait file
         self.goss_wait = self._get_envvar('GOSS_WAIT', '{}/goss_wait.yaml'.format(self.goss_files_path))
 
+        # Resolve whether the goss files are bind mounted instead of copied into the container
+        self.mount = mount or self._get_envvar('GOSS_MOUNT', '').lower() in ['1', 'true']
+
+        # Resolve whether only the failing goss resources are retried
+        self.retry_failed = retry_failed or self._get_envvar('GOSS_RETRY_FAILED', '').lower() in ['1', 'true']
+
+        # Resolve the number of shards the goss file is split into, where "auto" uses the container CPU quota
+        self.shards = str(self._get_envvar('GOSS_SHARDS', shards)).lower()
+        if self.shards != 'auto' and (not self.shards.isdigit() or int(self.shards) < 1):
+            raise ValueError('Invalid number of shards: {}'.format(self.shards))
+
+        # Resolve the number of crashes after which a service is considered to be crash looping, where 0 disables it
+        self.crash_loop = CrashLoopDetector(int(self._get_envvar('GOSS_CRASH_LOOP_THRESHOLD', crash_loop_threshold)))
+
+        # Resolve the number of log lines reported for a crash looping service
+        self.crash_loop_log_lines = int(self._get_envvar('GOSS_CRASH_LOOP_LOG_LINES', 20))
+
+        # Resolve the path where a trace of the time spent in each phase is written, enabling tracing when set
+        self.trace_path = self._get_envvar('GOSS_TRACE', trace)
+        if self.trace_path:
+            tracer.enable()
+
+        # Resolve how the services are torn down, where "fast" skips the separate stop and "detach" leaves the
+        # removal of the services to a background process
+        self.teardown = self._get_envvar('GOSS_TEARDOWN', teardown)
+        if self.teardown not in ['sync', 'fast', 'detach']:
+            raise ValueError('Unsupported teardown mode: {}'.format(self.teardown))
+
+        # Resolve the time in seconds that containers are given to stop when removed without a separate stop
+        self.stop_timeout = int(self._get_envvar('GOSS_STOP_TIMEOUT', stop_timeout))
+
         # Resolve the final path where logs will be written
-        self.log_path = self._get_envvar('GOSS_LOGS', '{}/.goss/logs'.format(self.goss_files_path))
+        self.logs_path = self._get_envvar('GOSS_LOGS', '{}/.goss/logs'.format(self.goss_files_path))
+        self.log_path = self.logs_path
+
+        # Keep the logs for each docker-compose project separate when a custom project name is used
+        if self.compose.project_name != self.compose.DEFAULT_PROJECT_NAME:
+            self.log_path = '{}/{}'.format(self.log_path, self.compose.project_name)
+
+        # Resolve the number of runs with a generated project name whose logs are kept, where 0 keeps all of them
+        self.keep_logs = int(self._get_envvar('GOSS_LOGS_KEEP', 10))
+
+        # Resolve whether container logs are saved, compressed and truncated
+        self.save_logs = not self._get_envvar('NO_LOGS', '').lower() in ['1', 'true']
+        self.compress_logs = self._get_envvar('GOSS_LOGS_COMPRESS', '').lower() in ['1', 'true']
+        self.max_log_size = int(self._get_envvar('GOSS_LOGS_MAX_SIZE', 0))
+
+        # Resolve the path of the data kept next to the logs, such as the run history database
+        data_path = self.get_data_path(path)
+        self.history = self.get_history(path)
+
+        # Resolve whether each run is recorded in the run history
+        self.save_history = not self._get_envvar('NO_HISTORY', '').lower() in ['1', 'true']
+
+        # Resolve whether passing runs are cached, so that identical runs can be skipped
+        self.use_cache = not (no_cache or self._get_envvar('GOSS_NO_CACHE', '').lower() in ['1', 'true'])
+
+        # Resolve the path of the result cache and how long and how much of it is kept
+        self.result_cache = ResultCache(self._get_envvar('GOSS_CACHE', '{}/cache'.format(data_path)),
+                                        float(self._get_envvar('GOSS_CACHE_MAX_AGE', 7 * 24 * 60 * 60)),
+                                        int(self._get_envvar('GOSS_CACHE_MAX_SIZE', 1024 * 1024)))
+
+        # Resolve the path of the locks held by each run until its project has been removed
+        self.project_lock = ProjectLock(self._get_envvar('GOSS_LOCKS', '{}/locks'.format(data_path)),
+                                        self.compose.project_name, os.path.abspath(self.compose.file))
 
         # Validate that the goss binary is present
         if not self.goss_bin:
@@ -102,67 +213,399 @@ class DCGoss(object):
         if not os.path.isfile(self.goss_file):
             raise FileNotFoundError('goss.yaml not present in {}'.format(self.goss_files_path))
 
+        # Resolve whether the goss files are rendered on the host instead of within the container
+        self.host_render = host_render or self._get_envvar('GOSS_HOST_RENDER', '').lower() in ['1', 'true']
+
+        # Validate that the goss binary can be executed on this host, which requires a Linux host
+        self.host_goss = None
+        if self.host_render and platform.system() != 'Linux':
+            logging.warning('Goss files can only be rendered on Linux hosts, rendering them in the container instead')
+            self.host_render = False
+        elif self.host_render:
+            self.host_goss = Goss(self.goss_bin)
+
+        # Resolve the path of the cache of goss files rendered on the host
+        self.render_cache = RenderCache(self._get_envvar('GOSS_RENDER_CACHE', '{}/render-cache'.format(data_path)),
+                                        float(self._get_envvar('GOSS_CACHE_MAX_AGE', 7 * 24 * 60 * 60)),
+                                        int(self._get_envvar('GOSS_RENDER_CACHE_MAX_SIZE', 16 * 1024 * 1024)))
+
         # Initialize application state variables
         self.start_time = 0
+        self.startup_steps = {}
+        self.startup_saved = 0
+        self.project_config = None
+        self.watcher = None
+        self.payload = None
+        self.goss_hash = None
+        self.rendered = {}
+        self.rendered_files = []
+        self.log_capture = None
+        self.capture_output = False
+        self.output_lock = threading.Lock()
+        self.output_continued = set()
+        self.snapshot = ProjectSnapshot(self.docker, self.compose.project_name)
         self.forced_shutdown = False
 
     @staticmethod
     def _get_envvar(name, default_value=None):
         return os.environ[name] if name in os.environ else default_value
 
-    def _startup(self, service):
+    @classmethod
+    def get_data_path(cls, path):
+        # Keep the data of dcgoss, such as the run history and caches, next to the logs
+        goss_files_path = cls._get_envvar('GOSS_FILES_PATH', path)
+        return os.path.dirname(os.path.abspath(cls._get_envvar('GOSS_LOGS', '{}/.goss/logs'.format(goss_files_path))))
+
+    @classmethod
+    def get_history(cls, path):
+        return RunHistory(cls._get_envvar('GOSS_HISTORY', '{}/history.db'.format(cls.get_data_path(path))))
+
+    def _startup(self, *services):
+        with tracer.span('startup'):
+            run_async(self._startup_async(*services))
+
+    async def _startup_async(self, *services):
         logging.info('Starting up...')
 
-        # Keep track of the start time
+        # Keep track of the start time and the duration of each startup step
         self.start_time = time()
+        self.startup_steps = {}
+
+        # Prepare the goss payload on a worker thread while the services are being started
+        loop = asyncio.get_event_loop()
+        payload = None
+        if not self.mount:
+            payload = loop.run_in_executor(None, self._time_step, 'payload', self._build_payload_traced)
+
+        # Pull any missing images of the services and their dependencies while previous resources are removed
+        pull = asyncio.ensure_future(self._time_step_async('pull', self._pull_missing_images_async(services)))
+
+        try:
+            # Remove any previously created test resources, skipping the removal when there are none
+            if await loop.run_in_executor(None, self._time_step, 'check', self._has_previous_resources):
+                logging.info('Removing any previous test resources...')
+                with tracer.span('down'):
+                    await self._time_step_async('down', self.compose.down_async())
+
+            # Subscribe to container events before any containers are started
+            self.watcher = ReadinessWatcher(self.docker, self.compose.project_name)
+            self.watcher.start()
+
+            # Mount the goss binary and configs into the containers as they are created
+            if self.mount:
+                logging.info('Mounting goss binary and configuration into {} container(s)...'.format(
+                    self._format_services(services)))
+                volumes = self._get_mount_volumes()
+                self._check_rendered()
+                self.compose.add_override({service: {'volumes': volumes} for service in services})
+
+            # Wait for the images so that they are pulled concurrently rather than one at a time by "up"
+            await pull
+
+            # Fail on goss files that cannot be rendered before any containers are started
+            if payload and self.host_render:
+                self.payload = await payload
+                self._check_rendered()
+
+            # Bring up the specified services and any dependencies
+            logging.info('Starting {} service(s) and any dependencies...'.format(self._format_services(services)))
+            try:
+                with tracer.span('up'):
+                    await self._time_step_async('up', self.compose.up_async(*services))
+            finally:
+                # Stream the container logs to disk, including those of any services that failed to start
+                self.snapshot.invalidate()
+                self._start_log_capture()
+
+        except Exception:
+            # Let the background work finish without hiding the error that stopped the startup
+            await asyncio.gather(pull, *([payload] if payload else []), return_exceptions=True)
+            raise
+
+        # Keep the prepared payload for copying into the containers
+        if payload:
+            self.payload = await payload
+
+        # Compare the time taken by the overlapping steps with the time they would take one after another
+        self.startup_saved = max(0, sum(self.startup_steps.values()) - (time() - self.start_time))
+
+    def _start_log_capture(self):
+        if not self.save_logs:
+            return
+
+        # Remove the logs of earlier runs with a generated project name before adding another directory
+        self._prune_logs()
+
+        try:
+            # Follow the logs of every service that has been created until the services are stopped
+            self.log_capture = LogCapture(self._follow_log, self.log_path, self.compress_logs, self.max_log_size)
+            self.log_capture.start(self.compose.get_services())
+        except Exception as e:
+            logging.error('Failed to save container logs: {}'.format(e))
+
+    def _prune_logs(self):
+        prefix = self.compose.get_generated_prefix(self.compose.path)
+        if self.keep_logs <= 0 or not self.compose.project_name.startswith(prefix):
+            return
+
+        try:
+            # Keep the most recent log directories of the project path, including the one of this run
+            paths = [os.path.join(self.logs_path, name) for name in os.listdir(self.logs_path)
+                     if name.startswith(prefix) and name != self.compose.project_name]
+            for path in sorted(paths, key=os.path.getmtime, reverse=True)[self.keep_logs - 1:]:
+                logging.debug('Removing container logs of an earlier run in {}'.format(path))
+                rmtree(path)
+
+        except OSError as e:
+            logging.debug('Failed to remove container logs of earlier runs: {}'.format(e))
+
+    def _follow_log(self, service):
+        # Follow the logs over the docker API when it is in use, which avoids a docker-compose process per service
+        if isinstance(self.docker, DockerAPI):
+            container_id = self.snapshot.get_container_id(service)
+            if container_id:
+                return self.docker.follow_logs(container_id)
+
+        return self.compose.follow_log(service)
+
+    def _time_step(self, name, function, *args):
+        start = time()
+        try:
+            return function(*args)
+        finally:
+            self.startup_steps[name] = time() - start
+
+    async def _time_step_async(self, name, coroutine):
+        start = time()
+        try:
+            return await coroutine
+        finally:
+            self.startup_steps[name] = time() - start
+
+    def _get_project_config(self):
+        # Resolve the docker-compose configuration once for both the result cache and the image pull
+        if self.project_config is None:
+            self.project_config = self.compose.get_config() or {}
+
+        return self.project_config
+
+    def _get_missing_image_services(self, services):
+        project_services = self._get_project_config().get('services') or {}
+
+        # Resolve the services and every service they depend on
+        pending, required = list(services), set()
+        while pending:
+            service = pending.pop()
+            if service not in required and service in project_services:
+                required.add(service)
+                pending.extend(project_services[service].get('depends_on') or [])
+
+        # Check for the images with a single call, only checking each image when any of them are missing
+        images = {service: project_services[service]['image'] for service in required
+                  if project_services[service].get('image')}
+        if not images or self.docker.get_image_ids(*images.values()) is not None:
+            return []
+
+        return sorted(service for service, image in images.items() if self.docker.get_image_ids(image) is None)
+
+    async def _pull_missing_images_async(self, services):
+        loop = asyncio.get_event_loop()
+
+        try:
+            # Pull the missing images concurrently, leaving any that cannot be pulled to be built by "up"
+            missing = await loop.run_in_executor(None, self._get_missing_image_services, services)
+            if missing:
+                logging.info('Pulling images for {} service(s)...'.format(self._format_services(missing)))
+                with tracer.span('pull'):
+                    await self.compose.pull_async(*missing)
+
+        except Exception as e:
+            logging.warning('Failed to pull images, leaving them to be pulled on startup: {}'.format(e))
+
+    def _has_resources(self, project_name):
+        label = 'label=com.docker.compose.project={}'.format(project_name)
+
+        try:
+            # Check for containers, networks or volumes that belong to the project
+            return (bool(self.docker.ps(label)) or bool(self.docker.get_network_ids(label)) or
+                    bool(self.docker.get_volume_names(label)))
+
+        except Exception as e:
+            logging.debug('Failed to list previous test resources: {}'.format(e))
+            return True
 
-        # Remove any previously created test resources
-        logging.info('Removing any previous test resources...')
-        self.compose.down()
+    def _remove_project(self, project_name, lock_fileno):
+        # Remove the project in the background, holding its lock until the removal has finished
+        self.compose.for_project(project_name).down_detached(self.stop_timeout, lock_fileno)
 
-        # Bring up the specified service and any dependencies
-        logging.info('Starting "{}" service and any dependencies...'.format(service))
-        self.compose.up(service)
+    def _has_previous_resources(self):
+        # Wait for an earlier run of this project, or its background removal, to release the project before touching
+        # any of its resources
+        self.project_lock.acquire(self._start_phase('startup').deadline)
 
-        # Wait until the service is running
+        try:
+            # Remove the projects of earlier runs that are no longer locked by their owner
+            self.project_lock.reap(self._has_resources, self._remove_project)
+        except Exception as e:
+            logging.warning('Failed to remove test resources left behind by previous runs: {}'.format(e))
+
+        return self._has_resources(self.compose.project_name)
+
+    def _prepare_service(self, service):
+        # Wait until the service is running and remains stable
         logging.info('Waiting for "{}" service container to start successfully...'.format(service))
+        with tracer.span('wait until stable', service=service):
+            self._wait_until_stable(service)
+
+        # Copy the goss binary and configs into the container
+        if not self.mount:
+            logging.info('Copying goss binary and configuration into "{}" service container...'.format(service))
+            with tracer.span('copy in', service=service):
+                self._copy_in(self.snapshot.get_container_id(service))
+
+    @staticmethod
+    def _format_services(services):
+        return ', '.join('"{}"'.format(service) for service in services)
+
+    def _get_mount_volumes(self):
+        # Mount the goss binary and configuration read-only
+        volumes = ['{}:/goss/goss:ro'.format(os.path.abspath(self.goss_bin)),
+                   '{}:/goss/goss.yaml:ro'.format(os.path.abspath(self.goss_file))]
+
+        # Include the variables file when present
+        if os.path.isfile(self.goss_vars):
+            volumes.append('{}:/goss/goss_vars.yaml:ro'.format(os.path.abspath(self.goss_vars)))
+
+        # Include the wait file when present
+        if os.path.isfile(self.goss_wait):
+            volumes.append('{}:/goss/goss_wait.yaml:ro'.format(os.path.abspath(self.goss_wait)))
+
+        # Include the goss files rendered on the host
+        if self.host_render:
+            for name, rendered in sorted(self._render_goss_files().items()):
+                volumes.append('{}:/goss/{}:ro'.format(self._write_rendered_file(rendered), name))
+
+        return volumes
+
+    def _start_phase(self, phase):
+        # Limit each phase by its own timeout as well as the overall retry timeout
+        return self.retry_policy.start(self.phase_timeouts[phase], self.start_time + self.retry_timeout)
+
+    def _wait_until_stable(self, service):
+        phase = self._start_phase('startup')
+
         while True:
             # Validate that the timeout has not been exceeded
-            if (time() - self.start_time) > self.retry_timeout:
+            if phase.is_expired():
                 raise TimeoutError('Timeout reached while waiting for initial container startup')
 
-            # Validate that the service is up
-            if not self._is_service_up(service):
-                sleep(1)
+            # Discard any events that were received before the current check
+            self.watcher.drain(service)
+
+            # Wait for the next container event when the service is not up yet, giving up when it keeps crashing
+            state = self._get_state(service)
+            self._check_crash_loop(service, state)
+            if not self._is_state_up(state):
+                # Restart containers that have exited when detecting crash loops, as no restart policy will bring
+                # them back up to crash again
+                if state.get('Status') == 'exited' and self.crash_loop.threshold > 0:
+                    logging.debug('Container for "{}" service exited, restarting it...'.format(service))
+                    self.compose.restart(service)
+                    self.snapshot.invalidate()
+                else:
+                    self._wait_for_event(service, self._get_event_timeout(phase))
+                continue
+
+            # Rely on the healthcheck of the container instead of the stability timer when one is defined
+            health = self._get_state_health(state)
+            if health == 'healthy':
+                logging.debug('Container for "{}" service is healthy'.format(service))
+                break
+            elif health == 'unhealthy':
+                raise RuntimeError('Container reported an unhealthy status')
+            elif health:
+                self._wait_for_event(service, self._get_event_timeout(phase))
+                continue
+
+            # Query the container ID and start time
+            container_id = self.snapshot.get_container_id(service)
+            started = self._get_state_start_time(state)
+
+            # Ensure the container remains up for an acceptable period of time, cancelling the timer on a restart
+            if self._is_restarted_within(service, container_id, self.initial_startup):
+                logging.debug('Container for "{}" service restarted, waiting for it to stabilize...'.format(service))
                 continue
 
-            # Query the container start time
-            started1 = self._get_start_time(service)
+            # Validate that the container has not restarted without us receiving an event
+            state = self._get_state(service)
+            if started == self._get_state_start_time(state) and self._is_state_up(state):
+                break
 
-            # Wait some time to ensure the container remains up for an acceptable period of time
-            sleep(self.initial_startup)
+        # Only count the crashes that happen once the service has stabilized towards the crash loop threshold
+        self.crash_loop.reset(service)
 
-            # Query the container start time again
-            started2 = self._get_start_time(service)
+    def _get_event_timeout(self, phase):
+        # Wait for as long as the phase allows while events are being received, only polling without them
+        return phase.remaining() if self.watcher.is_active() else phase.next_interval()
 
-            # Validate that the container has not restarted
-            if started1 == started2:
-                sleep(1)
-                if self._is_service_up(service):
-                    break
+    def _wait_for_event(self, service, timeout):
+        action, event_id = self.watcher.wait(service, timeout)
 
-        # Copy the goss binary and configs into the container
-        logging.info('Copying goss binary and configuration into container...')
-        self._copy_in(self.compose.get_container_id(service))
+        # Invalidate the cached container IDs when a container we don't know about has started
+        if action == 'start' and not self.snapshot.has_container(event_id):
+            self.snapshot.invalidate()
 
-    def _is_service_up(self, service):
-        # Query the container ID for the service
-        container_id = self.compose.get_container_id(service)
+        return action, event_id
 
-        # Query the current container state
-        container = self.docker.inspect(container_id) if container_id else {}
-        state = container['State'] if 'State' in container else {}
+    def _is_restarted_within(self, service, container_id, duration):
+        deadline = time() + duration
+
+        while True:
+            # Validate that the container has remained stable for the entire duration
+            remaining = deadline - time()
+            if remaining <= 0:
+                return False
+
+            # Validate that the container has not stopped or restarted
+            action, event_id = self._wait_for_event(service, remaining)
+            if action in ['die', 'restart'] and event_id in [container_id, None]:
+                return True
+
+    def _check_crash_loop(self, service, state):
+        diagnosis = self.crash_loop.check(service, self.snapshot.get_container_id(service), state)
+        if not diagnosis:
+            return
+
+        # Include the most recent log output of the service in the error
+        lines = self._get_recent_logs(service)
+        raise RuntimeError('{}, last {} log line(s):\n{}'.format(diagnosis, len(lines), '\n'.join(lines)))
+
+    def _get_recent_logs(self, service):
+        # Read only the most recent log lines over the docker API when it is in use
+        if isinstance(self.docker, DockerAPI):
+            return self.docker.logs(self.snapshot.get_container_id(service), self.crash_loop_log_lines,
+                                    self.MAX_ERROR_OUTPUT)
+
+        return self.compose.log(service, max_capture=self.MAX_ERROR_OUTPUT)[-self.crash_loop_log_lines:]
+
+    def _restart_if_down(self, service):
+        # Validate that the service is not crash looping before checking that it is still up
+        state = self._get_state(service)
+        self._check_crash_loop(service, state)
+        if self._is_state_up(state):
+            return False
 
+        # Restart the container when it is no longer running
+        self.compose.restart(service)
+        self.snapshot.invalidate()
+        return True
+
+    def _get_state(self, service):
+        # Refresh the state of every container in the project
+        return self.snapshot.refresh(service).get_state(service)
+
+    @staticmethod
+    def _is_state_up(state):
         # Validate that the container is running
         if 'Running' in state and not state['Running']:
             return False
@@ -174,142 +617,267 @@ class DCGoss(object):
         # Return true when all of the above checks have passed
         return True
 
-    def _get_start_time(self, service):
-        # Query the container ID for the service
-        container_id = self.compose.get_container_id(service)
-
-        # Query the current container state
-        container = self.docker.inspect(container_id) if container_id else {}
-        state = container['State'] if 'State' in container else {}
+    @staticmethod
+    def _get_state_health(state):
+        # Return the healthcheck status for the container, if it defines a healthcheck
+        return (state.get('Health') or {}).get('Status')
 
+    @staticmethod
+    def _get_state_start_time(state):
         # Return the start time for the container
         return dateutil.parser.isoparse(state['StartedAt']) if 'StartedAt' in state else None
 
-    def _copy_in(self, container_id):
-        temp_dir = mkdtemp()
-        logging.debug('Created temp directory: {}'.format(temp_dir))
+    @staticmethod
+    def _add_to_archive(tar, name, mode, path=None, data=None):
+        # Describe the target of any symlink rather than the link itself, which would dangle within the container
+        tarinfo = tar.gettarinfo(os.path.realpath(path), name) if path else tarfile.TarInfo(name)
+
+        # Apply the requested permissions and root ownership within the archive
+        tarinfo.mode = mode
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = 'root'
+
+        if path:
+            with open(path, 'rb') as f:
+                tar.addfile(tarinfo, f)
+        elif data is not None:
+            tarinfo.size = len(data)
+            tarinfo.mtime = time()
+            tar.addfile(tarinfo, BytesIO(data))
+        else:
+            tarinfo.type = tarfile.DIRTYPE
+            tarinfo.mtime = time()
+            tar.addfile(tarinfo)
 
-        try:
-            # Copy in the goss binary and configuration
-            logging.debug('Copying goss binary to temp directory: {}'.format(self.goss_bin))
-            copy(self.goss_bin, '{}/goss'.format(temp_dir))
-            logging.debug('Copying goss config to temp directory: {}'.format(self.goss_file))
-            copy(self.goss_file, '{}/goss.yaml'.format(temp_dir))
+    def _get_goss_files(self):
+        # Map the name of each goss configuration file within the container to its path
+        files = {'goss.yaml': self.goss_file}
 
-            # Copy in the goss variables file when present
-            if os.path.isfile(self.goss_vars):
-                logging.debug('Copying goss variables file to temp directory: {}'.format(self.goss_vars))
-                copy(self.goss_vars, '{}/goss_vars.yaml'.format(temp_dir))
-
-            # Copy in the goss wait file when present
-            if os.path.isfile(self.goss_wait):
-                logging.debug('Copying goss wait file to temp directory: {}'.format(self.goss_wait))
-                copy(self.goss_wait, '{}/goss_wait.yaml'.format(temp_dir))
+        # Include the variables file when present
+        if os.path.isfile(self.goss_vars):
+            files['goss_vars.yaml'] = self.goss_vars
 
-            # Define the file permissions we will apply
-            all_read_exec = stat.S_IRUSR | stat.S_IXUSR | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH
-            all_read_write = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP | stat.S_IROTH | stat.S_IWOTH
+        # Include the wait file when present
+        if os.path.isfile(self.goss_wait):
+            files['goss_wait.yaml'] = self.goss_wait
 
-            # Ensure the directory is readable and executable
-            logging.debug('Setting permissions on temp directory: {}'.format(oct(all_read_exec | all_read_write)))
-            os.chmod(temp_dir, all_read_exec | all_read_write)
+        return files
 
-            # Ensure the binary is readable and executable
-            logging.debug('Setting permissions on goss binary: {}'.format(oct(all_read_exec | all_read_write)))
-            os.chmod('{}/goss'.format(temp_dir), all_read_exec | all_read_write)
+    def _get_render_key(self, data):
+        # Identify the goss binary by its size and modification time rather than hashing its content
+        info = os.stat(self.goss_bin)
+        digest = hashlib.sha256('{}:{}'.format(info.st_size, info.st_mtime_ns).encode('utf-8'))
+        digest.update(b'\0' + data)
 
-            # Ensure the configuration file is readable and writable
-            logging.debug('Setting permissions on goss config: {}'.format(oct(all_read_write)))
-            os.chmod('{}/goss.yaml'.format(temp_dir), all_read_write)
+        # Include the variables file when present
+        if os.path.isfile(self.goss_vars):
+            with open(self.goss_vars, 'rb') as f:
+                digest.update(b'\0' + f.read())
 
-            # Ensure the variables file is readable and writable
-            if os.path.isfile(self.goss_vars):
-                logging.debug('Setting permissions on goss variables file: {}'.format(oct(all_read_write)))
-                os.chmod('{}/goss_vars.yaml'.format(temp_dir), all_read_write)
+        return digest.hexdigest()
 
-            # Ensure the wait file is readable and writable
-            if os.path.isfile(self.goss_wait):
-                logging.debug('Setting permissions on goss wait file: {}'.format(oct(all_read_write)))
-                os.chmod('{}/goss_wait.yaml'.format(temp_dir), all_read_write)
+    def _render_on_host(self, goss_file):
+        with open(goss_file, 'rb') as f:
+            data = f.read()
 
-            # Copy the temp directory into the container
-            self.docker.cp(temp_dir, '{}:/goss'.format(container_id))
+        # Templates that read the environment or include other files would resolve against the host
+        if self.CONTAINER_RENDER_PATTERN.search(data):
+            logging.debug('Rendering goss file within the container as it depends on the container: {}'.format(
+                goss_file))
+            return None
 
-        finally:
-            # Clean up all temporary files
-            logging.debug('Removing temp directory: {}'.format(temp_dir))
-            rmtree(temp_dir)
+        # Reuse a previous rendering of identical goss files
+        key = self._get_render_key(data)
+        rendered = self.render_cache.get(key)
+        if rendered is not None:
+            logging.debug('Using cached rendering of goss file: {}'.format(goss_file))
+            return rendered
 
-    def _copy_out(self, container_id):
-        temp_dir = mkdtemp()
-        logging.debug('Created temp directory: {}'.format(temp_dir))
+        # Render the goss file with the variables file when present
+        logging.debug('Rendering goss file on the host: {}'.format(goss_file))
+        with tracer.span('host render', file=os.path.basename(goss_file)):
+            rendered = self.host_goss.render(goss_file, self.goss_vars if os.path.isfile(self.goss_vars) else None)
 
         try:
-            # Copy the files from the container into the temp directory
-            logging.debug('Copying /goss directory from container ({}) into temp directory: {}'.format(container_id, temp_dir))
-            self.docker.cp('{}:/goss'.format(container_id), temp_dir)
+            self.render_cache.add(key, rendered)
+        except OSError as e:
+            logging.debug('Failed to cache rendered goss file: {}'.format(e))
 
-            # Restore the correct permissions for the goss file
-            mode = os.stat(self.goss_file).st_mode
-            logging.debug('Restoring correct permissions on goss config: {}'.format(oct(mode)))
-            os.chmod('{}/goss/goss.yaml'.format(temp_dir), mode)
+        return rendered
 
-            # Restore the correct permissions for the variables file
-            if os.path.isfile(self.goss_vars):
-                mode = os.stat(self.goss_vars).st_mode
-                logging.debug('Restoring correct permissions on goss variables file: {}'.format(oct(mode)))
-                os.chmod('{}/goss/goss_vars.yaml'.format(temp_dir), mode)
+    def _render_goss_files(self, names=None):
+        rendered = {}
 
-            # Restore the correct permissions for the wait file
-            if os.path.isfile(self.goss_wait):
-                mode = os.stat(self.goss_wait).st_mode
-                logging.debug('Restoring correct permissions on goss wait file: {}'.format(oct(mode)))
-                os.chmod('{}/goss/goss_wait.yaml'.format(temp_dir), mode)
+        # Render the goss and wait files, either of which changes when the variables file changes
+        for name, path in self._get_goss_files().items():
+            if name not in self.RENDERED_FILES:
+                continue
+            if names is not None and name not in names and 'goss_vars.yaml' not in names:
+                continue
+
+            try:
+                self.rendered[name] = (self._render_on_host(path), None)
+            except (RuntimeError, OSError) as e:
+                self.rendered[name] = (None, str(e))
+
+            if self.rendered[name][0] is not None:
+                rendered[self.RENDERED_FILES[name]] = self.rendered[name][0]
+
+        return rendered
+
+    def _write_rendered_file(self, rendered):
+        # Write the rendered file where it can be bind mounted for the duration of the run
+        fd, path = mkstemp(prefix='dcgoss-', suffix='.yaml')
+        with os.fdopen(fd, 'w') as f:
+            f.write(rendered)
+        os.chmod(path, 0o644)
+        self.rendered_files.append(path)
+
+        return path
+
+    def _remove_rendered_files(self):
+        for path in self.rendered_files:
+            logging.debug('Removing rendered goss file: {}'.format(path))
+            os.remove(path)
+
+        self.rendered_files = []
+
+    def _check_rendered(self):
+        # Report the first goss file that failed to render
+        for name in sorted(self.rendered):
+            if self.rendered[name][1]:
+                raise RuntimeError(self.rendered[name][1])
+
+    def _build_payload_traced(self):
+        with tracer.span('build payload'):
+            payload = self._build_payload()
+
+        # Hash the goss files for the run history while still off the main thread, unless the cache key already did
+        if self.goss_hash is None:
+            with tracer.span('hash payload'):
+                self.goss_hash = self._get_goss_hash()
+
+        return payload
+
+    def _build_payload(self, names=None):
+        # Define the file permissions we will apply
+        all_read_exec = stat.S_IRUSR | stat.S_IXUSR | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH
+        all_read_write = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP | stat.S_IROTH | stat.S_IWOTH
+
+        # Build the archive in memory with the permissions set in the tar headers
+        archive = BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            if names is None:
+                # Ensure the directory is readable and executable
+                logging.debug('Adding goss directory to archive: {}'.format(oct(all_read_exec | all_read_write)))
+                self._add_to_archive(tar, 'goss', all_read_exec | all_read_write)
+
+                # Ensure the binary is readable and executable
+                logging.debug('Adding goss binary to archive: {}'.format(self.goss_bin))
+                self._add_to_archive(tar, 'goss/goss', all_read_exec | all_read_write, path=self.goss_bin)
+
+            # Ensure the configuration files are readable and writable
+            for name, path in self._get_goss_files().items():
+                if names is None or name in names:
+                    logging.debug('Adding goss configuration to archive: {}'.format(path))
+                    self._add_to_archive(tar, 'goss/{}'.format(name), all_read_write, path=path)
+
+            # Include the goss files rendered on the host
+            if self.host_render:
+                for name, rendered in sorted(self._render_goss_files(names).items()):
+                    logging.debug('Adding rendered goss configuration to archive: {}'.format(name))
+                    self._add_to_archive(tar, 'goss/{}'.format(name), all_read_write, data=rendered.encode('utf-8'))
+
+        return archive.getvalue()
+
+    def _copy_in(self, container_id, names=None):
+        # Use the payload prepared during startup when copying in everything
+        if names is None and self.payload:
+            archive = self.payload
+        else:
+            archive = self._build_payload(names)
+
+        # Stream the archive into the container
+        self.docker.put_archive(container_id, '/', archive)
 
-            # Copy the goss file into place
+    def _copy_out(self, container_id):
+        # Fetch the /goss directory from the container as an archive
+        logging.debug('Copying /goss directory from container ({})'.format(container_id))
+        archive = self.docker.get_archive(container_id, '/goss')
+
+        with tarfile.open(fileobj=archive, mode='r') as tar:
+            # Write the goss file into place, which retains its original permissions
             logging.debug('Copying goss config back to its original location: {}'.format(self.goss_file))
-            copy('{}/goss/goss.yaml'.format(temp_dir), self.goss_file)
+            self._extract_from_archive(tar, 'goss/goss.yaml', self.goss_file)
 
-            # Copy the variables file into place
+            # Write the variables file into place
             if os.path.isfile(self.goss_vars):
                 logging.debug('Copying goss variables file back to its original location: {}'.format(self.goss_vars))
-                copy('{}/goss/goss_vars.yaml'.format(temp_dir), self.goss_vars)
+                self._extract_from_archive(tar, 'goss/goss_vars.yaml', self.goss_vars)
 
-            # Copy the wait file into place
+            # Write the wait file into place
             if os.path.isfile(self.goss_wait):
                 logging.debug('Copying goss wait file back to its original location: {}'.format(self.goss_wait))
-                copy('{}/goss/goss_wait.yaml'.format(temp_dir), self.goss_wait)
+                self._extract_from_archive(tar, 'goss/goss_wait.yaml', self.goss_wait)
 
-        finally:
-            # Clean up all temporary files
-            logging.debug('Removing temp directory: {}'.format(temp_dir))
-            rmtree(temp_dir)
+    @staticmethod
+    def _extract_from_archive(tar, name, path):
+        source = tar.extractfile(name)
+
+        # Overwrite the contents of the existing file in place
+        with open(path, 'wb') as target:
+            copyfileobj(source, target)
 
     def _shutdown(self):
         logging.info('Shutting down...')
 
         try:
-            if not self._get_envvar('NO_LOGS', '').lower() in ['1', 'true']:
-                # Create the log directory
-                if not os.path.exists(self.log_path):
-                    os.makedirs(self.log_path)
-
-                try:
-                    # Save the logs from each container
-                    logging.info('Saving container logs...')
-                    for svc in self.compose.get_services():
-                        with open('{}/{}.log'.format(self.log_path, svc), 'w') as log:
-                            log.writelines('\n'.join(self.compose.log(svc)))
-                except Exception as e:
-                    logging.error('Failed to save container logs: {}'.format(e))
-
-            # Stop all services
-            logging.info('Stopping services...')
-            self.compose.stop()
-
-            # Remove all services, networks and volumes
+            # Stop listening for container events
+            if self.watcher:
+                self.watcher.stop()
+
+            # Leave the services alone when the project was never locked, as another run or its removal still owns it
+            if not self.project_lock.is_held():
+                self.compose.remove_overrides()
+                self._remove_rendered_files()
+                return
+
+            if self.teardown == 'detach':
+                # Save the container logs received so far
+                if self.log_capture:
+                    logging.info('Saving container logs to {}...'.format(self.log_path))
+                    with tracer.span('save logs'):
+                        self.log_capture.stop(timeout=0)
+
+                # Remove all services, networks and volumes in the background, which doesn't need the override files
+                logging.info('Removing services and networks in the background...')
+                self.compose.remove_overrides()
+                self._remove_rendered_files()
+                self.compose.down_detached(self.stop_timeout, self.project_lock.get_fileno())
+                self.project_lock.release()
+                return
+
+            if self.teardown == 'sync':
+                # Stop all services
+                logging.info('Stopping services...')
+                with tracer.span('stop'):
+                    self.compose.stop()
+
+            # Remove all services, networks and volumes, stopping them first when they are still running
             logging.info('Removing services and networks...')
-            self.compose.down()
+            with tracer.span('down'):
+                self.compose.down(self.stop_timeout if self.teardown == 'fast' else None)
+            self.project_lock.release(remove=True)
+
+            # Wait for the container logs to be written, which completes once the services have stopped
+            if self.log_capture:
+                logging.info('Saving container logs to {}...'.format(self.log_path))
+                with tracer.span('save logs'):
+                    self.log_capture.stop()
+
+            # Remove any generated docker-compose override files and rendered goss files
+            self.compose.remove_overrides()
+            self._remove_rendered_files()
 
         except KeyboardInterrupt:
             if self.forced_shutdown:
@@ -320,7 +888,7 @@ class DCGoss(object):
             self.forced_shutdown = True
             self._shutdown()
 
-    def _run_goss_validate(self, service, goss_file, goss_args):
+    def _run_goss_validate(self, service, goss_file, goss_args, phase=None):
         # Prepare the global arguments to pass to goss
         goss_args_global = ['--gossfile=/goss/{}'.format(goss_file)]
 
@@ -331,11 +899,22 @@ class DCGoss(object):
         # Wait some time before executing any tests
         sleep(self.retry_interval)
 
-        # Attempt to render the goss file in order to validate it
-        logging.info('Validating goss file...')
-        render_exit, render_stdout, _ = self.compose.exec_pipe(service, '/goss/goss', *goss_args_global, 'render')
-        if render_exit > 0:
-            raise RuntimeError('Failed to parse goss configuration:\n{}'.format(render_stdout))
+        rendered, render_error = self.rendered.get(goss_file, (None, None))
+        if render_error:
+            raise RuntimeError(render_error)
+
+        if rendered is not None:
+            # Validate the goss file rendered on the host, which already has the variables applied
+            goss_args_global = ['--gossfile=/goss/{}'.format(self.RENDERED_FILES[goss_file])]
+            render_stdout = rendered
+        else:
+            # Attempt to render the goss file in order to validate it
+            logging.info('Validating goss file for "{}" service...'.format(service))
+            with tracer.span('render', service=service, file=goss_file):
+                render_exit, render_stdout, _ = self._exec_pipe(service, '/goss/goss', *goss_args_global, 'render',
+                                                                max_capture=None)
+            if render_exit > 0:
+                raise RuntimeError('Failed to parse goss configuration:\n{}'.format(render_stdout))
 
         # Determine whether or not to display colored output from goss
         if self._get_envvar('NO_COLOR', '').lower() in ['1', 'true']:
@@ -343,50 +922,484 @@ class DCGoss(object):
         else:
             goss_args.append('--color')
 
+        # Retry only the failing resources or validate the goss file in shards when requested
+        if (phase and self.retry_failed) or self.shards != '1':
+            return self._run_goss_validate_json(service, goss_args_global, goss_args, load_document(render_stdout),
+                                                phase)
+
         while True:
             # Validate that the timeout has not been exceeded
-            if (time() - self.start_time) > self.retry_timeout:
+            if phase and phase.is_expired():
                 raise TimeoutError('Timeout reached while waiting for all tests to pass')
 
             # Execute goss within the container
-            logging.info('Executing "goss validate"...')
-            goss_exit = self.compose.exec(service, '/goss/goss', *goss_args_global, 'validate', *goss_args)
+            logging.info('Executing "goss validate" for "{}" service...'.format(service))
+            with tracer.span('attempt', service=service):
+                goss_exit = self._exec_goss(service, *goss_args_global, 'validate', *goss_args)
 
-            # Break the loop if all tests passed successfully
+            # Break the loop if all tests passed successfully or only a single attempt is allowed
             if goss_exit > 0:
-                logging.info('Failed to execute all goss tests')
+                logging.info('Failed to execute all goss tests for "{}" service'.format(service))
+            if goss_exit == 0 or not phase:
+                return goss_exit
+
+            # Wait some time before running goss again
+            interval = phase.next_interval()
+            logging.info('Waiting {:.2f} second(s) before retrying...'.format(interval))
+            sleep(interval)
+
+            # Ensure the container is still up and running
+            self._restart_if_down(service)
+
+    @staticmethod
+    def _get_json_args(goss_args):
+        json_args = []
+
+        # Remove any output format or color options
+        args = iter(goss_args)
+        for arg in args:
+            if arg in ['-f', '--format']:
+                next(args, None)
+            elif not arg.startswith('--format=') and not arg.startswith('-f') and arg not in ['--color', '--no-color']:
+                json_args.append(arg)
+
+        return json_args + ['--format=json', '--no-color']
+
+    def _exec_goss_json(self, service, *args):
+        # Capture the results in full, as a truncated document can't be parsed
+        exit_code, stdout, stderr = self._exec_pipe(service, '/goss/goss', *args, max_capture=None)
+
+        try:
+            # Parse the results reported by goss
+            return parse_results(stdout)
+        except ValueError:
+            raise RuntimeError('Failed to parse goss results (exit code {}):\n{}{}'.format(exit_code, stdout, stderr))
+
+    def _copy_data_in(self, container_id, files):
+        all_read_write = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP | stat.S_IROTH | stat.S_IWOTH
+
+        # Build an archive that contains the generated files
+        archive = BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            for name, data in files.items():
+                logging.debug('Adding generated goss file to archive: {}'.format(name))
+                self._add_to_archive(tar, 'goss/{}'.format(name), all_read_write, data=data)
+
+        # Stream the archive into the container
+        self.docker.put_archive(container_id, '/', archive.getvalue())
+
+    def _get_shard_count(self, service, document):
+        if self.shards != 'auto':
+            count = int(self.shards)
+        else:
+            # Derive the number of shards from the CPU quota of the container, falling back to the host CPUs
+            host_config = self.snapshot.refresh(service).get_container(service).get('HostConfig') or {}
+            if host_config.get('NanoCpus'):
+                count = -(-host_config['NanoCpus'] // 10 ** 9)
+            elif host_config.get('CpuQuota', 0) > 0 and host_config.get('CpuPeriod', 0) > 0:
+                count = -(-host_config['CpuQuota'] // host_config['CpuPeriod'])
+            elif host_config.get('CpusetCpus'):
+                count = 0
+                for cpus in host_config['CpusetCpus'].split(','):
+                    first, _, last = cpus.partition('-')
+                    count += int(last or first) - int(first) + 1
             else:
-                break
+                count = os.cpu_count() or 1
+
+        # Never use more shards than there are resources
+        return max(1, min(count, count_resources(document)))
+
+    def _copy_shards_in(self, service, document):
+        # Skip sharding when the resources do not span multiple shards
+        shards = split_document(document, self._get_shard_count(service, document))
+        if len(shards) < 2:
+            return []
+
+        # Copy a goss file for each shard into the container
+        self._copy_data_in(self.snapshot.get_container_id(service), {
+            'goss_shard_{}.yaml'.format(index): dump_document(shard) for index, shard in enumerate(shards)
+        })
+
+        return [['--gossfile=/goss/goss_shard_{}.yaml'.format(index)] for index in range(len(shards))]
+
+    def _exec_goss_sharded(self, service, shards, json_args):
+        # Execute goss for each shard concurrently and merge the results into a single report
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            return merge_results(list(executor.map(
+                lambda shard_args: self._exec_goss_json(service, *shard_args, 'validate', *json_args), shards)))
+
+    def _run_goss_validate_json(self, service, goss_args_global, goss_args, document, phase=None):
+        json_args = self._get_json_args(goss_args)
+        retry_args = ['--gossfile=/goss/goss_retry.yaml']
+        shards = self._copy_shards_in(service, document)
+        retried = None
+        attempts = 0
+
+        while True:
+            # Validate that the timeout has not been exceeded
+            if phase and phase.is_expired():
+                raise TimeoutError('Timeout reached while waiting for all tests to pass')
+
+            # Execute goss within the container against the full goss file, its shards or only the failing resources
+            with tracer.span('attempt', service=service):
+                if retried:
+                    logging.info('Executing "goss validate" for failing resources of "{}" service...'.format(
+                        service))
+                    results = self._exec_goss_json(service, *retry_args, 'validate', *json_args)
+                elif shards:
+                    logging.info('Executing "goss validate" in {} shards for "{}" service...'.format(
+                        len(shards), service))
+                    results = self._exec_goss_sharded(service, shards, json_args)
+                else:
+                    logging.info('Executing "goss validate" for "{}" service...'.format(service))
+                    results = self._exec_goss_json(service, *goss_args_global, 'validate', *json_args)
+            attempts += 1
+
+            failed = get_failed_resources(results)
+            if not failed and not retried:
+                # The full goss file passed
+                logging.info('"{}" service: {}'.format(service, format_summary(results)))
+                return 0
+
+            if not failed:
+                # Confirm that the full goss file passes now that the failing resources have passed
+                logging.info('Previously failing resources passed after {} attempt(s), confirming with the full '
+                             'goss file...'.format(attempts))
+                if shards:
+                    confirmed = not get_failed_resources(self._exec_goss_sharded(service, shards, json_args))
+                else:
+                    confirmed = self._exec_goss(service, *goss_args_global, 'validate', *goss_args) == 0
+                if confirmed:
+                    logging.info('"{}" service: {} resource(s) were retried on their own before the full goss file '
+                                 'passed'.format(service, len(retried)))
+                    return 0
+
+                # Start over with the full goss file after the usual wait
+                logging.info('Failed to confirm all goss tests for "{}" service, retrying with the full goss '
+                             'file...'.format(service))
+                retried = None
+
+            else:
+                # Report the failed tests
+                logging.info('Failed to execute all goss tests for "{}" service: {}'.format(
+                    service, format_summary(results)))
+                for line in format_failures(results):
+                    logging.info('  {}'.format(line))
+
+                # Stop after a single attempt when retries are disabled
+                if not phase:
+                    return 1
+
+                # Copy a goss file that only contains the failing resources into the container when requested
+                reduced = filter_document(document, failed) if self.retry_failed else None
+                if reduced:
+                    retried = (retried or set()) | failed
+                    self._copy_data_in(self.snapshot.get_container_id(service),
+                                       {'goss_retry.yaml': dump_document(reduced)})
+                else:
+                    # Fall back to the full goss file when the failing resources are not retried on their own
+                    retried = None
 
             # Wait some time before running goss again
-            logging.info('Waiting {} second(s) before retrying...'.format(self.retry_interval))
-            sleep(self.retry_interval)
+            interval = phase.next_interval()
+            logging.info('Waiting {:.2f} second(s) before retrying...'.format(interval))
+            sleep(interval)
 
             # Ensure the container is still up and running
-            if not self._is_service_up(service):
-                self.compose.restart(service)
+            self._restart_if_down(service)
+
+    def _run_goss_tests(self, service, retry=True):
+        # Prepare the arguments to pass to 'goss validate' for the goss wait run
+        goss_args_wait = self._get_envvar('GOSS_WAIT_OPTS', '--retry-timeout=30s --sleep=1s').split()
+
+        # Prepare the arguments to pass to 'goss validate' for the main goss run
+        goss_args = self._get_envvar('GOSS_OPTS', '--format=documentation').split()
+
+        # Run the tests defined in the wait file
+        if os.path.isfile(self.goss_wait):
+            logging.info('Preparing to execute goss wait tests for "{}" service...'.format(service))
+            with tracer.span('wait tests', service=service):
+                wait_exit = self._run_goss_validate(service, 'goss_wait.yaml', goss_args_wait,
+                                                    self._start_phase('wait') if retry else None)
+            if wait_exit > 0:
+                return wait_exit
+
+        # Run the tests defined in the goss file
+        logging.info('Preparing to execute goss tests for "{}" service...'.format(service))
+        with tracer.span('tests', service=service):
+            return self._run_goss_validate(service, 'goss.yaml', goss_args,
+                                           self._start_phase('validate') if retry else None)
+
+    def _validate_service(self, service):
+        try:
+            # Wait for the service and copy in the goss binary and configs
+            self._prepare_service(service)
+
+            # Run the goss tests until they pass
+            return self._run_goss_tests(service)
+
+        except Exception as e:
+            logging.error('"{}" service: {}'.format(service, e))
+            return 1
+
+    def _validate_services(self, services):
+        # Validate a single service directly on the current thread
+        if len(services) == 1:
+            return {services[0]: self._validate_service(services[0])}
+
+        # Capture the goss output so that the output from each service is not interleaved
+        self.capture_output = True
 
-    def run(self, service):
+        # Validate each of the services concurrently
+        executor = ThreadPoolExecutor(max_workers=len(services))
         try:
-            # Start the service
-            self._startup(service)
+            futures = [(service, executor.submit(self._validate_service, service)) for service in services]
+            return {service: future.result() for service, future in futures}
+        finally:
+            executor.shutdown(wait=False)
 
-            # Prepare the arguments to pass to 'goss validate' for the goss wait run
-            goss_args_wait = self._get_envvar('GOSS_WAIT_OPTS', '--retry-timeout=30s --sleep=1s').split()
+    def _exec_pipe(self, service, *args, callback=None, max_capture=DEFAULT_MAX_CAPTURE):
+        # Execute over the docker API when it is in use, which avoids starting a docker-compose process each time
+        if isinstance(self.docker, DockerAPI):
+            return self.docker.exec_pipe(self.snapshot.get_container_id(service), *args, callback=callback,
+                                         max_capture=max_capture)
 
-            # Prepare the arguments to pass to 'goss validate' for the main goss run
-            goss_args = self._get_envvar('GOSS_OPTS', '--format=documentation').split()
+        return self.compose.exec_pipe(service, *args, callback=callback, max_capture=max_capture)
 
-            # Run the tests defined in the wait file
-            if os.path.isfile(self.goss_wait):
-                logging.info('Preparing to execute goss wait tests...')
-                self._run_goss_validate(service, 'goss_wait.yaml', goss_args_wait)
+    def _exec_goss(self, service, *args):
+        # Let goss write directly to the terminal when only a single service is validated
+        if not self.capture_output:
+            if not isinstance(self.docker, DockerAPI):
+                return self.compose.exec(service, '/goss/goss', *args)
+
+            # Stream the output to the terminal as it is received, only keeping the end of any errors
+            exit_code, _, stderr = self._exec_pipe(service, '/goss/goss', *args, callback=self._write_terminal,
+                                                   max_capture=self.MAX_ERROR_OUTPUT)
+            sys.stderr.write(stderr)
+            return exit_code
+
+        # Stream the output line by line with the service name as a prefix, only keeping the end of any errors
+        exit_code, _, stderr = self._exec_pipe(service, '/goss/goss', *args,
+                                               callback=lambda line: self._write_output(service, line),
+                                               max_capture=self.MAX_ERROR_OUTPUT)
+        for line in stderr.splitlines(True):
+            self._write_output(service, line)
+
+        return exit_code
+
+    @staticmethod
+    def _write_terminal(line):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+    def _write_output(self, service, line):
+        with self.output_lock:
+            # Only prefix the start of each line, as long lines are received in several chunks
+            if service in self.output_continued:
+                sys.stdout.write(line)
+            else:
+                sys.stdout.write('{} | {}'.format(service, line))
+            sys.stdout.flush()
+
+            if line.endswith('\n'):
+                self.output_continued.discard(service)
+            else:
+                self.output_continued.add(service)
+
+    def _acquire_slot(self):
+        # Wait for a free run slot on this host
+        if self.scheduler:
+            with tracer.span('queue'):
+                wait_time = self.scheduler.acquire()
+            if wait_time >= 1:
+                logging.info('Waited {:.1f} second(s) for a free run slot'.format(wait_time))
+
+    def _release_slot(self):
+        # Give the run slot back to other runs and report the time spent on each part of the run
+        if self.scheduler:
+            self.scheduler.release()
+            logging.info('Test time: {:.1f} second(s), queue time: {:.1f} second(s)'.format(
+                time() - self.start_time if self.start_time else 0, self.scheduler.wait_time))
+
+    def _write_trace(self):
+        if not self.trace_path:
+            return
+
+        try:
+            # Write the recorded spans and report where the time was spent
+            tracer.write(self.trace_path)
+            logging.info('Trace written to {}:'.format(self.trace_path))
+            for line in tracer.format_summary():
+                logging.info('  {}'.format(line))
+        except OSError as e:
+            logging.error('Failed to write trace: {}'.format(e))
+
+    def _get_goss_hash(self):
+        digest = hashlib.sha256()
+
+        # Hash the name and content of each goss configuration file
+        for name, path in sorted(self._get_goss_files().items()):
+            digest.update(name.encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+
+        return digest.hexdigest()
+
+    def _get_file_hash(self, path):
+        digest = hashlib.sha256()
+
+        # Hash the file in chunks so that large binaries are never read into memory at once
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def _get_cache_key(self, services):
+        # Resolve the configuration and images of the project without starting it
+        config = dict(self._get_project_config())
+        project_services = config.get('services') or {}
+        images = [project_services[name].get('image') for name in sorted(project_services)]
+        if not images or not all(images):
+            logging.debug('Results are not cached for services without an image')
+            return None
+
+        # The content of bind mounted host paths can change between runs without changing the configuration
+        if any(self._has_bind_mount(project_services[name]) for name in project_services):
+            logging.debug('Results are not cached for services with bind mounted host paths')
+            return None
+
+        # Resolve the images to the IDs of the images present locally
+        image_ids = self.docker.get_image_ids(*images)
+        if not image_ids:
+            logging.debug('Results are not cached for images that are not present locally')
+            return None
+
+        # Hash the goss files once for both the cache key and the run history
+        self.goss_hash = self._get_goss_hash()
+
+        # Ignore the project name, which changes between runs when it is generated, and the resource names it prefixes
+        config.pop('name', None)
+        config = json.dumps(config, sort_keys=True).replace('"{}_'.format(self.compose.project_name), '"')
+
+        # Hash everything that can influence the outcome of the run
+        return hashlib.sha256(json.dumps({
+            'services': sorted(services or project_services),
+            'image_ids': image_ids,
+            'config': config,
+            'goss': self.goss_hash,
+            'goss_bin': self._get_file_hash(self.goss_bin),
+            'goss_opts': [self._get_envvar('GOSS_OPTS', ''), self._get_envvar('GOSS_WAIT_OPTS', '')],
+        }, sort_keys=True).encode('utf-8')).hexdigest()
 
-            # Run the tests defined in the goss file
-            logging.info('Preparing to execute goss tests...')
-            self._run_goss_validate(service, 'goss.yaml', goss_args)
+    @staticmethod
+    def _has_bind_mount(service_config):
+        for volume in service_config.get('volumes') or []:
+            # Bind mounts have the bind type in the long syntax and a host path as the source in the short syntax
+            if isinstance(volume, dict) and volume.get('type') == 'bind':
+                return True
+            elif isinstance(volume, str) and re.match(r'(?:[A-Za-z]:)?[./\\~][^:]*:', volume):
+                return True
+
+        return False
+
+    def _get_image_ids(self, services):
+        try:
+            # Query the image of each service container with a single refresh
+            self.snapshot.refresh()
+            return {service: self.snapshot.get_container(service).get('Image') for service in services}
+        except Exception as e:
+            logging.debug('Failed to query image IDs: {}'.format(e))
+            return {}
+
+    def _record_history(self, services, results, image_ids):
+        if not self.save_history or not services:
+            return
+
+        try:
+            goss_hash = self.goss_hash or self._get_goss_hash()
+            for service in services:
+                phases = tracer.get_phase_durations(service)
+
+                # Record the outcome of the service along with the time spent in each phase
+                self.history.record(
+                    started=self.start_time or time(), project=self.compose.project_name, service=service,
+                    outcome='error' if service not in results else 'passed' if results[service] == 0 else 'failed',
+                    duration=time() - self.start_time if self.start_time else None,
+                    startup=sum(phases.get(name, (0, 0))[1] for name in ['startup', 'wait until stable', 'copy in']),
+                    tests=sum(phases.get(name, (0, 0))[1] for name in ['wait tests', 'tests']),
+                    attempts=phases.get('attempt', (0, 0))[0], image_id=image_ids.get(service),
+                    goss_hash=goss_hash, phases={name: total for name, (_, total) in phases.items()})
+        except Exception as e:
+            logging.error('Failed to record run history: {}'.format(e))
+
+    def _get_cached_result(self, services):
+        try:
+            # Look up a previous passing run with identical images, configuration and goss files
+            cache_key = self._get_cache_key(services)
+            return cache_key, self.result_cache.get(cache_key) if cache_key else None
+        except Exception as e:
+            logging.debug('Failed to determine the result cache key: {}'.format(e))
+            return None, None
+
+    def _add_cached_result(self, cache_key, services):
+        try:
+            self.result_cache.add(cache_key, {'time': time(), 'services': services})
+        except OSError as e:
+            logging.error('Failed to cache the test results: {}'.format(e))
+
+    def run(self, *services):
+        # Skip the run entirely when an identical run has already passed
+        cache_key, cached = self._get_cached_result(services) if self.use_cache else (None, None)
+        if cached:
+            logging.info('Skipping tests, an identical run passed {:.0f} second(s) ago (use --no-cache to force a '
+                         'run)'.format(time() - cached['time']))
+            self._write_trace()
+            return 0
+
+        # Keep track of the time spent in each phase for the run history
+        if self.save_history:
+            tracer.enable()
+
+        self._acquire_slot()
+        results = {}
+        image_ids = {}
+        interrupted = False
+
+        try:
+            # Validate every service in the project when none have been specified
+            services = list(services) or self.compose.get_config_services()
+            if not services:
+                raise RuntimeError('No services defined in the docker-compose project')
+
+            # Start the services
+            self._startup(*services)
+
+            # Validate the services
+            results = self._validate_services(services)
+            image_ids = self._get_image_ids(services)
+
+            # Report the outcome for each service
+            if len(services) > 1:
+                logging.info('Summary:')
+                for service in services:
+                    logging.info('  {}: {}'.format(service, 'passed' if results[service] == 0 else 'failed'))
+
+            # Report the time saved by overlapping the startup steps
+            if self.startup_saved >= 0.01:
+                logging.info('Overlapping image pulls, payload preparation and startup saved {:.2f} second(s)'.format(
+                    self.startup_saved))
+
+            # Return a failure when any of the services failed
+            if any(results.values()):
+                return 1
 
             logging.info('All tests successfully executed.')
+
+            # Remember that this run passed
+            if cache_key:
+                self._add_cached_result(cache_key, services)
+
             return 0
 
         except Exception as e:
@@ -394,18 +1407,58 @@ class DCGoss(object):
             return 1
 
         except KeyboardInterrupt:
+            interrupted = True
             return 2
 
         finally:
             self._shutdown()
+            self._release_slot()
+            if not interrupted:
+                self._record_history(services, results, image_ids)
+            self._write_trace()
+
+    @staticmethod
+    def stats(history, service=None):
+        stats = history.get_stats(service)
+        if not stats:
+            logging.info('No runs have been recorded in {}'.format(history.path))
+            return 0
+
+        for name, service_stats in stats.items():
+            # Report the outcomes and percentiles for each service
+            logging.info('"{}" service: {} run(s), {} passed{}'.format(
+                name, service_stats['runs'], service_stats['passed'], ', flaky' if service_stats['flaky'] else ''))
+            for metric, (p50, p95) in sorted(service_stats['metrics'].items()):
+                if p50 is not None:
+                    value_format = '{:.0f}' if metric == 'attempts' else '{:.1f}s'
+                    logging.info('  {:<9} p50: {:<8} p95: {}'.format(
+                        metric, value_format.format(p50), value_format.format(p95)))
+
+            # Flag any metrics that regressed against the rolling baseline
+            for metric, baseline, recent in service_stats['regressions']:
+                logging.warning('  {} regressed from {:.1f}s to {:.1f}s against the rolling baseline'.format(
+                    metric, baseline, recent))
+
+        return 0
 
     def edit(self, service):
+        # Editing requires a writable copy of the goss files within the container
+        if self.mount:
+            logging.warning('Bind mounted goss files are read-only, copying them into the container instead...')
+            self.mount = False
+
+        # Goss files are not validated while editing, so any that cannot be rendered can still be fixed
+        self.host_render = False
+
+        self._acquire_slot()
+
         try:
             # Start the service
             self._startup(service)
+            self._prepare_service(service)
 
             # Query the container ID for the service
-            container_id = self.compose.get_container_id(service)
+            container_id = self.snapshot.refresh(service).get_container_id(service)
 
             # Prepare the command to execute
             cmd = self.compose.prepare_cmd('exec', service, 'sh', '-c', 'cd /goss; PATH="/goss:$PATH" exec sh')
@@ -414,11 +1467,13 @@ class DCGoss(object):
             logging.info('Starting shell within "{}" service container ({})...'.format(service, container_id[0:12]))
             logging.info('Use "goss add" or "goss autoadd" to add tests and type "exit" when ready to save.')
             logging.debug('Executing interactive command: {}'.format(cmd))
-            subprocess.call(cmd)
+            with tracer.span('shell', service=service):
+                subprocess.call(cmd)
 
             # Copy the modified files out of the container
             logging.debug('Copying updated goss configurations from container...')
-            self._copy_out(container_id)
+            with tracer.span('copy out', service=service):
+                self._copy_out(container_id)
 
             return 0
 
@@ -431,3 +1486,79 @@ class DCGoss(object):
 
         finally:
             self._shutdown()
+            self._release_slot()
+            self._write_trace()
+
+    def _get_goss_file_states(self):
+        states = {}
+
+        # Track the modification time and size of each goss configuration file
+        for name, path in [('goss.yaml', self.goss_file), ('goss_vars.yaml', self.goss_vars),
+                           ('goss_wait.yaml', self.goss_wait)]:
+            try:
+                info = os.stat(path)
+                states[name] = (info.st_mtime_ns, info.st_size)
+            except OSError:
+                states[name] = None
+
+        return states
+
+    def _run_watch_iteration(self, service):
+        # Restart the service and copy everything in again when the container is no longer running
+        if self._restart_if_down(service):
+            logging.warning('"{}" service container was not running and has been restarted'.format(service))
+            self.start_time = time()
+            self._prepare_service(service)
+
+        try:
+            # Run the goss tests a single time
+            if self._run_goss_tests(service, retry=False) == 0:
+                logging.info('All tests successfully executed.')
+        except RuntimeError as e:
+            logging.error(e)
+
+    def watch(self, service):
+        # Edited files are copied into the container so that editors replacing files are supported
+        if self.mount:
+            logging.warning('Goss files are copied into the container when watching for changes...')
+            self.mount = False
+
+        self._acquire_slot()
+
+        try:
+            # Start the service and run the tests for the first time
+            self._startup(service)
+            self._prepare_service(service)
+            states = self._get_goss_file_states()
+            self._run_watch_iteration(service)
+
+            logging.info('Watching goss files for changes, press Ctrl+C to stop...')
+            while True:
+                sleep(self.watch_interval)
+
+                # Determine which of the goss files have changed
+                current = self._get_goss_file_states()
+                changed = [name for name in current if current[name] != states[name] and current[name]]
+                states = current
+
+                if not changed:
+                    continue
+
+                # Copy only the changed files into the container and run the tests again
+                logging.info('Detected changes to {}, running tests again...'.format(', '.join(changed)))
+                self.payload = None
+                self.goss_hash = None
+                self._copy_in(self.snapshot.get_container_id(service), changed)
+                self._run_watch_iteration(service)
+
+        except Exception as e:
+            logging.error(e)
+            return 1
+
+        except KeyboardInterrupt:
+            return 0
+
+        finally:
+            self._shutdown()
+            self._release_slot()
+            self._write_trace()
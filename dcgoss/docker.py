@@ -13,11 +13,13 @@
 # limitations under the License.
 
 import os
+import sys
 
+from io import BytesIO
 from json import loads
 from shutil import which
 
-from dcgoss.external_command import ExternalCommand
+from dcgoss.external_command import ExternalCommand, run_async
 
 
 class Docker(ExternalCommand):
@@ -32,14 +34,71 @@ class Docker(ExternalCommand):
         if not os.access(self.binary, os.X_OK):
             raise PermissionError('docker binary is not executable')
 
-    def cp(self, source, target):
-        exit_code = self._execute_cmd('cp', source, target)
+    def put_archive(self, container_id, path, archive):
+        exit_code, _, stderr = self._execute_cmd_bytes('cp', '-', '{}:{}'.format(container_id, path),
+                                                       input_data=archive)
 
         if exit_code > 0:
-            raise RuntimeError('docker cp failed with exit code: {}'.format(exit_code))
+            raise RuntimeError('docker cp failed with exit code: {}\n{}'.format(
+                exit_code, stderr.decode(sys.getdefaultencoding(), 'replace').strip()))
+
+    def get_archive(self, container_id, path):
+        exit_code, stdout, stderr = self._execute_cmd_bytes('cp', '{}:{}'.format(container_id, path), '-')
+
+        if exit_code > 0:
+            raise RuntimeError('docker cp failed with exit code: {}\n{}'.format(
+                exit_code, stderr.decode(sys.getdefaultencoding(), 'replace').strip()))
+
+        # Return the tar archive as a file object
+        return BytesIO(stdout)
+
+    def ps(self, *filters, labels=()):
+        args = ['ps', '--all', '--no-trunc']
+
+        # Apply each of the requested filters
+        for ps_filter in filters:
+            args.extend(['--filter', ps_filter])
+
+        # Output the container ID followed by each of the requested labels
+        args.extend(['--format', '\t'.join(['{{.ID}}'] + ['{{{{.Label "{}"}}}}'.format(label) for label in labels])])
+
+        cmd = self._execute_cmd_pipe(*args, max_capture=None)
+
+        # Return the ID and requested labels for each container
+        containers = []
+        for line in cmd[1].splitlines() if cmd[0] == 0 else []:
+            values = line.split('\t')
+            containers.append({'Id': values[0], 'Labels': dict(zip(labels, values[1:]))})
+
+        return containers
+
+    def _ls(self, resource, *filters):
+        args = [resource, 'ls', '--quiet']
+
+        # Apply each of the requested filters
+        for ls_filter in filters:
+            args.extend(['--filter', ls_filter])
+
+        cmd = self._execute_cmd_pipe(*args, max_capture=None)
+
+        # Validate that the resources could be listed
+        if cmd[0] > 0:
+            raise RuntimeError('docker {} ls failed with exit code: {}'.format(resource, cmd[0]))
+
+        return cmd[1].split()
+
+    def get_network_ids(self, *filters):
+        return self._ls('network', *filters)
+
+    def get_volume_names(self, *filters):
+        return self._ls('volume', *filters)
 
     def inspect(self, target):
-        cmd = self._execute_cmd_pipe('inspect', target)
+        return run_async(self.inspect_async(target))
+
+    async def inspect_async(self, target):
+        # Capture the output in full, as a truncated document can't be parsed
+        cmd = await self._execute_cmd_pipe_async('inspect', target, max_capture=None)
 
         try:
             # Parse the JSON data received
@@ -47,3 +106,28 @@ class Docker(ExternalCommand):
             return result[0] if result else {}
         except ValueError:
             return {}
+
+    def inspect_many(self, *targets):
+        cmd = self._execute_cmd_pipe('inspect', *targets, max_capture=None)
+
+        try:
+            # Parse the JSON data received, which includes every target that still exists
+            return loads(cmd[1]) or []
+        except ValueError:
+            return []
+
+    def get_image_ids(self, *images):
+        cmd = self._execute_cmd_pipe('image', 'inspect', '--format', '{{.Id}}', *images, max_capture=None)
+
+        # Return the ID of each image, or nothing when any of the images are not present locally
+        return cmd[1].split() if cmd[0] == 0 else None
+
+    def events(self, *filters):
+        args = ['events', '--format', '{{json .}}']
+
+        # Apply each of the requested event filters
+        for event_filter in filters:
+            args.extend(['--filter', event_filter])
+
+        # Return the running process so that the caller can consume the event stream
+        return self._open_cmd_stream(*args)
@@ -0,0 +1,358 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import codecs
+import io
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+
+from http.client import HTTPConnection, HTTPException
+from io import BytesIO
+from json import dumps, loads
+from time import time
+from urllib.parse import quote, urlencode
+
+from dcgoss.external_command import DEFAULT_MAX_CAPTURE, READ_CHUNK_SIZE, CaptureBuffer, decode_lines
+from dcgoss.tracing import tracer
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, socket_path, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        # Connect to the unix socket instead of a TCP address
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DockerEventStream(object):
+    def __init__(self, connection, response):
+        self.connection = connection
+        self.stdout = self._read_lines(connection, response)
+
+    @staticmethod
+    def _read_lines(connection, response):
+        try:
+            for line in response:
+                yield line
+        except (OSError, ValueError, HTTPException):
+            # The stream has been terminated
+            return
+        finally:
+            connection.close()
+
+    def terminate(self):
+        # Unblock any pending reads by shutting down the socket
+        try:
+            self.connection.sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
+
+    def wait(self):
+        # The connection is closed by the reader once the stream has ended
+        pass
+
+
+class DockerFrameReader(io.RawIOBase):
+    def __init__(self, frames):
+        self.frames = frames
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Read the next frame once the previous one has been consumed, ending the stream after the last frame
+        while not self.pending:
+            self.pending = next(self.frames, (None, None))[1]
+            if self.pending is None:
+                self.pending = b''
+                return 0
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class DockerLogStream(DockerEventStream):
+    def __init__(self, connection, response):
+        self.connection = connection
+
+        # Expose the container output as a buffered stream, combining stdout and stderr
+        self.stdout = io.BufferedReader(DockerFrameReader(self._read_frames(connection, response)))
+
+    @staticmethod
+    def _read_frames(connection, response):
+        try:
+            yield from DockerAPI._read_frames(response)
+        except (OSError, ValueError, HTTPException):
+            # The stream has been terminated
+            return
+        finally:
+            connection.close()
+
+
+class DockerAPI(object):
+    # Methods that can be sent again without applying them twice
+    IDEMPOTENT_METHODS = ['GET', 'HEAD', 'PUT', 'DELETE']
+
+    def __init__(self, socket_path=None):
+        self.socket_path = socket_path or self._get_socket_path()
+        self.local = threading.local()
+
+        # Validate that the docker socket is present
+        if not os.path.exists(self.socket_path):
+            raise FileNotFoundError('docker socket is not present at {}'.format(self.socket_path))
+
+    @staticmethod
+    def _get_socket_path():
+        host = os.environ['DOCKER_HOST'] if 'DOCKER_HOST' in os.environ else ''
+        return host[len('unix://'):] if host.startswith('unix://') else '/var/run/docker.sock'
+
+    @staticmethod
+    def _prepare_filters(filters):
+        # Convert "name=value" filter expressions into the format expected by the API
+        prepared = {}
+        for api_filter in filters:
+            name, _, value = api_filter.partition('=')
+            prepared.setdefault(name, []).append(value)
+
+        return dumps(prepared)
+
+    def _get_connection(self):
+        # Keep a persistent connection per thread so that requests can be made concurrently
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = UnixHTTPConnection(self.socket_path)
+
+        return self.local.connection
+
+    def _send_request(self, method, url, body=None, headers=None):
+        connection = self._get_connection()
+
+        logging.debug('Executing docker API request: {} {}'.format(method, url))
+        try:
+            connection.request(method, url, body=body, headers=headers or {})
+            return connection.getresponse()
+        except (ConnectionError, HTTPException):
+            # Reconnect once when the daemon has closed the keep-alive connection, unless the request may have been
+            # received and cannot safely be repeated
+            connection.close()
+            if method not in self.IDEMPOTENT_METHODS:
+                raise
+            connection.request(method, url, body=body, headers=headers or {})
+            return connection.getresponse()
+
+    def _request(self, method, path, params=None, body=None, headers=None):
+        url = '{}?{}'.format(path, urlencode(params)) if params else path
+        start_time = time()
+        response = self._send_request(method, url, body, headers)
+
+        # Read the full response so that the connection can be reused
+        data = response.read()
+        tracer.add_span('docker API {}'.format(method), 'api', start_time, time(), path=url, status=response.status)
+        return response.status, response.getheaders(), data
+
+    def _request_json(self, method, path, params=None, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        status, _, data = self._request(method, path, params, dumps(body) if body is not None else None, headers)
+
+        # Validate that the request succeeded
+        if status >= 400:
+            raise RuntimeError('docker API {} {} failed with status {}: {}'.format(
+                method, path, status, data.decode('utf-8', 'replace').strip()))
+
+        return loads(data.decode('utf-8')) if data else None
+
+    @staticmethod
+    def _read_exactly(response, size):
+        data = b''
+        while len(data) < size:
+            chunk = response.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+
+        return data
+
+    @staticmethod
+    def _read_frames(response):
+        header = DockerAPI._read_exactly(response, 8)
+
+        # Output from containers with a TTY is not multiplexed, so pass it on as stdout
+        if len(header) < 8 or header[0] not in [0, 1, 2] or header[1:4] != b'\x00\x00\x00':
+            if header:
+                yield 1, header
+            yield from ((1, chunk) for chunk in iter(lambda: response.read1(READ_CHUNK_SIZE), b''))
+            return
+
+        # Split the multiplexed stream into its stdout and stderr frames, reading each in bounded chunks
+        while len(header) == 8:
+            stream, size = struct.unpack('>BxxxL', header)
+            while size > 0:
+                chunk = response.read(min(size, READ_CHUNK_SIZE))
+                if not chunk:
+                    return
+                size -= len(chunk)
+                yield stream, chunk
+
+            header = DockerAPI._read_exactly(response, 8)
+
+    def put_archive(self, container_id, path, archive):
+        status, _, data = self._request('PUT', '/containers/{}/archive'.format(container_id), {'path': path},
+                                        archive, {'Content-Type': 'application/x-tar'})
+
+        if status >= 400:
+            raise RuntimeError('docker API archive upload failed with status {}: {}'.format(
+                status, data.decode('utf-8', 'replace').strip()))
+
+    def get_archive(self, container_id, path):
+        status, _, data = self._request('GET', '/containers/{}/archive'.format(container_id), {'path': path})
+
+        if status >= 400:
+            raise RuntimeError('docker API archive download failed with status {}: {}'.format(
+                status, data.decode('utf-8', 'replace').strip()))
+
+        # Return the tar archive as a file object
+        return BytesIO(data)
+
+    def inspect(self, target):
+        try:
+            return self._request_json('GET', '/containers/{}/json'.format(quote(target)))
+        except RuntimeError:
+            return {}
+
+    async def inspect_async(self, target):
+        # Run the request on a worker thread, which has its own persistent connection
+        return await asyncio.get_event_loop().run_in_executor(None, self.inspect, target)
+
+    def inspect_many(self, *targets):
+        # Inspect each target over the persistent connection, skipping any that no longer exist
+        return [container for container in map(self.inspect, targets) if container]
+
+    def get_image_ids(self, *images):
+        image_ids = []
+
+        # Inspect each image, returning nothing when any of the images are not present locally
+        for image in images:
+            try:
+                image_ids.append(self._request_json('GET', '/images/{}/json'.format(quote(image, safe='/:@')))['Id'])
+            except RuntimeError:
+                return None
+
+        return image_ids
+
+    def ps(self, *filters, labels=()):
+        containers = self._request_json('GET', '/containers/json',
+                                        {'all': 1, 'filters': self._prepare_filters(filters)})
+
+        # Return the ID and requested labels for each container
+        return [{'Id': container['Id'],
+                 'Labels': {label: (container['Labels'] or {}).get(label, '') for label in labels}}
+                for container in containers]
+
+    def get_network_ids(self, *filters):
+        networks = self._request_json('GET', '/networks', {'filters': self._prepare_filters(filters)})
+        return [network['Id'] for network in networks]
+
+    def get_volume_names(self, *filters):
+        volumes = self._request_json('GET', '/volumes', {'filters': self._prepare_filters(filters)})
+        return [volume['Name'] for volume in volumes.get('Volumes') or []]
+
+    def exec_pipe(self, container_id, *args, callback=None, max_capture=DEFAULT_MAX_CAPTURE):
+        start_time = time()
+
+        # Create the exec instance
+        exec_id = self._request_json('POST', '/containers/{}/exec'.format(container_id), body={
+            'AttachStdout': True, 'AttachStderr': True, 'Cmd': list(args)})['Id']
+
+        # Start the exec instance and read its output until the command exits
+        response = self._send_request('POST', '/exec/{}/start'.format(exec_id), dumps({'Detach': False, 'Tty': False}),
+                                      {'Content-Type': 'application/json'})
+        if response.status >= 400:
+            raise RuntimeError('docker API exec failed with status {}: {}'.format(
+                response.status, response.read().decode('utf-8', 'replace').strip()))
+
+        # Pass each line of stdout to the callback as it is received, capturing no more than the requested size
+        stdout, stderr = CaptureBuffer(max_capture), CaptureBuffer(max_capture)
+        decoder = codecs.getincrementaldecoder(sys.getdefaultencoding())('replace')
+        for stream, chunk in self._read_frames(response):
+            if stream == 2:
+                stderr.write(chunk)
+                continue
+
+            stdout.write(chunk)
+            if callback:
+                for text in decode_lines(decoder, chunk):
+                    callback(text)
+
+        # Return the process exit code, stdout and stderr output
+        exit_code = self._request_json('GET', '/exec/{}/json'.format(exec_id))['ExitCode']
+        tracer.add_command('docker API exec', list(args), start_time, exit_code)
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def logs(self, container_id, tail=None, max_capture=DEFAULT_MAX_CAPTURE):
+        params = {'stdout': 1, 'stderr': 1}
+        if tail is not None:
+            params['tail'] = tail
+
+        # Read the log output in bounded chunks, capturing no more than the requested size
+        response = self._send_request('GET', '/containers/{}/logs?{}'.format(container_id, urlencode(params)))
+        output = CaptureBuffer(max_capture)
+        for _, chunk in self._read_frames(response):
+            output.write(chunk)
+
+        # Return the log lines as a list
+        return output.getvalue().splitlines() if response.status == 200 else []
+
+    def follow_logs(self, container_id):
+        # Use a dedicated connection since the log stream only completes once the container stops
+        connection = UnixHTTPConnection(self.socket_path, timeout=None)
+        url = '/containers/{}/logs?{}'.format(container_id, urlencode({'stdout': 1, 'stderr': 1, 'follow': 1}))
+
+        logging.debug('Opening docker API log stream: {}'.format(url))
+        try:
+            connection.request('GET', url)
+            response = connection.getresponse()
+        except (ConnectionError, HTTPException) as e:
+            raise OSError('docker API log stream failed: {}'.format(e))
+
+        if response.status >= 400:
+            connection.close()
+            raise OSError('docker API log stream failed with status {}'.format(response.status))
+
+        return DockerLogStream(connection, response)
+
+    def events(self, *filters):
+        # Use a dedicated connection since the event stream never completes
+        connection = UnixHTTPConnection(self.socket_path, timeout=None)
+        url = '/events?{}'.format(urlencode({'filters': self._prepare_filters(filters)}))
+
+        logging.debug('Opening docker API event stream: {}'.format(url))
+        try:
+            connection.request('GET', url)
+            response = connection.getresponse()
+        except (ConnectionError, HTTPException) as e:
+            raise OSError('docker API event stream failed: {}'.format(e))
+
+        return DockerEventStream(connection, response)
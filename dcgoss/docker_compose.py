@@ -12,63 +12,162 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
 import os
-
+import re
+import subprocess
+import yaml
+
+from copy import copy
+from hashlib import sha1
+from json import dump
+from secrets import token_hex
 from shutil import which
+from tempfile import mkstemp
 
-from dcgoss.external_command import ExternalCommand
+from dcgoss.external_command import DEFAULT_MAX_CAPTURE, ExternalCommand, run_async
 
 
 class DockerCompose(ExternalCommand):
-    def __init__(self, path):
+    DEFAULT_PROJECT_NAME = 'goss'
+    BINARY = 'docker-compose'
+
+    def __init__(self, path, project_name=DEFAULT_PROJECT_NAME):
         self.path = path
+        self.project_name = self.generate_project_name(path) if project_name == 'auto' else project_name
+        self.override_files = []
         self.file = '{}/docker-compose.yaml'.format(self.path)
-        self.binary = which('docker-compose')
+        self.binary = which(self.BINARY)
 
         # Validate that the docker-compose binary is present
         if not self.binary:
-            raise FileNotFoundError('docker-compose binary is not present on PATH')
+            raise FileNotFoundError('{} binary is not present on PATH'.format(self.BINARY))
 
         # Validate that the docker-compose binary is executable
         if not os.access(self.binary, os.X_OK):
-            raise PermissionError('docker-compose binary is not executable')
+            raise PermissionError('{} binary is not executable'.format(self.BINARY))
 
         # Validate that the docker-compose.yaml file is present
         if not os.path.isfile(self.file):
             raise FileNotFoundError('docker-compose.yaml not present in {}'.format(self.path))
 
+    @staticmethod
+    def get_generated_prefix(path):
+        # Derive the prefix of the generated names from the project path
+        return 'goss_{}_'.format(sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8])
+
+    @classmethod
+    def generate_project_name(cls, path):
+        # Derive a unique name from the project path and a random suffix, as process IDs repeat across containers
+        return '{}{}'.format(cls.get_generated_prefix(path), token_hex(4))
+
     def prepare_cmd(self, *args):
         cmd = super().prepare_cmd(*args)
 
-        # Prepend the name to use for the docker-compose project
-        cmd.insert(1, '--project-name')
-        cmd.insert(2, 'goss')
+        # Prepend the global options before the docker-compose command
+        cmd[1:1] = self._get_global_options()
+
+        return cmd
 
-        # Prepend the docker-compose project path
-        cmd.insert(3, '--project-directory')
-        cmd.insert(4, self.path)
+    def _get_global_options(self):
+        # Specify the name to use for the docker-compose project
+        options = ['--project-name', self.project_name]
 
-        # Prepend the docker-compose file path
-        cmd.insert(5, '--file')
-        cmd.insert(6, self.file)
+        # Specify the docker-compose project path
+        options.extend(['--project-directory', self.path])
+
+        # Specify the docker-compose file path
+        options.extend(['--file', self.file])
+
+        # Specify any generated override file paths
+        for override_file in self.override_files:
+            options.extend(['--file', override_file])
 
         # Allow disabling colored output
         if 'NO_COLOR' in os.environ and os.environ['NO_COLOR'].lower() in ['1', 'true']:
-            cmd.insert(7, '--no-ansi')
+            options.append('--no-ansi')
 
-        return cmd
+        return options
 
-    def up(self, service=None):
-        if service:
-            exit_code = self._execute_cmd('up', '-d', service)
-        else:
-            exit_code = self._execute_cmd('up', '-d')
+    def get_file_version(self):
+        with open(self.file) as f:
+            match = re.search(r'^version:\s*[\'"]?([0-9.]+)', f.read(), re.MULTILINE)
+
+        # Return the version of the docker-compose file format in use
+        return match.group(1) if match else None
+
+    def add_override(self, services):
+        override = {'services': services}
+
+        # Override files must use the same file format version as the main docker-compose file
+        version = self.get_file_version()
+        if version:
+            override['version'] = version
+
+        # Write the override file, JSON being a subset of YAML
+        fd, override_file = mkstemp(prefix='dcgoss-', suffix='.yaml')
+        with os.fdopen(fd, 'w') as f:
+            dump(override, f, indent=2)
+
+        logging.debug('Created docker-compose override file: {}'.format(override_file))
+        self.override_files.append(override_file)
+
+    def remove_overrides(self):
+        # Clean up all generated override files
+        for override_file in self.override_files:
+            logging.debug('Removing docker-compose override file: {}'.format(override_file))
+            os.remove(override_file)
+
+        self.override_files = []
+
+    def up(self, *services):
+        run_async(self.up_async(*services))
+
+    async def up_async(self, *services):
+        exit_code = await self._execute_cmd_async('up', '-d', *services)
 
         if exit_code > 0:
             raise RuntimeError('docker-compose up failed with exit code: {}'.format(exit_code))
 
-    def down(self):
-        exit_code = self._execute_cmd('down', '--volumes')
+    async def pull_async(self, *services):
+        exit_code = await self._execute_cmd_async('pull', '--ignore-pull-failures', '--quiet', *services)
+
+        if exit_code > 0:
+            raise RuntimeError('docker-compose pull failed with exit code: {}'.format(exit_code))
+
+    def for_project(self, project_name):
+        # Return a copy that manages another project with the same docker-compose file
+        compose = copy(self)
+        compose.project_name = project_name
+        compose.override_files = []
+        return compose
+
+    @staticmethod
+    def _get_down_args(timeout=None):
+        return ['down', '--volumes'] + (['--timeout', str(timeout)] if timeout is not None else [])
+
+    def down(self, timeout=None):
+        run_async(self.down_async(timeout))
+
+    def down_detached(self, timeout=None, lock_fileno=None):
+        cmd = self.prepare_cmd(*self._get_down_args(timeout))
+
+        # Start the command in its own session so that it outlives this process and ignores its interrupts
+        if os.name == 'nt':
+            options = {'creationflags': subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            options = {'start_new_session': True}
+
+            # Hand the project lock over to the command, which holds it until the removal has finished
+            if lock_fileno is not None:
+                options['pass_fds'] = (lock_fileno,)
+
+        logging.debug('Executing detached command: {}'.format(cmd))
+        subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         **options)
+
+    async def down_async(self, timeout=None):
+        exit_code = await self._execute_cmd_async(*self._get_down_args(timeout))
 
         if exit_code > 0:
             raise RuntimeError('docker-compose down failed with exit code: {}'.format(exit_code))
@@ -103,26 +202,58 @@ class DockerCompose(ExternalCommand):
     def exec(self, service, *args):
         return self._execute_cmd('exec', '-T', service, *args)
 
-    def exec_pipe(self, service, *args):
-        return self._execute_cmd_pipe('exec', '-T', service, *args)
+    def exec_pipe(self, service, *args, callback=None, max_capture=DEFAULT_MAX_CAPTURE):
+        return run_async(self.exec_pipe_async(service, *args, callback=callback, max_capture=max_capture))
 
-    def log(self, service=None):
+    async def exec_pipe_async(self, service, *args, callback=None, max_capture=DEFAULT_MAX_CAPTURE):
+        return await self._execute_cmd_stream_async('exec', '-T', service, *args,
+                                                    callback=callback, max_capture=max_capture)
+
+    def log(self, service=None, max_capture=DEFAULT_MAX_CAPTURE):
+        return run_async(self.log_async(service, max_capture))
+
+    async def log_async(self, service=None, max_capture=DEFAULT_MAX_CAPTURE):
         if service:
-            cmd = self._execute_cmd_pipe('logs', service)
+            cmd = await self._execute_cmd_pipe_async('logs', service, max_capture=max_capture)
         else:
-            cmd = self._execute_cmd_pipe('logs')
+            cmd = await self._execute_cmd_pipe_async('logs', max_capture=max_capture)
+
+        # Return the log lines as a list, without the line that docker-compose prints before attaching
+        return self._get_log_lines(cmd)
 
-        # Return the log lines as a list
-        return cmd[1].splitlines()[1:] if cmd[0] == 0 else []
+    @staticmethod
+    def _get_log_lines(cmd):
+        lines = cmd[1].splitlines() if cmd[0] == 0 else []
+        return lines[1:] if lines and lines[0].startswith('Attaching to') else lines
+
+    def follow_log(self, service):
+        # Return the running process so that the caller can stream the log output
+        return self._open_cmd_stream('logs', '--follow', service)
 
     def get_services(self):
-        cmd = self._execute_cmd_pipe('ps', '--services')
+        cmd = self._execute_cmd_pipe('ps', '--services', max_capture=None)
 
         # Return a list of all service names
         return cmd[1].splitlines() if cmd[0] == 0 else []
 
+    def get_config(self):
+        # Capture the output in full, as a truncated document can't be parsed
+        cmd = self._execute_cmd_pipe('config', max_capture=None)
+
+        # Return the resolved docker-compose configuration
+        return yaml.safe_load(cmd[1]) if cmd[0] == 0 else None
+
+    def get_config_services(self):
+        cmd = self._execute_cmd_pipe('config', '--services', max_capture=None)
+
+        # Return a list of all service names defined in the docker-compose file
+        return cmd[1].splitlines() if cmd[0] == 0 else []
+
     def get_container_id(self, service):
-        cmd = self._execute_cmd_pipe('ps', '--quiet', service)
+        return run_async(self.get_container_id_async(service))
+
+    async def get_container_id_async(self, service):
+        cmd = await self._execute_cmd_pipe_async('ps', '--quiet', service, max_capture=None)
 
         # Return the container ID for the given service
         return cmd[1].rstrip() if cmd[0] == 0 else None
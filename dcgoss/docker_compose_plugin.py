@@ -0,0 +1,89 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+
+from json import loads
+from shutil import which
+
+from dcgoss.docker_compose import DockerCompose
+from dcgoss.external_command import run_async
+
+
+class DockerComposePlugin(DockerCompose):
+    BINARY = 'docker'
+
+    @classmethod
+    def is_available(cls):
+        binary = which(cls.BINARY)
+        if not binary:
+            return False
+
+        # Validate that the docker CLI has the compose plugin installed
+        try:
+            return subprocess.run([binary, 'compose', 'version'], stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL).returncode == 0
+        except OSError:
+            return False
+
+    def prepare_cmd(self, *args):
+        cmd = super().prepare_cmd(*args)
+
+        # Execute docker-compose as a subcommand of the docker CLI
+        cmd.insert(1, 'compose')
+
+        return cmd
+
+    def _get_global_options(self):
+        options = super()._get_global_options()
+
+        # The plugin replaces the --no-ansi option with --ansi never
+        if '--no-ansi' in options:
+            index = options.index('--no-ansi')
+            options[index:index + 1] = ['--ansi', 'never']
+
+        return options
+
+    @staticmethod
+    def _parse_containers(cmd):
+        output = cmd[1].strip() if cmd[0] == 0 else ''
+        if not output:
+            return []
+
+        # Older versions of the plugin print a JSON array while newer versions print a JSON object per line
+        if output.startswith('['):
+            return loads(output)
+        return [loads(line) for line in output.splitlines() if line.strip()]
+
+    def get_containers(self, service=None):
+        return run_async(self.get_containers_async(service))
+
+    async def get_containers_async(self, service=None):
+        args = [service] if service else []
+        cmd = await self._execute_cmd_pipe_async('ps', '--all', '--format', 'json', *args, max_capture=None)
+        return self._parse_containers(cmd)
+
+    def get_services(self):
+        # Return a list of all service names that have a container
+        return sorted({container['Service'] for container in self.get_containers()})
+
+    async def get_container_id_async(self, service):
+        containers = await self.get_containers_async(service)
+
+        # Return the container ID for the given service
+        return containers[0]['ID'] if containers else None
+
+    def is_running(self, service):
+        # Return the running state of the given service
+        return any(container.get('State') == 'running' for container in self.get_containers(service))
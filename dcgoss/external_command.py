@@ -12,9 +12,110 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import codecs
 import logging
+import os
 import subprocess
 import sys
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from dcgoss.tracing import tracer
+
+# Limit the output captured from a command to its end unless a caller explicitly allows unbounded capture, which
+# callers that parse the output must do
+DEFAULT_MAX_CAPTURE = 16 * 1024 * 1024
+
+# Limit the output read from a command at once, so that a single long line is never held in memory in full
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _run_on_new_loop(coroutine):
+    loop = asyncio.new_event_loop()
+
+    try:
+        # Run the coroutine on a dedicated event loop, which supports subprocesses from any thread
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def run_async(coroutine):
+    # Run the coroutine on a worker thread when it is called from a coroutine, as the running loop can't be reused
+    if asyncio._get_running_loop() is not None:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(_run_on_new_loop, coroutine).result()
+
+    return _run_on_new_loop(coroutine)
+
+
+def decode_lines(decoder, chunk):
+    # Decode each line of a chunk of output, where a line longer than a chunk is decoded in several parts
+    return [text for text in map(decoder.decode, chunk.splitlines(True)) if text]
+
+
+class CaptureBuffer(object):
+    def __init__(self, limit=DEFAULT_MAX_CAPTURE):
+        self.limit = limit
+        self.chunks = deque()
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+
+        # Discard the oldest output once the limit has been exceeded, keeping the most recent output
+        while self.limit is not None and self.size > self.limit:
+            excess = self.size - self.limit
+            if len(self.chunks[0]) <= excess:
+                self.size -= len(self.chunks.popleft())
+            else:
+                self.chunks[0] = self.chunks[0][excess:]
+                self.size -= excess
+
+    def getbytes(self):
+        return b''.join(self.chunks)
+
+    def getvalue(self):
+        return self.getbytes().decode(sys.getdefaultencoding(), 'replace')
+
+
+class CommandStream(object):
+    def __init__(self, cmd, max_capture=DEFAULT_MAX_CAPTURE, name=None):
+        self.cmd = cmd
+        self.name = name or os.path.basename(cmd[0])
+        self.start_time = time()
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.stdout = self.process.stdout
+        self.stderr = CaptureBuffer(max_capture)
+
+        # Drain stderr concurrently so that the process can never block on a full pipe
+        self.thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self.thread.start()
+
+    def _drain_stderr(self):
+        for chunk in iter(lambda: self.process.stderr.readline(READ_CHUNK_SIZE), b''):
+            self.stderr.write(chunk)
+
+    def terminate(self):
+        self.process.terminate()
+
+    def wait(self):
+        # Wait for the process to exit and for stderr to be fully read
+        self.process.wait()
+        self.thread.join()
+        self.process.stderr.close()
+
+        # Record how long the command ran for
+        tracer.add_command(self.name, self.cmd, self.start_time, self.process.returncode)
+
+        return self.process.returncode
 
 
 class ExternalCommand(object):
@@ -31,28 +132,117 @@ class ExternalCommand(object):
 
         return cmd
 
-    def _execute_cmd_pipe(self, *args):
+    @staticmethod
+    def _get_trace_name(cmd, args):
+        # Name the command after its binary and subcommand
+        return ' '.join([os.path.basename(cmd[0])] + list(args[:1]))
+
+    def _open_cmd_stream(self, *args, max_capture=DEFAULT_MAX_CAPTURE):
         # Prepare the command to execute
         cmd = self.prepare_cmd(*args)
 
+        # Start the command and leave its stdout open for the caller to consume
+        logging.debug('Executing command: {}'.format(cmd))
+        return CommandStream(cmd, max_capture, self._get_trace_name(cmd, args))
+
+    @staticmethod
+    async def _read_stream_async(stream, capture, callback=None):
+        decoder = codecs.getincrementaldecoder(sys.getdefaultencoding())('replace')
+
+        while True:
+            # Read whatever output is available, bounded by the chunk size
+            chunk = await stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            capture.write(chunk)
+
+            # Pass each line of output to the callback, where a line longer than a chunk is passed in several parts
+            if callback:
+                for text in decode_lines(decoder, chunk):
+                    callback(text)
+
+    @staticmethod
+    async def _write_stream_async(stream, data):
+        if stream is None:
+            return
+
+        try:
+            view = memoryview(data)
+            for offset in range(0, len(view), READ_CHUNK_SIZE):
+                stream.write(view[offset:offset + READ_CHUNK_SIZE])
+                await stream.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # The command exited without reading all of its input, which its exit code reports
+            pass
+        finally:
+            stream.close()
+
+    async def _execute_cmd_stream_async(self, *args, callback=None, max_capture=DEFAULT_MAX_CAPTURE):
+        # Prepare the command to execute
+        cmd = self.prepare_cmd(*args)
+
+        # Execute the command without blocking the event loop
+        logging.debug('Executing command: {}'.format(cmd))
+        start_time = time()
+        process = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # Read stdout and stderr concurrently, capturing no more than the requested size
+        stdout, stderr = CaptureBuffer(max_capture), CaptureBuffer(max_capture)
+        await asyncio.gather(self._read_stream_async(process.stdout, stdout, callback),
+                             self._read_stream_async(process.stderr, stderr))
+        exit_code = await process.wait()
+        tracer.add_command(self._get_trace_name(cmd, args), cmd, start_time, exit_code)
+
+        # Return the process exit code, stdout and stderr output
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def _execute_cmd_stream(self, *args, callback=None, max_capture=DEFAULT_MAX_CAPTURE):
+        return run_async(self._execute_cmd_stream_async(*args, callback=callback, max_capture=max_capture))
+
+    async def _execute_cmd_pipe_async(self, *args, max_capture=DEFAULT_MAX_CAPTURE):
         # Execute the command and capture any stdout or stderr output
+        return await self._execute_cmd_stream_async(*args, max_capture=max_capture)
+
+    def _execute_cmd_pipe(self, *args, max_capture=DEFAULT_MAX_CAPTURE):
+        return run_async(self._execute_cmd_pipe_async(*args, max_capture=max_capture))
+
+    async def _execute_cmd_bytes_async(self, *args, input_data=None):
+        # Prepare the command to execute
+        cmd = self.prepare_cmd(*args)
+
+        # Execute the command, feeding it any input data and capturing the raw stdout and stderr output
         logging.debug('Executing command: {}'.format(cmd))
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout = process.stdout.read().decode(sys.getdefaultencoding())
-        stderr = process.stderr.read().decode(sys.getdefaultencoding())
-        process.communicate()
+        start_time = time()
+        process = await asyncio.create_subprocess_exec(*cmd, stdin=subprocess.PIPE if input_data is not None else None,
+                                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        # Feed the input in bounded chunks while reading the output, so that the input is never copied in full
+        stdout, stderr = CaptureBuffer(None), CaptureBuffer(None)
+        await asyncio.gather(self._write_stream_async(process.stdin, input_data),
+                             self._read_stream_async(process.stdout, stdout),
+                             self._read_stream_async(process.stderr, stderr))
+        exit_code = await process.wait()
+        tracer.add_command(self._get_trace_name(cmd, args), cmd, start_time, exit_code)
 
         # Return the process exit code, stdout and stderr output
-        return process.returncode, stdout, stderr
+        return exit_code, stdout.getbytes(), stderr.getbytes()
 
-    def _execute_cmd(self, *args):
+    def _execute_cmd_bytes(self, *args, input_data=None):
+        return run_async(self._execute_cmd_bytes_async(*args, input_data=input_data))
+
+    async def _execute_cmd_async(self, *args):
         # Prepare the command to execute
         cmd = self.prepare_cmd(*args)
 
-        # Execute the command
+        # Execute the command without blocking the event loop
         logging.debug('Executing command: {}'.format(cmd))
-        process = subprocess.Popen(cmd)
-        process.communicate()
+        start_time = time()
+        process = await asyncio.create_subprocess_exec(*cmd)
+        exit_code = await process.wait()
+        tracer.add_command(self._get_trace_name(cmd, args), cmd, start_time, exit_code)
 
         # Return the process exit code
-        return process.returncode
+        return exit_code
+
+    def _execute_cmd(self, *args):
+        return run_async(self._execute_cmd_async(*args))
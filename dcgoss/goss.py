@@ -0,0 +1,47 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from dcgoss.external_command import ExternalCommand
+
+
+class Goss(ExternalCommand):
+    def __init__(self, binary):
+        self.binary = binary
+
+        # Validate that the goss binary is executable on this host
+        if not os.access(self.binary, os.X_OK):
+            raise PermissionError('goss binary is not executable')
+
+    @staticmethod
+    def _get_trace_name(cmd, args):
+        # Name the command after its binary and subcommand, which follows the global options
+        return ' '.join([os.path.basename(cmd[0])] + list(args[-1:]))
+
+    def render(self, goss_file, vars_file=None):
+        args = ['--gossfile={}'.format(goss_file)]
+
+        # Include the variables file when present
+        if vars_file:
+            args.append('--vars={}'.format(vars_file))
+
+        # Capture the rendered goss file in full, as a truncated document can't be parsed
+        exit_code, stdout, stderr = self._execute_cmd_pipe(*args, 'render', max_capture=None)
+
+        if exit_code > 0:
+            raise RuntimeError('Failed to parse goss configuration:\n{}'.format((stdout + stderr).strip()))
+
+        # Return the goss file with any variables, templates and included files resolved
+        return stdout
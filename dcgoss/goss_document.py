@@ -0,0 +1,128 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import yaml
+
+from json import loads
+from zlib import crc32
+
+# Map the resource types reported by goss to the keys used within goss files
+RESOURCE_KEYS = {
+    'Addr': 'addr', 'Command': 'command', 'DNS': 'dns', 'File': 'file', 'Gossfile': 'gossfile', 'Group': 'group',
+    'HTTP': 'http', 'Interface': 'interface', 'KernelParam': 'kernel-param', 'Matching': 'matching',
+    'Mount': 'mount', 'Package': 'package', 'Port': 'port', 'Process': 'process', 'Service': 'service',
+    'User': 'user'
+}
+
+
+def load_document(text):
+    # Parse a rendered goss file
+    return yaml.safe_load(text) or {}
+
+
+def dump_document(document):
+    # Serialize a goss document back into YAML
+    return yaml.safe_dump(document, default_flow_style=False).encode('utf-8')
+
+
+def parse_results(text):
+    # Parse the output of 'goss validate --format=json'
+    results = loads(text)
+
+    # Validate that the output contains the expected structure
+    if not isinstance(results, dict) or 'results' not in results:
+        raise ValueError('Unexpected goss results format')
+
+    return results
+
+
+def get_resource_key(result):
+    resource_type = result.get('resource-type', '')
+    return RESOURCE_KEYS.get(resource_type, resource_type.lower()), result.get('resource-id')
+
+
+def get_failed_resources(results):
+    # Return the key and ID of every resource with at least one failed test
+    return {get_resource_key(result) for result in results['results'] or []
+            if not result.get('successful') and not result.get('skipped')}
+
+
+def filter_document(document, resources):
+    filtered = {}
+
+    # Keep only the requested resources
+    for key, resource_id in resources:
+        if key in document and resource_id in (document[key] or {}):
+            filtered.setdefault(key, {})[resource_id] = document[key][resource_id]
+
+    return filtered
+
+
+def format_failures(results):
+    lines = []
+
+    # Describe each failed test
+    for result in results['results'] or []:
+        if not result.get('successful') and not result.get('skipped'):
+            key, resource_id = get_resource_key(result)
+            lines.append(result.get('summary-line') or '{}: {}: {}'.format(key, resource_id, result.get('property')))
+
+    return lines
+
+
+def format_summary(results):
+    summary = results.get('summary', {})
+
+    # Describe the test counts and duration in the same way as goss
+    if summary.get('summary-line'):
+        return summary['summary-line']
+
+    return 'Count: {}, Failed: {}, Duration: {:.3f}s'.format(
+        summary.get('test-count', 0), summary.get('failed-count', 0), summary.get('total-duration', 0) / 1e9)
+
+
+def count_resources(document):
+    # Count the resources across every resource type
+    return sum(len(resources or {}) for resources in document.values() if isinstance(resources, dict))
+
+
+def split_document(document, count):
+    shards = [{} for _ in range(count)]
+
+    # Distribute the resources across the shards by a stable hash of their key and ID
+    for key, resources in document.items():
+        if not isinstance(resources, dict):
+            continue
+
+        for resource_id, resource in resources.items():
+            shard = shards[crc32('{}:{}'.format(key, resource_id).encode('utf-8')) % count]
+            shard.setdefault(key, {})[resource_id] = resource
+
+    # Drop any shards that did not receive a resource
+    return [shard for shard in shards if shard]
+
+
+def merge_results(results):
+    merged = {'results': [], 'summary': {'test-count': 0, 'failed-count': 0, 'total-duration': 0}}
+
+    # Combine the results of each shard, where the shards ran concurrently
+    for result in results:
+        summary = result.get('summary', {})
+        merged['results'].extend(result['results'] or [])
+        merged['summary']['test-count'] += summary.get('test-count', 0)
+        merged['summary']['failed-count'] += summary.get('failed-count', 0)
+        merged['summary']['total-duration'] = max(merged['summary']['total-duration'],
+                                                  summary.get('total-duration', 0))
+
+    return merged
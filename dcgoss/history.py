@@ -0,0 +1,112 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import sqlite3
+
+from contextlib import closing
+
+
+def percentile(values, percent):
+    # Return the nearest-rank percentile of the values
+    if not values:
+        return None
+
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, int(round(percent / 100.0 * len(values))) - 1))]
+
+
+class RunHistory(object):
+    COLUMNS = ['started', 'project', 'service', 'outcome', 'duration', 'startup', 'tests', 'attempts', 'image_id',
+               'goss_hash', 'phases']
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        # Create the database and its table on first use
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, started REAL, '
+                           'project TEXT, service TEXT, outcome TEXT, duration REAL, startup REAL, tests REAL, '
+                           'attempts INTEGER, image_id TEXT, goss_hash TEXT, phases TEXT)')
+        connection.execute('CREATE INDEX IF NOT EXISTS runs_service ON runs (service, started)')
+        return connection
+
+    def record(self, **record):
+        record['phases'] = json.dumps(record.get('phases') or {})
+
+        # Append a single record for the service
+        with closing(self._connect()) as connection, connection:
+            connection.execute('INSERT INTO runs ({}) VALUES ({})'.format(
+                ', '.join(self.COLUMNS), ', '.join('?' * len(self.COLUMNS))), [record.get(c) for c in self.COLUMNS])
+
+    def get_records(self, service=None):
+        if not os.path.isfile(self.path):
+            return []
+
+        # Query the records from oldest to newest, optionally limited to a single service
+        query = 'SELECT {} FROM runs'.format(', '.join(self.COLUMNS))
+        params = []
+        if service:
+            query += ' WHERE service = ?'
+            params.append(service)
+
+        with closing(self._connect()) as connection:
+            rows = connection.execute(query + ' ORDER BY started, id', params).fetchall()
+
+        records = [dict(zip(self.COLUMNS, row)) for row in rows]
+        for record in records:
+            record['phases'] = json.loads(record['phases'] or '{}')
+
+        return records
+
+    def get_stats(self, service=None, baseline_runs=20, recent_runs=5, regression_factor=1.5):
+        services = {}
+        for record in self.get_records(service):
+            services.setdefault(record['service'], []).append(record)
+
+        stats = {}
+        for name, records in sorted(services.items()):
+            passed = [record for record in records if record['outcome'] == 'passed']
+            window = records[-(baseline_runs + recent_runs):]
+
+            # Calculate the percentiles of each metric
+            metrics = {}
+            for metric, source in [('startup', records), ('tests', records), ('duration', records),
+                                   ('attempts', passed)]:
+                values = [record[metric] for record in source if record[metric] is not None]
+                metrics[metric] = (percentile(values, 50), percentile(values, 95))
+
+            # Consider a service flaky when the same images and goss files both passed and failed
+            outcomes = {}
+            for record in window:
+                outcomes.setdefault((record['image_id'], record['goss_hash']), set()).add(record['outcome'] == 'passed')
+            flaky = any(len(outcome) > 1 for outcome in outcomes.values())
+
+            # Compare the median of the most recent runs against the median of the rolling baseline before them
+            regressions = []
+            recent, baseline = window[-recent_runs:], window[:-recent_runs]
+            if len(baseline) >= recent_runs:
+                for metric in ['startup', 'tests', 'duration']:
+                    recent_median = percentile([r[metric] for r in recent if r[metric] is not None], 50)
+                    baseline_median = percentile([r[metric] for r in baseline if r[metric] is not None], 50)
+                    if recent_median and baseline_median and recent_median > baseline_median * regression_factor:
+                        regressions.append((metric, baseline_median, recent_median))
+
+            stats[name] = {'runs': len(records), 'passed': len(passed), 'metrics': metrics, 'flaky': flaky,
+                           'regressions': regressions}
+
+        return stats
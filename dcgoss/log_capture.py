@@ -0,0 +1,94 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import logging
+import os
+import threading
+
+from time import time
+
+
+class LogCapture(object):
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, follow_log, log_path, compress=False, max_size=0):
+        self.follow_log = follow_log
+        self.log_path = log_path
+        self.compress = compress
+        self.max_size = max_size
+        self.followers = []
+
+    def _get_log_file(self, service):
+        return '{}/{}.log{}'.format(self.log_path, service, '.gz' if self.compress else '')
+
+    def start(self, services):
+        # Create the log directory
+        if not os.path.exists(self.log_path):
+            os.makedirs(self.log_path)
+
+        # Follow the logs of each service in the background
+        for service in services:
+            process = self.follow_log(service)
+            thread = threading.Thread(target=self._write, args=(service, process), daemon=True)
+            thread.start()
+            self.followers.append((process, thread))
+
+    def _write(self, service, process):
+        log_file = self._get_log_file(service)
+        written = 0
+
+        try:
+            with (gzip.open(log_file, 'wb') if self.compress else open(log_file, 'wb')) as log:
+                # Skip the line that docker-compose prints before attaching to the containers
+                line = process.stdout.readline()
+                if not line.startswith(b'Attaching to'):
+                    log.write(line)
+                    written += len(line)
+
+                while True:
+                    # Read whatever output is available, bounded by the chunk size
+                    chunk = process.stdout.read1(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    # Keep draining the output once the size limit is reached so that the process is not blocked
+                    if self.max_size and written + len(chunk) > self.max_size:
+                        if written < self.max_size:
+                            log.write(chunk[:self.max_size - written])
+                            log.write('\n... truncated after {} bytes ...\n'.format(self.max_size).encode('utf-8'))
+                            written = self.max_size
+                        continue
+
+                    log.write(chunk)
+                    written += len(chunk)
+
+        except OSError as e:
+            logging.error('Failed to save container logs for "{}" service: {}'.format(service, e))
+
+    def stop(self, timeout=10):
+        deadline = time() + timeout
+
+        for process, thread in self.followers:
+            # Wait for the output to end, which happens once the containers have stopped
+            thread.join(max(0, deadline - time()))
+
+            # Stop following the logs when the output has not ended in time
+            if thread.is_alive():
+                process.terminate()
+                thread.join()
+
+            process.wait()
+
+        self.followers = []
@@ -0,0 +1,83 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+
+
+class ProjectSnapshot(object):
+    def __init__(self, docker, project_name):
+        self.docker = docker
+        self.project_name = project_name
+        self.container_ids = None
+        self.containers = {}
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        # Force the container IDs to be listed again on the next refresh
+        self.container_ids = None
+
+    def has_container(self, container_id):
+        return self.container_ids is not None and container_id in self.container_ids.values()
+
+    def _list_containers(self):
+        # List every non one-off container in the compose project with a single call
+        containers = self.docker.ps('label=com.docker.compose.project={}'.format(self.project_name),
+                                    'label=com.docker.compose.oneoff=False',
+                                    labels=['com.docker.compose.service'])
+
+        # Map each service to its container ID
+        container_ids = {}
+        for container in containers:
+            container_ids.setdefault(container['Labels']['com.docker.compose.service'], container['Id'])
+
+        logging.debug('Listed containers for "{}" project: {}'.format(self.project_name, container_ids))
+        return container_ids
+
+    def refresh(self, service=None):
+        with self.lock:
+            # List the containers when they are not cached or the requested service has no container yet
+            if self.container_ids is None or (service and service not in self.container_ids):
+                self.container_ids = self._list_containers()
+
+            # Inspect every container in the project with a single call
+            ids = list(self.container_ids.values())
+            containers = self.docker.inspect_many(*ids) if ids else []
+
+            # Map each service to its container
+            services = {}
+            for container in containers:
+                labels = container.get('Config', {}).get('Labels') or {}
+                services[labels.get('com.docker.compose.service')] = container
+            self.containers = services
+
+            # Invalidate the cached IDs when a container has been removed or recreated
+            if len(containers) < len(ids):
+                self.invalidate()
+
+        return self
+
+    def get_container_id(self, service):
+        with self.lock:
+            # List the containers when they are not cached or the service has no container yet
+            if self.container_ids is None or service not in self.container_ids:
+                self.container_ids = self._list_containers()
+
+            return self.container_ids.get(service)
+
+    def get_container(self, service):
+        return self.containers.get(service, {})
+
+    def get_state(self, service):
+        return self.get_container(service).get('State', {})
@@ -0,0 +1,107 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+
+from json import loads
+from queue import Queue, Empty
+
+
+class ReadinessWatcher(object):
+    EVENTS = ['start', 'die', 'restart', 'health_status']
+
+    def __init__(self, docker, project_name):
+        self.docker = docker
+        self.project_name = project_name
+        self.process = None
+        self.thread = None
+        self.queues = {}
+        self.consuming = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        # Only receive container events that belong to the compose project
+        filters = ['type=container', 'label=com.docker.compose.project={}'.format(self.project_name)]
+        filters.extend(['event={}'.format(event) for event in self.EVENTS])
+
+        try:
+            # Subscribe to the docker event stream
+            self.process = self.docker.events(*filters)
+        except OSError as e:
+            # Fall back to plain polling when the event stream is not available
+            logging.warning('Unable to subscribe to docker events, falling back to polling: {}'.format(e))
+            return
+
+        # Consume the event stream in the background
+        self.consuming = True
+        self.thread = threading.Thread(target=self._consume, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.process:
+            # Stop the event stream
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def is_active(self):
+        return self.consuming
+
+    def _consume(self):
+        for line in self.process.stdout:
+            try:
+                event = loads(line.decode('utf-8'))
+            except ValueError:
+                continue
+
+            # Resolve the action and the service that the event belongs to
+            action = event.get('Action', event.get('status', '')).split(':')[0]
+            attributes = event.get('Actor', {}).get('Attributes', {})
+            service = attributes.get('com.docker.compose.service')
+            logging.debug('Received docker event for "{}" service: {}'.format(service, action))
+
+            # Wake up anyone waiting on the service
+            self._get_queue(service).put((action, event.get('id')))
+
+        # Wake up everyone waiting once the event stream has ended, so that they fall back to polling
+        with self.lock:
+            self.consuming = False
+            for queue in self.queues.values():
+                queue.put((None, None))
+
+    def _get_queue(self, service):
+        with self.lock:
+            if service not in self.queues:
+                self.queues[service] = Queue()
+
+            return self.queues[service]
+
+    def drain(self, service):
+        queue = self._get_queue(service)
+
+        # Discard any events that have already been received
+        while not queue.empty():
+            queue.get_nowait()
+
+    def wait(self, service, timeout):
+        try:
+            # Block until an event is received for the service or the timeout expires
+            return self._get_queue(service).get(timeout=max(timeout, 0) if timeout is not None else None)
+        except Empty:
+            return None, None
@@ -0,0 +1,106 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import os
+
+from tempfile import mkstemp
+from time import time
+
+
+class ResultCache(object):
+    EXTENSION = '.json'
+
+    def __init__(self, path, max_age=7 * 24 * 60 * 60, max_size=1024 * 1024):
+        self.path = path
+        self.max_age = max_age
+        self.max_size = max_size
+
+    @staticmethod
+    def _load(f):
+        # Store the entries as JSON, which subclasses can replace with their own serialization
+        return json.load(f)
+
+    @staticmethod
+    def _dump(entry, f):
+        json.dump(entry, f)
+
+    def _get_entry_path(self, key):
+        return os.path.join(self.path, '{}{}'.format(key, self.EXTENSION))
+
+    def get(self, key):
+        path = self._get_entry_path(key)
+
+        try:
+            # Ignore entries that have expired
+            if self.max_age > 0 and time() - os.path.getmtime(path) > self.max_age:
+                return None
+
+            with open(path) as f:
+                entry = self._load(f)
+
+            # Mark the entry as recently used so that it is evicted last
+            os.utime(path)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def add(self, key, entry):
+        os.makedirs(self.path, exist_ok=True)
+
+        # Write the entry atomically so that concurrent runs never read a partial entry
+        fd, path = mkstemp(dir=self.path, prefix='.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            self._dump(entry, f)
+        os.replace(path, self._get_entry_path(key))
+
+        self.evict(keep=self._get_entry_path(key))
+
+    def evict(self, keep=None):
+        entries = []
+        kept_size = 0
+
+        # Remove any expired entries, leaving the files of concurrent writers alone
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+
+            if not name.endswith(self.EXTENSION) or name.startswith('.'):
+                continue
+            elif path == keep:
+                # Never remove the entry that has just been added, but make room for it
+                kept_size = info.st_size
+            elif self.max_age > 0 and time() - info.st_mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((info.st_mtime, info.st_size, path))
+
+        # Remove the least recently used entries until the cache fits within its maximum size
+        total_size = kept_size + sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self.max_size <= 0 or total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.debug('Failed to remove cache entry: {}'.format(e))
@@ -0,0 +1,58 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+from time import time
+
+
+class RetryPolicy(object):
+    def __init__(self, interval, max_interval=0, backoff=2.0, jitter=0.0):
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.backoff = backoff
+        self.jitter = jitter
+
+    def get_interval(self, previous=None):
+        # Grow the interval exponentially from the initial interval up to the maximum interval
+        interval = self.interval if previous is None else min(previous * self.backoff, self.max_interval)
+
+        # Spread the retries out by a random fraction of the interval
+        return interval, interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def start(self, timeout=None, deadline=None):
+        return RetryPhase(self, timeout, deadline)
+
+
+class RetryPhase(object):
+    def __init__(self, policy, timeout=None, deadline=None):
+        self.policy = policy
+        self.interval = None
+
+        # Limit the phase by its own timeout and an optional overall deadline
+        deadlines = [d for d in [time() + timeout if timeout else None, deadline] if d is not None]
+        self.deadline = min(deadlines) if deadlines else None
+
+    def remaining(self):
+        return self.deadline - time() if self.deadline is not None else None
+
+    def is_expired(self):
+        return self.deadline is not None and time() > self.deadline
+
+    def next_interval(self):
+        self.interval, interval = self.policy.get_interval(self.interval)
+
+        # Never wait beyond the deadline of the phase
+        remaining = self.remaining()
+        return max(0, min(interval, remaining)) if remaining is not None else interval
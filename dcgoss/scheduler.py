@@ -0,0 +1,286 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import platform
+
+from time import time, sleep
+
+# Use the file locking primitives available on the current platform
+if platform.system() == 'Windows':
+    import msvcrt
+else:
+    import fcntl
+
+
+class RunScheduler(object):
+    def __init__(self, slots_path, max_concurrency, max_load=0, min_memory=0, poll_interval=1):
+        self.slots_path = slots_path
+        self.max_concurrency = max_concurrency
+        self.max_load = max_load
+        self.min_memory = min_memory
+        self.poll_interval = poll_interval
+        self.slot = None
+        self.wait_time = 0
+
+    @staticmethod
+    def _try_lock(slot):
+        try:
+            if platform.system() == 'Windows':
+                slot.seek(0)
+                msvcrt.locking(slot.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(slot.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _unlock(slot):
+        if platform.system() == 'Windows':
+            slot.seek(0)
+            msvcrt.locking(slot.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(slot.fileno(), fcntl.LOCK_UN)
+
+    def _get_slot_path(self, index):
+        return '{}/slot-{}.lock'.format(self.slots_path, index)
+
+    def _lock_free_slot(self):
+        for index in range(self.max_concurrency):
+            slot = open(self._get_slot_path(index), 'a+')
+
+            # Keep the first slot that is not held by another run
+            if self._try_lock(slot):
+                return index, slot
+
+            slot.close()
+
+        return None, None
+
+    def _count_busy_slots(self, own_index):
+        busy = 0
+
+        # Probe each of the other slots without holding on to them
+        for index in range(self.max_concurrency):
+            if index == own_index:
+                continue
+
+            with open(self._get_slot_path(index), 'a+') as slot:
+                if self._try_lock(slot):
+                    self._unlock(slot)
+                else:
+                    busy += 1
+
+        return busy
+
+    @staticmethod
+    def _get_available_memory():
+        try:
+            # Read the available memory in megabytes
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+
+        return None
+
+    def _get_overload_reason(self):
+        # Validate that the system load is within the threshold
+        if self.max_load and hasattr(os, 'getloadavg'):
+            load = os.getloadavg()[0]
+            if load > self.max_load:
+                return 'load average {:.2f} exceeds {:.2f}'.format(load, self.max_load)
+
+        # Validate that enough memory is available
+        if self.min_memory:
+            memory = self._get_available_memory()
+            if memory is not None and memory < self.min_memory:
+                return 'available memory {:.0f}MB is below {:.0f}MB'.format(memory, self.min_memory)
+
+        return None
+
+    def acquire(self):
+        if not os.path.exists(self.slots_path):
+            os.makedirs(self.slots_path, exist_ok=True)
+
+        started = time()
+        reported = None
+
+        while True:
+            index, slot = self._lock_free_slot()
+
+            if slot:
+                # Only hold back on an overloaded host when other runs are already in progress
+                reason = self._get_overload_reason() if self._count_busy_slots(index) else None
+
+                if not reason:
+                    # Record the owner of the slot
+                    slot.seek(0)
+                    slot.truncate()
+                    slot.write('{}\n'.format(os.getpid()))
+                    slot.flush()
+
+                    self.slot = slot
+                    self.wait_time = time() - started
+                    logging.debug('Acquired run slot {} of {}'.format(index + 1, self.max_concurrency))
+                    return self.wait_time
+
+                # Give the slot back to other runs while waiting
+                self._unlock(slot)
+                slot.close()
+            else:
+                reason = 'all {} run slot(s) are in use'.format(self.max_concurrency)
+
+            # Report the reason for waiting whenever it changes
+            if reason != reported:
+                logging.info('Waiting to start, {}...'.format(reason))
+                reported = reason
+
+            sleep(self.poll_interval)
+
+    def release(self):
+        if self.slot:
+            logging.debug('Releasing run slot')
+            self._unlock(self.slot)
+            self.slot.close()
+            self.slot = None
+
+
+class ProjectLock(object):
+    def __init__(self, locks_path, project_name, owner='', poll_interval=1):
+        self.locks_path = locks_path
+        self.project_name = project_name
+        self.owner = owner
+        self.poll_interval = poll_interval
+        self.lock = None
+
+    def _get_lock_path(self, project_name):
+        return '{}/{}.lock'.format(self.locks_path, project_name)
+
+    def _try_lock_project(self):
+        lock_path = self._get_lock_path(self.project_name)
+        lock = open(lock_path, 'a+')
+
+        try:
+            # Only keep the lock when the file has not been removed by its previous owner in the meantime
+            if RunScheduler._try_lock(lock) and os.path.samestat(os.fstat(lock.fileno()), os.stat(lock_path)):
+                return lock
+        except OSError:
+            pass
+
+        lock.close()
+        return None
+
+    def acquire(self, deadline=None):
+        if not os.path.exists(self.locks_path):
+            os.makedirs(self.locks_path, exist_ok=True)
+
+        reported = False
+
+        # Hold the lock for as long as the project's resources exist, so that other runs leave them alone
+        while True:
+            lock = self._try_lock_project()
+            if lock:
+                # Record the compose file of the project, so that only runs of the same file remove its resources
+                lock.seek(0)
+                lock.truncate()
+                lock.write('{}\n'.format(self.owner))
+                lock.flush()
+
+                self.lock = lock
+                return True
+
+            # Only wait for the project when a deadline has been given
+            if deadline is None:
+                logging.warning('Project "{}" is still in use by another run or its removal'.format(
+                    self.project_name))
+                return False
+
+            if time() >= deadline:
+                raise TimeoutError('Timeout reached while waiting for project "{}" to be released by another run or '
+                                   'its removal'.format(self.project_name))
+
+            if not reported:
+                logging.info('Waiting for project "{}" to be released by another run or its removal...'.format(
+                    self.project_name))
+                reported = True
+
+            sleep(max(0, min(self.poll_interval, deadline - time())))
+
+    def is_held(self):
+        return self.lock is not None
+
+    def get_fileno(self):
+        return self.lock.fileno() if self.lock else None
+
+    def release(self, remove=False):
+        if not self.lock:
+            return
+
+        # Remove the lock file once the project's resources have been removed, as there is nothing left to reap
+        if remove:
+            self._remove_lock_file(self.lock, self._get_lock_path(self.project_name))
+
+        self.lock.close()
+        self.lock = None
+
+    @staticmethod
+    def _remove_lock_file(lock, lock_path):
+        try:
+            # Only remove the file that is locked, as another run may have replaced it in the meantime
+            if os.path.samestat(os.fstat(lock.fileno()), os.stat(lock_path)):
+                os.remove(lock_path)
+        except OSError as e:
+            logging.debug('Failed to remove lock file {}: {}'.format(lock_path, e))
+
+    def reap(self, has_resources, remove_resources):
+        try:
+            lock_files = sorted(name for name in os.listdir(self.locks_path) if name.endswith('.lock'))
+        except OSError:
+            return
+
+        for lock_file in lock_files:
+            project_name = lock_file[:-len('.lock')]
+            if project_name == self.project_name:
+                continue
+
+            # Skip the projects whose lock is still held by the run, or the background removal, that owns them
+            lock_path = self._get_lock_path(project_name)
+            try:
+                lock = open(lock_path, 'a+')
+            except OSError:
+                continue
+
+            try:
+                if not RunScheduler._try_lock(lock):
+                    continue
+
+                # Leave the projects of other compose files alone, as they can only be removed with their own file
+                lock.seek(0)
+                if lock.read().strip() != self.owner:
+                    continue
+
+                # Remove the resources left behind by a run that no longer exists, forgetting the project otherwise
+                if has_resources(project_name):
+                    logging.info('Removing test resources left behind by "{}" project...'.format(project_name))
+                    remove_resources(project_name, lock.fileno())
+                else:
+                    self._remove_lock_file(lock, lock_path)
+
+            finally:
+                lock.close()
@@ -0,0 +1,105 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import threading
+
+from contextlib import contextmanager
+from time import time
+
+
+class Tracer(object):
+    def __init__(self):
+        self.enabled = False
+        self.origin = time()
+        self.events = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def enable(self):
+        # Keep the spans already recorded when enabled more than once
+        if self.enabled:
+            return
+
+        # Start recording spans relative to the current time
+        self.enabled = True
+        self.origin = time()
+        self.events = []
+        self.threads = {}
+
+    def add_span(self, name, category, start, end, **args):
+        if not self.enabled:
+            return
+
+        # Record the span as a complete trace event with microsecond timestamps
+        thread = threading.current_thread()
+        with self.lock:
+            self.threads[thread.ident] = thread.name
+            self.events.append({'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': thread.ident,
+                                'ts': int((start - self.origin) * 1e6), 'dur': int((end - start) * 1e6),
+                                'args': args})
+
+    @contextmanager
+    def span(self, name, category='phase', **args):
+        start = time()
+        try:
+            yield
+        finally:
+            self.add_span(name, category, start, time(), **args)
+
+    def add_command(self, name, cmd, start, exit_code):
+        self.add_span(name, 'command', start, time(), argv=cmd, exit_code=exit_code)
+
+    def get_phase_durations(self, service=None):
+        durations = {}
+
+        # Total the duration and count of the phases shared by all services or belonging to the service
+        with self.lock:
+            for event in self.events:
+                if event['cat'] == 'phase' and event['args'].get('service') in [None, service]:
+                    count, total = durations.get(event['name'], (0, 0))
+                    durations[event['name']] = (count + 1, total + event['dur'] / 1e6)
+
+        return durations
+
+    def format_summary(self):
+        totals = {}
+
+        # Total the duration of the spans by category and name
+        with self.lock:
+            for event in self.events:
+                key = (event['cat'], event['name'])
+                count, total, longest = totals.get(key, (0, 0, 0))
+                totals[key] = (count + 1, total + event['dur'], max(longest, event['dur']))
+
+        # Format the slowest spans first
+        lines = ['{:<8} {:<40} {:>6} {:>10} {:>10}'.format('Type', 'Name', 'Count', 'Total (s)', 'Max (s)')]
+        for (category, name), (count, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append('{:<8} {:<40} {:>6} {:>10.3f} {:>10.3f}'.format(
+                category, name[:40], count, total / 1e6, longest / 1e6))
+
+        return lines
+
+    def write(self, path):
+        # Write the recorded spans in the Chrome trace event format, naming each thread that recorded a span
+        with self.lock:
+            events = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': ident, 'args': {'name': name}}
+                      for ident, name in self.threads.items()] + self.events
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# Share a single tracer across every component of the process
+tracer = Tracer()
@@ -17,12 +17,13 @@ setup(
     classifiers=[
         'License :: OSI Approved :: Apache Software License',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.8',
         'Topic :: Software Development :: Testing'
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.8',
     install_requires=[
-        'python-dateutil~=2.8.0'
+        'python-dateutil~=2.8.0',
+        'PyYAML>=5.1'
     ],
     extras_require={
         ':sys_platform == "win32"': ['colorama>=0.4,<1.0']
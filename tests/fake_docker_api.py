@@ -0,0 +1,210 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import os
+import shutil
+import socketserver
+import struct
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class FakeDockerAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # Keep the test output quiet
+        pass
+
+    def address_string(self):
+        return 'unix'
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        fake = self.server.fake
+
+        # Drop the connection without responding to simulate a daemon that has closed it
+        if fake.drop_connections > 0:
+            fake.drop_connections -= 1
+            self.close_connection = True
+            return
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        if fake.chunked:
+            # Send the body in small chunks to exercise chunked transfer decoding
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for offset in range(0, len(body), 7):
+                chunk = body[offset:offset + 7]
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+    def _send_json(self, status, value):
+        self._send(status, json.dumps(value).encode('utf-8'))
+
+    @staticmethod
+    def _multiplex(*frames):
+        # Prefix each frame with its stream and size as the daemon does for containers without a TTY
+        return b''.join(struct.pack('>BxxxL', stream, len(data)) + data for stream, data in frames if data)
+
+    def _handle(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+
+        with fake.lock:
+            fake.requests.append((self.command, url.path, query, body))
+
+        if parts == ['containers', 'json']:
+            filters = json.loads(query.get('filters', '{}'))
+            labels = [label.split('=', 1) for label in filters.get('label', [])]
+            self._send_json(200, [
+                {'Id': container_id, 'Labels': container['Config']['Labels']}
+                for container_id, container in sorted(fake.containers.items())
+                if all(name in container['Config']['Labels'] and
+                       (not value or container['Config']['Labels'][name] == value[0]) for name, *value in labels)])
+
+        elif parts[0] == 'containers' and parts[2:] == ['json']:
+            if parts[1] in fake.containers:
+                self._send_json(200, fake.containers[parts[1]])
+            else:
+                self._send_json(404, {'message': 'No such container: {}'.format(parts[1])})
+
+        elif parts[0] == 'containers' and parts[2:] == ['archive'] and self.command == 'PUT':
+            fake.archives[parts[1]] = body
+            self._send(200)
+
+        elif parts[0] == 'containers' and parts[2:] == ['archive']:
+            if parts[1] in fake.archives:
+                self._send(200, fake.archives[parts[1]], 'application/x-tar')
+            else:
+                self._send_json(404, {'message': 'Could not find the file {}'.format(query.get('path'))})
+
+        elif parts[0] == 'containers' and parts[2:] == ['exec']:
+            with fake.lock:
+                exec_id = 'exec{}'.format(len(fake.execs))
+                fake.execs.append((parts[1], json.loads(body.decode('utf-8'))['Cmd']))
+            self._send_json(201, {'Id': exec_id})
+
+        elif parts[0] == 'exec' and parts[2:] == ['start']:
+            # Stream the output until the connection is closed, as the daemon does without a protocol upgrade
+            stdout, stderr, _ = fake.exec_result
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+            self.end_headers()
+            self.wfile.write(self._multiplex(*[(1, stdout[offset:offset + 1000])
+                                               for offset in range(0, len(stdout), 1000)], (2, stderr)))
+            self.close_connection = True
+
+        elif parts[0] == 'exec' and parts[2:] == ['json']:
+            self._send_json(200, {'ExitCode': fake.exec_result[2]})
+
+        elif parts[0] == 'containers' and parts[2:] == ['logs']:
+            if parts[1] not in fake.containers:
+                self._send_json(404, {'message': 'No such container: {}'.format(parts[1])})
+            else:
+                lines = fake.logs.get(parts[1], b'').splitlines(True)
+                if 'tail' in query:
+                    lines = lines[-int(query['tail']):]
+                self._send(200, self._multiplex(*[(1, line) for line in lines]), 'application/vnd.docker.raw-stream')
+
+        elif parts[0] == 'images' and parts[-1] == 'json':
+            name = '/'.join(parts[1:-1])
+            if name in fake.images:
+                self._send_json(200, {'Id': fake.images[name]})
+            else:
+                self._send_json(404, {'message': 'No such image: {}'.format(name)})
+
+        elif parts == ['networks']:
+            self._send_json(200, [{'Id': network_id} for network_id in fake.networks])
+
+        elif parts == ['volumes']:
+            self._send_json(200, {'Volumes': [{'Name': name} for name in fake.volumes]})
+
+        elif parts == ['events']:
+            # Stream each queued event as a chunk and end the stream
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for event in fake.events:
+                chunk = json.dumps(event).encode('utf-8') + b'\n'
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+
+        else:
+            self._send_json(404, {'message': 'page not found'})
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = _handle
+
+
+class FakeDockerAPIServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class FakeDockerAPI(object):
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix='dcgoss-test-')
+        self.socket_path = os.path.join(self.directory, 'docker.sock')
+        self.lock = threading.Lock()
+        self.requests = []
+        self.containers = {}
+        self.archives = {}
+        self.images = {}
+        self.networks = []
+        self.volumes = []
+        self.events = []
+        self.execs = []
+        self.exec_result = (b'', b'', 0)
+        self.logs = {}
+        self.chunked = False
+        self.drop_connections = 0
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        # Serve the fake daemon on a unix socket in a temporary directory
+        self.server = FakeDockerAPIServer(self.socket_path, FakeDockerAPIHandler)
+        self.server.fake = self
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def add_container(self, container_id, project, service, running=True):
+        self.containers[container_id] = {
+            'Id': container_id,
+            'State': {'Running': running, 'Status': 'running' if running else 'exited'},
+            'Config': {'Labels': {'com.docker.compose.project': project, 'com.docker.compose.service': service}},
+        }
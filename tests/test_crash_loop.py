@@ -0,0 +1,80 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from dcgoss.crash_loop import CrashLoopDetector
+
+
+def exited(finished, exit_code=1, restart_count=0, **state):
+    return dict(state, Status='exited', Running=False, ExitCode=exit_code, FinishedAt=finished,
+                RestartCount=restart_count)
+
+
+class CrashLoopDetectorTest(unittest.TestCase):
+    def test_distinct_exits_are_counted(self):
+        detector = CrashLoopDetector(3)
+
+        # Observing the same exit again does not count as another crash
+        self.assertIsNone(detector.check('web', 'abc', exited('2020-01-01T00:00:01Z')))
+        self.assertIsNone(detector.check('web', 'abc', exited('2020-01-01T00:00:01Z')))
+        self.assertIsNone(detector.check('web', 'abc', exited('2020-01-01T00:00:02Z')))
+
+        # A replaced container counts towards the same service
+        self.assertEqual(detector.check('web', 'def', exited('2020-01-01T00:00:02Z', 137, OOMKilled=True)),
+                         'Container crashed 3 time(s) (exit code: 137, OOM killed: yes)')
+
+    def test_containers_that_never_exited_are_ignored(self):
+        detector = CrashLoopDetector(1)
+
+        self.assertIsNone(detector.check('web', 'abc', {'Status': 'running', 'FinishedAt': '0001-01-01T00:00:00Z'}))
+        self.assertIsNone(detector.check('web', 'abc', {'Status': 'created'}))
+
+    def test_restart_count_is_counted(self):
+        detector = CrashLoopDetector(2)
+
+        self.assertIsNone(detector.check('web', 'abc', {'Status': 'running', 'RestartCount': 1}))
+        self.assertEqual(detector.check('web', 'abc', {'Status': 'restarting', 'RestartCount': 2, 'ExitCode': 1,
+                                                       'Error': 'boom'}),
+                         'Container crashed 2 time(s) (exit code: 1, OOM killed: no): boom')
+
+    def test_services_are_counted_separately(self):
+        detector = CrashLoopDetector(2)
+
+        self.assertIsNone(detector.check('web', 'abc', exited('2020-01-01T00:00:01Z')))
+        self.assertIsNone(detector.check('db', 'def', exited('2020-01-01T00:00:02Z')))
+
+    def test_threshold_of_zero_is_disabled(self):
+        detector = CrashLoopDetector(0)
+
+        for index in range(5):
+            self.assertIsNone(detector.check('web', 'abc', exited('2020-01-01T00:00:0{}Z'.format(index),
+                                                                  restart_count=index)))
+
+    def test_crashes_before_reset_are_not_counted(self):
+        detector = CrashLoopDetector(2)
+        self.assertIsNone(detector.check('web', 'abc', exited('2020-01-01T00:00:01Z', restart_count=1)))
+        detector.reset('web')
+
+        # The exits and restarts seen before the service stabilized are not counted again
+        self.assertIsNone(detector.check('web', 'abc', {'Status': 'running', 'FinishedAt': '2020-01-01T00:00:01Z',
+                                                        'RestartCount': 1}))
+        self.assertIsNone(detector.check('web', 'abc', exited('2020-01-01T00:00:02Z', restart_count=2)))
+        self.assertEqual(detector.check('web', 'abc', exited('2020-01-01T00:00:03Z', restart_count=3)),
+                         'Container crashed 2 time(s) (exit code: 1, OOM killed: no)')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,329 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import tarfile
+import threading
+import unittest
+
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from time import time
+from unittest import mock
+
+from dcgoss.dcgoss import DCGoss
+from dcgoss.docker_api import DockerAPI
+from dcgoss.docker_compose import DockerCompose
+from dcgoss.scheduler import ProjectLock
+from tests.fake_docker_api import FakeDockerAPI
+
+
+class ArchiveTest(unittest.TestCase):
+    def test_symlinked_file_is_archived_as_file(self):
+        with TemporaryDirectory() as directory:
+            # Link to the goss binary the way package managers install it on PATH
+            binary = os.path.join(directory, 'goss-linux-amd64')
+            with open(binary, 'wb') as f:
+                f.write(b'#!/bin/sh\n')
+            link = os.path.join(directory, 'goss')
+            os.symlink(binary, link)
+
+            buffer = BytesIO()
+            with tarfile.open(fileobj=buffer, mode='w') as tar:
+                DCGoss._add_to_archive(tar, 'goss/goss', 0o777, path=link)
+
+        buffer.seek(0)
+        with tarfile.open(fileobj=buffer) as tar:
+            member = tar.getmember('goss/goss')
+            self.assertTrue(member.isfile())
+            self.assertEqual(member.mode, 0o777)
+            self.assertEqual((member.uid, member.gid, member.uname), (0, 0, 'root'))
+            self.assertEqual(tar.extractfile(member).read(), b'#!/bin/sh\n')
+
+
+class JsonArgsTest(unittest.TestCase):
+    def test_output_options_are_replaced(self):
+        self.assertEqual(DCGoss._get_json_args(['validate', '--format', 'tap', '--color', '--sleep=1s']),
+                         ['validate', '--sleep=1s', '--format=json', '--no-color'])
+
+    def test_short_and_inline_format_options_are_replaced(self):
+        self.assertEqual(DCGoss._get_json_args(['validate', '-f', 'rspecish', '--format=junit', '-fnagios',
+                                                '--no-color', '--retry-timeout', '30s']),
+                         ['validate', '--retry-timeout', '30s', '--format=json', '--no-color'])
+
+    def test_trailing_format_option_is_dropped(self):
+        self.assertEqual(DCGoss._get_json_args(['validate', '--format']), ['validate', '--format=json', '--no-color'])
+
+
+def create_dcgoss(path, docker, compose, **options):
+    for name in ['goss', 'goss.yaml']:
+        with open(os.path.join(path, name), 'w') as f:
+            f.write('')
+    compose.file = os.path.join(path, 'docker-compose.yaml')
+
+    with mock.patch.dict(os.environ, {'GOSS_PATH': os.path.join(path, 'goss'),
+                                      'GOSS_LOGS': os.path.join(path, 'logs')}):
+        return DCGoss(path, docker, compose, 10, 0.05, **options)
+
+
+class CacheKeyTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.config = {'name': 'goss', 'services': {'web': {'image': 'web', 'environment': {'GOSS_HOME': '/goss'},
+                                                            'networks': {'default': None}}},
+                       'networks': {'default': {'name': 'goss_default'}}}
+        compose = mock.Mock(project_name='goss', DEFAULT_PROJECT_NAME='goss',
+                            **{'get_config.return_value': self.config})
+        docker = mock.Mock(**{'get_image_ids.return_value': ['sha256:web']})
+        self.dcgoss = create_dcgoss(self.directory.name, docker, compose)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_key_changes_with_goss_files(self):
+        cache_key = self.dcgoss._get_cache_key(['web'])
+        self.assertEqual(self.dcgoss._get_cache_key(['web']), cache_key)
+
+        with open(os.path.join(self.directory.name, 'goss.yaml'), 'w') as f:
+            f.write('file: {}\n')
+        self.assertNotEqual(self.dcgoss._get_cache_key(['web']), cache_key)
+
+    def test_key_changes_with_compose_config(self):
+        cache_key = self.dcgoss._get_cache_key(['web'])
+
+        self.config['services']['web']['environment']['DEBUG'] = '1'
+        self.assertNotEqual(self.dcgoss._get_cache_key(['web']), cache_key)
+
+    def test_key_changes_with_images(self):
+        cache_key = self.dcgoss._get_cache_key(['web'])
+
+        self.dcgoss.docker.get_image_ids.return_value = ['sha256:other']
+        self.assertNotEqual(self.dcgoss._get_cache_key(['web']), cache_key)
+
+        # Images that are not present locally are not cached
+        self.dcgoss.docker.get_image_ids.return_value = []
+        self.assertIsNone(self.dcgoss._get_cache_key(['web']))
+
+    def test_bind_mounts_are_not_cached(self):
+        self.assertIsNotNone(self.dcgoss._get_cache_key(['web']))
+
+        self.config['services']['web']['volumes'] = [{'type': 'bind', 'source': './src', 'target': '/app'}]
+        self.assertIsNone(self.dcgoss._get_cache_key(['web']))
+
+    def test_short_syntax_bind_mounts_are_detected(self):
+        for volume in ['./src:/app', '/src:/app:rw', '~/src:/app', 'C:\\src:/app']:
+            self.assertTrue(DCGoss._has_bind_mount({'volumes': [volume]}), volume)
+
+        for volume in ['data:/app', '/app', {'type': 'volume', 'source': 'data', 'target': '/app'}]:
+            self.assertFalse(DCGoss._has_bind_mount({'volumes': [volume]}), volume)
+
+    def test_only_the_project_name_prefix_is_ignored(self):
+        cache_key = self.dcgoss._get_cache_key(['web'])
+
+        # Resources prefixed with the project name match those of a project with a generated name
+        self.config['networks']['default']['name'] = 'dcgoss-1a2b3c_default'
+        self.dcgoss.compose.project_name = 'dcgoss-1a2b3c'
+        self.assertEqual(self.dcgoss._get_cache_key(['web']), cache_key)
+
+        # Other values that contain the project name are still part of the key
+        self.config['networks']['default']['name'] = 'goss_default'
+        self.dcgoss.compose.project_name = 'goss'
+        self.config['services']['web']['environment']['GOSS_HOME'] = '/'
+        self.assertNotEqual(self.dcgoss._get_cache_key(['web']), cache_key)
+
+
+class PayloadTest(unittest.TestCase):
+    def test_goss_files_are_hashed_with_the_payload(self):
+        with TemporaryDirectory() as directory:
+            dcgoss = create_dcgoss(directory, mock.Mock(), mock.Mock(project_name='goss', DEFAULT_PROJECT_NAME='goss'))
+            dcgoss.host_render = False
+            goss_hash = dcgoss._get_goss_hash()
+
+            with tarfile.open(fileobj=BytesIO(dcgoss._build_payload_traced())) as tar:
+                self.assertIn('goss/goss.yaml', tar.getnames())
+            self.assertEqual(dcgoss.goss_hash, goss_hash)
+
+            # The run history reuses the hash rather than hashing the goss files again
+            dcgoss.history = mock.Mock()
+            with mock.patch.object(dcgoss, '_get_goss_hash') as get_goss_hash:
+                dcgoss._record_history(['web'], {'web': 0}, {})
+            get_goss_hash.assert_not_called()
+            self.assertEqual(dcgoss.history.record.call_args[1]['goss_hash'], goss_hash)
+
+
+class CrashLoopTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        compose = mock.Mock(project_name='goss', DEFAULT_PROJECT_NAME='goss',
+                            **{'log.return_value': ['starting', 'panic: boom']})
+        self.dcgoss = create_dcgoss(self.directory.name, mock.Mock(), compose, crash_loop_threshold=2)
+        self.dcgoss.snapshot = mock.Mock(**{'get_container_id.return_value': 'abc'})
+        self.dcgoss.watcher = mock.Mock(**{'is_active.return_value': True})
+        self.dcgoss.start_time = time()
+
+    def _set_states(self, *states):
+        self.dcgoss.snapshot.refresh.return_value.get_state.side_effect = states
+
+    def test_startup_aborts_once_the_container_keeps_crashing(self):
+        self._set_states({'Status': 'exited', 'Running': False, 'ExitCode': 1, 'FinishedAt': '2020-01-01T00:00:01Z'},
+                         {'Status': 'exited', 'Running': False, 'ExitCode': 1, 'FinishedAt': '2020-01-01T00:00:02Z'})
+
+        with self.assertRaises(RuntimeError) as context:
+            self.dcgoss._wait_until_stable('web')
+
+        # The exited container is restarted once before it crashes again
+        self.dcgoss.compose.restart.assert_called_once_with('web')
+        self.assertEqual(str(context.exception), 'Container crashed 2 time(s) (exit code: 1, OOM killed: no), '
+                                                 'last 2 log line(s):\nstarting\npanic: boom')
+
+    def test_crashes_during_startup_are_not_counted_once_stable(self):
+        self.dcgoss.initial_startup = 0
+        self._set_states({'Status': 'exited', 'Running': False, 'ExitCode': 1, 'FinishedAt': '2020-01-01T00:00:01Z'},
+                         {'Status': 'running', 'Running': True, 'FinishedAt': '2020-01-01T00:00:01Z',
+                          'StartedAt': '2020-01-01T00:00:02Z'},
+                         {'Status': 'running', 'Running': True, 'FinishedAt': '2020-01-01T00:00:01Z',
+                          'StartedAt': '2020-01-01T00:00:02Z'},
+                         {'Status': 'exited', 'Running': False, 'ExitCode': 1, 'FinishedAt': '2020-01-01T00:00:03Z'})
+        self.dcgoss._wait_until_stable('web')
+
+        # A single crash after the service stabilized is restarted rather than reported as a crash loop
+        self.assertTrue(self.dcgoss._restart_if_down('web'))
+
+
+class RetryFailedTest(unittest.TestCase):
+    DOCUMENT = {'file': {'/etc/passwd': {'exists': True}, '/etc/hosts': {'exists': True}}}
+
+    @staticmethod
+    def _results(*failed):
+        return {'results': [{'resource-type': 'File', 'resource-id': resource_id,
+                             'successful': resource_id not in failed} for resource_id in ['/etc/passwd', '/etc/hosts']],
+                'summary': {}}
+
+    def test_failed_confirmation_waits_and_checks_the_container(self):
+        with TemporaryDirectory() as directory:
+            dcgoss = create_dcgoss(directory, mock.Mock(), mock.Mock(project_name='goss', DEFAULT_PROJECT_NAME='goss'),
+                                   retry_failed=True)
+            dcgoss.snapshot = mock.Mock()
+            dcgoss._copy_data_in = mock.Mock()
+            dcgoss._restart_if_down = mock.Mock(return_value=False)
+
+            # Fail a resource, pass it on its own, fail the confirmation with the full goss file and then pass
+            dcgoss._exec_goss_json = mock.Mock(side_effect=[self._results('/etc/passwd'), self._results(),
+                                                            self._results()])
+            dcgoss._exec_goss = mock.Mock(return_value=1)
+
+            with mock.patch('dcgoss.dcgoss.sleep') as sleep:
+                exit_code = dcgoss._run_goss_validate_json('web', ['--gossfile=/goss/goss.yaml'], [], self.DOCUMENT,
+                                                           dcgoss.retry_policy.start(10))
+
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(dcgoss._restart_if_down.call_count, 2)
+        self.assertEqual(dcgoss._exec_goss_json.call_args_list[-1][0][1], '--gossfile=/goss/goss.yaml')
+
+
+class DockerAPIBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.fake = FakeDockerAPI().start()
+        self.fake.add_container('abc', 'goss', 'web')
+        self.fake.containers['abc']['Config']['Labels']['com.docker.compose.oneoff'] = 'False'
+
+        compose = mock.Mock(project_name='goss', DEFAULT_PROJECT_NAME='goss')
+        self.dcgoss = create_dcgoss(self.directory.name, DockerAPI(self.fake.socket_path), compose)
+
+    def tearDown(self):
+        self.fake.stop()
+        self.directory.cleanup()
+
+    def test_goss_is_executed_over_the_api(self):
+        self.fake.exec_result = (b'{"summary": {}}\n', b'', 0)
+
+        exit_code, stdout, _ = self.dcgoss._exec_pipe('web', '/goss/goss', 'validate')
+
+        self.assertEqual((exit_code, stdout), (0, '{"summary": {}}\n'))
+        self.assertEqual(self.fake.execs, [('abc', ['/goss/goss', 'validate'])])
+        self.dcgoss.compose.exec_pipe.assert_not_called()
+
+    def test_logs_are_followed_over_the_api(self):
+        self.fake.logs['abc'] = b'started\n'
+
+        stream = self.dcgoss._follow_log('web')
+        self.assertEqual(stream.stdout.read(), b'started\n')
+        stream.wait()
+        self.dcgoss.compose.follow_log.assert_not_called()
+
+
+class PruneLogsTest(unittest.TestCase):
+    def test_only_recent_generated_log_directories_are_kept(self):
+        with TemporaryDirectory() as directory:
+            prefix = DockerCompose.get_generated_prefix(directory)
+            compose = mock.Mock(path=directory, project_name='{}current'.format(prefix), DEFAULT_PROJECT_NAME='goss',
+                                get_generated_prefix=DockerCompose.get_generated_prefix)
+            dcgoss = create_dcgoss(directory, mock.Mock(), compose)
+            dcgoss.keep_logs = 3
+
+            # Create the log directories of earlier runs, from the oldest to the newest, and of a custom project
+            names = ['{}{}'.format(prefix, index) for index in range(4)] + ['custom']
+            for index, name in enumerate(names):
+                os.makedirs(os.path.join(dcgoss.logs_path, name))
+                os.utime(os.path.join(dcgoss.logs_path, name), (index, index))
+
+            dcgoss._prune_logs()
+            self.assertEqual(sorted(os.listdir(dcgoss.logs_path)), sorted(names[2:]))
+
+
+class ProjectLockWaitTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+
+        # Create a run on the default project with docker stand-ins that report no previous resources
+        compose = mock.Mock(project_name='goss', DEFAULT_PROJECT_NAME='goss')
+        docker = mock.Mock(**{'ps.return_value': [], 'get_network_ids.return_value': [],
+                              'get_volume_names.return_value': []})
+        self.dcgoss = create_dcgoss(self.directory.name, docker, compose)
+        self.dcgoss.project_lock.poll_interval = 0.05
+        self.dcgoss.start_time = time()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_startup_waits_for_the_project_to_be_released(self):
+        # Hold the project lock from another file descriptor as a detached removal does
+        removal = ProjectLock(self.dcgoss.project_lock.locks_path, 'goss')
+        self.assertTrue(removal.acquire())
+
+        checked = threading.Event()
+        thread = threading.Thread(target=lambda: self.dcgoss._has_previous_resources() or checked.set())
+        thread.start()
+        self.assertFalse(checked.wait(0.3))
+        self.dcgoss.docker.ps.assert_not_called()
+
+        # Release the project once the removal has finished
+        removal.release(remove=True)
+        self.assertTrue(checked.wait(5))
+        thread.join()
+        self.assertTrue(self.dcgoss.project_lock.is_held())
+        self.dcgoss.project_lock.release(remove=True)
+
+    def test_shutdown_leaves_a_project_that_was_never_locked(self):
+        self.dcgoss._shutdown()
+        self.dcgoss.compose.stop.assert_not_called()
+        self.dcgoss.compose.down.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
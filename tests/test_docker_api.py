@@ -0,0 +1,177 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import tarfile
+import unittest
+
+from http.client import HTTPException
+from io import BytesIO
+
+from dcgoss.docker_api import DockerAPI
+from tests.fake_docker_api import FakeDockerAPI
+
+
+class DockerAPITest(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeDockerAPI().start()
+        self.docker = DockerAPI(self.fake.socket_path)
+
+    def tearDown(self):
+        self.docker._get_connection().close()
+        self.fake.stop()
+
+    def test_missing_socket(self):
+        with self.assertRaises(FileNotFoundError):
+            DockerAPI('{}/missing.sock'.format(self.fake.directory))
+
+    def test_request_reuses_connection(self):
+        self.fake.add_container('abc', 'goss', 'web')
+
+        self.assertEqual(self.docker.inspect('abc')['Id'], 'abc')
+        sock = self.docker._get_connection().sock
+        self.assertEqual(self.docker.inspect('abc')['Id'], 'abc')
+
+        # Both requests are sent over the same keep-alive connection
+        self.assertIs(self.docker._get_connection().sock, sock)
+        self.assertEqual(len(self.fake.requests), 2)
+
+    def test_request_json_error(self):
+        with self.assertRaises(RuntimeError) as context:
+            self.docker._request_json('GET', '/containers/missing/json')
+        self.assertIn('404', str(context.exception))
+
+        # Missing containers are reported as empty
+        self.assertEqual(self.docker.inspect('missing'), {})
+
+    def test_chunked_response(self):
+        self.fake.chunked = True
+        for index in range(20):
+            self.fake.add_container('container{}'.format(index), 'goss', 'service{}'.format(index))
+
+        containers = self.docker.ps('label=com.docker.compose.project=goss', labels=['com.docker.compose.service'])
+
+        self.assertEqual(len(containers), 20)
+        self.assertEqual(containers[0], {'Id': 'container0', 'Labels': {'com.docker.compose.service': 'service0'}})
+
+        # The connection remains usable once the chunked response has been read
+        self.assertEqual(self.docker.inspect('container1')['Id'], 'container1')
+
+    def test_ps_filters(self):
+        self.fake.add_container('abc', 'goss', 'web')
+        self.fake.add_container('def', 'other', 'web')
+
+        containers = self.docker.ps('label=com.docker.compose.project=goss')
+
+        self.assertEqual([container['Id'] for container in containers], ['abc'])
+        _, _, query, _ = self.fake.requests[-1]
+        self.assertEqual(json.loads(query['filters']), {'label': ['com.docker.compose.project=goss']})
+
+    def test_idempotent_request_retried(self):
+        self.fake.add_container('abc', 'goss', 'web')
+        self.fake.drop_connections = 1
+
+        self.assertEqual(self.docker.inspect('abc')['Id'], 'abc')
+        self.assertEqual(len(self.fake.requests), 2)
+
+    def test_non_idempotent_request_not_retried(self):
+        self.fake.drop_connections = 1
+
+        with self.assertRaises((ConnectionError, HTTPException)):
+            self.docker._request('POST', '/containers/abc/exec', body=b'{}')
+        self.assertEqual(len(self.fake.requests), 1)
+
+        # A new connection is used for the next request
+        self.assertEqual(self.docker._request('GET', '/networks')[0], 200)
+
+    def test_archive_round_trip(self):
+        archive = BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            tarinfo = tarfile.TarInfo('goss/goss.yaml')
+            tarinfo.size = 5
+            tar.addfile(tarinfo, BytesIO(b'file:'))
+
+        self.docker.put_archive('abc', '/', archive.getvalue())
+
+        with tarfile.open(fileobj=self.docker.get_archive('abc', '/goss'), mode='r') as tar:
+            self.assertEqual(tar.extractfile('goss/goss.yaml').read(), b'file:')
+        method, _, query, _ = self.fake.requests[0]
+        self.assertEqual((method, query), ('PUT', {'path': '/'}))
+
+    def test_get_archive_error(self):
+        with self.assertRaises(RuntimeError):
+            self.docker.get_archive('missing', '/goss')
+
+    def test_get_image_ids(self):
+        self.fake.images['nginx:latest'] = 'sha256:1'
+        self.fake.images['library/redis'] = 'sha256:2'
+
+        self.assertEqual(self.docker.get_image_ids('nginx:latest', 'library/redis'), ['sha256:1', 'sha256:2'])
+        self.assertIsNone(self.docker.get_image_ids('nginx:latest', 'missing'))
+
+    def test_networks_and_volumes(self):
+        self.fake.networks = ['net1']
+        self.fake.volumes = ['vol1', 'vol2']
+
+        self.assertEqual(self.docker.get_network_ids('label=com.docker.compose.project=goss'), ['net1'])
+        self.assertEqual(self.docker.get_volume_names('label=com.docker.compose.project=goss'), ['vol1', 'vol2'])
+
+    def test_events(self):
+        self.fake.events = [{'Type': 'container', 'Action': 'start', 'id': 'abc'},
+                            {'Type': 'container', 'Action': 'die', 'id': 'abc'}]
+
+        stream = self.docker.events('label=com.docker.compose.project=goss')
+        events = [json.loads(line) for line in stream.stdout]
+        stream.wait()
+
+        self.assertEqual([event['Action'] for event in events], ['start', 'die'])
+
+
+    def test_exec_pipe(self):
+        self.fake.exec_result = (b'line 1\n' + b'x' * 2500 + b'\n', b'warning\n', 3)
+        lines = []
+
+        exit_code, stdout, stderr = self.docker.exec_pipe('abc', '/goss/goss', 'validate', callback=lines.append,
+                                                          max_capture=1024)
+
+        self.assertEqual(exit_code, 3)
+        self.assertEqual(self.fake.execs, [('abc', ['/goss/goss', 'validate'])])
+        self.assertEqual(''.join(lines), 'line 1\n' + 'x' * 2500 + '\n')
+        self.assertEqual((stdout, stderr), ('x' * 1023 + '\n', 'warning\n'))
+
+        # The connection is reopened once the output stream has been closed by the daemon
+        self.assertEqual(self.docker.exec_pipe('abc', 'true')[0], 3)
+
+    def test_logs(self):
+        self.fake.add_container('abc', 'goss', 'web')
+        self.fake.logs['abc'] = b'one\ntwo\nthree\n'
+
+        self.assertEqual(self.docker.logs('abc'), ['one', 'two', 'three'])
+        self.assertEqual(self.docker.logs('abc', tail=2), ['two', 'three'])
+        self.assertEqual(self.docker.logs('missing'), [])
+
+    def test_follow_logs(self):
+        self.fake.chunked = True
+        self.fake.add_container('abc', 'goss', 'web')
+        self.fake.logs['abc'] = b'one\n' + b'y' * 100000 + b'\n'
+
+        stream = self.docker.follow_logs('abc')
+        self.assertEqual(stream.stdout.readline(), b'one\n')
+        self.assertEqual(stream.stdout.read(), b'y' * 100000 + b'\n')
+        stream.wait()
+
+
+if __name__ == '__main__':
+    unittest.main()
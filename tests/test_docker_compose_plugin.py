@@ -0,0 +1,93 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import unittest
+
+from unittest import mock
+
+from dcgoss import _create_compose
+from dcgoss.docker_compose_plugin import DockerComposePlugin
+
+
+class ParseContainersTest(unittest.TestCase):
+    def test_json_array(self):
+        output = '[{"ID": "abc", "Service": "web"}, {"ID": "def", "Service": "db"}]\n'
+
+        self.assertEqual(DockerComposePlugin._parse_containers((0, output, '')),
+                         [{'ID': 'abc', 'Service': 'web'}, {'ID': 'def', 'Service': 'db'}])
+
+    def test_json_object_per_line(self):
+        output = '{"ID": "abc", "Service": "web"}\n\n{"ID": "def", "Service": "db"}\n'
+
+        self.assertEqual(DockerComposePlugin._parse_containers((0, output, '')),
+                         [{'ID': 'abc', 'Service': 'web'}, {'ID': 'def', 'Service': 'db'}])
+
+    def test_no_containers(self):
+        self.assertEqual(DockerComposePlugin._parse_containers((0, '[]\n', '')), [])
+        self.assertEqual(DockerComposePlugin._parse_containers((0, '\n', '')), [])
+
+    def test_failed_command(self):
+        self.assertEqual(DockerComposePlugin._parse_containers((1, '{"ID": "abc"}\n', 'error')), [])
+
+
+class IsAvailableTest(unittest.TestCase):
+    def test_missing_docker_binary(self):
+        with mock.patch('dcgoss.docker_compose_plugin.which', return_value=None):
+            self.assertFalse(DockerComposePlugin.is_available())
+
+    def test_compose_plugin_version(self):
+        with mock.patch('dcgoss.docker_compose_plugin.which', return_value='/usr/bin/docker'), \
+                mock.patch('dcgoss.docker_compose_plugin.subprocess.run') as run:
+            run.return_value.returncode = 0
+            self.assertTrue(DockerComposePlugin.is_available())
+            self.assertEqual(run.call_args[0][0], ['/usr/bin/docker', 'compose', 'version'])
+
+            # The docker CLI reports an unknown command without the plugin
+            run.return_value.returncode = 1
+            self.assertFalse(DockerComposePlugin.is_available())
+
+            run.side_effect = OSError()
+            self.assertFalse(DockerComposePlugin.is_available())
+
+
+class CreateComposeTest(unittest.TestCase):
+    def _create(self, compose_backend, available=True):
+        with mock.patch('dcgoss.DockerCompose') as legacy, mock.patch('dcgoss.DockerComposePlugin') as plugin:
+            plugin.is_available.return_value = available
+            compose = _create_compose('/project', 'goss', compose_backend)
+
+        return 'plugin' if compose is plugin.return_value else 'legacy' if compose is legacy.return_value else None
+
+    def test_plugin_is_preferred_when_available(self):
+        self.assertEqual(self._create('auto'), 'plugin')
+
+    def test_legacy_binary_is_used_without_plugin(self):
+        self.assertEqual(self._create('auto', available=False), 'legacy')
+
+    def test_backend_is_not_detected_when_set(self):
+        self.assertEqual(self._create('legacy'), 'legacy')
+        self.assertEqual(self._create('plugin', available=False), 'plugin')
+
+        with mock.patch.dict(os.environ, {'GOSS_COMPOSE_BACKEND': 'legacy'}):
+            self.assertEqual(self._create('auto'), 'legacy')
+
+    def test_unsupported_backend(self):
+        with self.assertRaises(ValueError):
+            self._create('other')
+
+
+if __name__ == '__main__':
+    unittest.main()
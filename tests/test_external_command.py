@@ -0,0 +1,95 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import os
+import sys
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+
+from dcgoss.docker import Docker
+from dcgoss.external_command import DEFAULT_MAX_CAPTURE, ExternalCommand, READ_CHUNK_SIZE, run_async
+
+
+class Python(ExternalCommand):
+    binary = sys.executable
+
+
+class CommandStreamTest(unittest.TestCase):
+    def test_long_lines_are_read_in_bounded_chunks(self):
+        chunks = []
+        exit_code, stdout, _ = Python()._execute_cmd_stream(
+            '-c', 'print("x" * {})'.format(READ_CHUNK_SIZE * 3), callback=chunks.append, max_capture=1024)
+
+        self.assertEqual(exit_code, 0)
+        self.assertTrue(all(len(chunk) <= READ_CHUNK_SIZE for chunk in chunks))
+        self.assertEqual(''.join(chunks), 'x' * READ_CHUNK_SIZE * 3 + '\n')
+        self.assertEqual(stdout, 'x' * 1023 + '\n')
+
+    def test_split_characters_are_decoded_once_complete(self):
+        chunks = []
+        Python()._execute_cmd_stream('-c', 'import sys; sys.stdout.buffer.write(b"x" * {} + "\\u00e9".encode())'.format(
+            READ_CHUNK_SIZE - 1), callback=chunks.append)
+
+        self.assertEqual(''.join(chunks), 'x' * (READ_CHUNK_SIZE - 1) + 'é')
+
+
+class ParsedOutputTest(unittest.TestCase):
+    def test_documents_larger_than_the_capture_limit_are_parsed(self):
+        with TemporaryDirectory() as directory:
+            # Stand in for the docker CLI with a script that prints a large inspect result
+            binary = os.path.join(directory, 'docker')
+            with open(binary, 'w') as f:
+                f.write('#!{}\nimport json\n'
+                        'print(json.dumps([{{"Id": str(i), "Data": "x" * 1024}} for i in range({})]))\n'.format(
+                            sys.executable, DEFAULT_MAX_CAPTURE // 1024 + 1))
+            os.chmod(binary, 0o755)
+
+            docker = Docker.__new__(Docker)
+            docker.binary = binary
+            containers = docker.inspect_many('all')
+
+        self.assertEqual(len(containers), DEFAULT_MAX_CAPTURE // 1024 + 1)
+        self.assertEqual(containers[0]['Id'], '0')
+
+
+class SyncWrapperTest(unittest.TestCase):
+    def test_sync_api_runs_on_worker_threads(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda index: Python()._execute_cmd_pipe('-c', 'print({})'.format(index)),
+                                        range(4)))
+
+        self.assertEqual(results, [(0, '{}\n'.format(index), '') for index in range(4)])
+
+    def test_input_is_fed_in_chunks(self):
+        data = bytes(range(256)) * READ_CHUNK_SIZE
+        exit_code, stdout, _ = Python()._execute_cmd_bytes(
+            '-c', 'import sys; sys.stdout.buffer.write(sys.stdin.buffer.read())', input_data=data)
+
+        self.assertEqual((exit_code, stdout), (0, data))
+
+    def test_sync_api_can_be_called_from_a_coroutine(self):
+        async def execute():
+            return Python()._execute_cmd_pipe('-c', 'print("sync")'), \
+                await Python()._execute_cmd_pipe_async('-c', 'print("async")')
+
+        self.assertEqual(run_async(execute()), ((0, 'sync\n', ''), (0, 'async\n', '')))
+        self.assertIsNone(asyncio._get_running_loop())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from dcgoss.goss_document import (RESOURCE_KEYS, filter_document, get_failed_resources, load_document,
+                                  merge_results, split_document)
+
+DOCUMENT = load_document('''
+file:
+  /etc/passwd:
+    exists: true
+  /etc/hosts:
+    exists: true
+kernel-param:
+  net.ipv4.ip_forward:
+    value: "1"
+http:
+  http://localhost/:
+    status: 200
+port:
+  tcp:80:
+    listening: true
+''')
+
+
+def result(resource_type, resource_id, successful=True, skipped=False):
+    return {'resource-type': resource_type, 'resource-id': resource_id, 'property': 'exists',
+            'successful': successful, 'skipped': skipped}
+
+
+class GossDocumentTest(unittest.TestCase):
+    def test_resource_keys_match_goss_file_keys(self):
+        self.assertEqual(sorted(RESOURCE_KEYS.values()), sorted([
+            'addr', 'command', 'dns', 'file', 'gossfile', 'group', 'http', 'interface', 'kernel-param', 'matching',
+            'mount', 'package', 'port', 'process', 'service', 'user']))
+
+    def test_get_failed_resources(self):
+        results = {'results': [
+            result('File', '/etc/passwd'),
+            result('File', '/etc/hosts', successful=False),
+            result('KernelParam', 'net.ipv4.ip_forward', successful=False),
+            result('HTTP', 'http://localhost/', successful=False),
+            result('Port', 'tcp:80', successful=False, skipped=True),
+        ]}
+
+        self.assertEqual(get_failed_resources(results), {
+            ('file', '/etc/hosts'), ('kernel-param', 'net.ipv4.ip_forward'), ('http', 'http://localhost/')})
+
+    def test_get_failed_resources_without_results(self):
+        self.assertEqual(get_failed_resources({'results': None}), set())
+
+    def test_filter_document_keeps_failed_resources(self):
+        results = {'results': [result('KernelParam', 'net.ipv4.ip_forward', successful=False),
+                               result('HTTP', 'http://localhost/', successful=False)]}
+
+        self.assertEqual(filter_document(DOCUMENT, get_failed_resources(results)), {
+            'kernel-param': {'net.ipv4.ip_forward': {'value': '1'}},
+            'http': {'http://localhost/': {'status': 200}},
+        })
+
+    def test_filter_document_ignores_unknown_resources(self):
+        self.assertEqual(filter_document(DOCUMENT, {('file', '/missing'), ('user', 'root')}), {})
+
+    def test_split_document_distributes_every_resource_once(self):
+        shards = split_document(DOCUMENT, 3)
+
+        resources = [(key, resource_id) for shard in shards for key in shard for resource_id in shard[key]]
+        self.assertEqual(sorted(resources), sorted((key, resource_id) for key in DOCUMENT
+                                                   for resource_id in DOCUMENT[key]))
+        self.assertTrue(all(shards))
+
+    def test_split_document_is_stable(self):
+        self.assertEqual(split_document(DOCUMENT, 3), split_document(DOCUMENT, 3))
+
+    def test_split_document_drops_empty_shards(self):
+        self.assertEqual(len(split_document(DOCUMENT, 50)), 5)
+        self.assertEqual(split_document(DOCUMENT, 1), [DOCUMENT])
+
+    def test_merge_results(self):
+        merged = merge_results([
+            {'results': [result('File', '/etc/passwd')],
+             'summary': {'test-count': 1, 'failed-count': 0, 'total-duration': 300}},
+            {'results': [result('Port', 'tcp:80', successful=False)],
+             'summary': {'test-count': 2, 'failed-count': 1, 'total-duration': 500}},
+            {'results': None, 'summary': {}},
+        ])
+
+        self.assertEqual(len(merged['results']), 2)
+        self.assertEqual(merged['summary'], {'test-count': 3, 'failed-count': 1, 'total-duration': 500})
+
+
+if __name__ == '__main__':
+    unittest.main()
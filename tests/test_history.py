@@ -0,0 +1,141 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import unittest
+
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from dcgoss.dcgoss import DCGoss
+from dcgoss.history import RunHistory, percentile
+
+
+class PercentileTest(unittest.TestCase):
+    def test_nearest_rank_is_returned(self):
+        values = [5, 1, 4, 2, 3, 6, 7, 8, 9, 10]
+
+        self.assertEqual(percentile(values, 50), 5)
+        self.assertEqual(percentile(values, 95), 10)
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 100), 10)
+
+    def test_single_and_no_values(self):
+        self.assertEqual(percentile([3], 50), 3)
+        self.assertEqual(percentile([3], 95), 3)
+        self.assertIsNone(percentile([], 50))
+
+
+class RunHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.history = RunHistory(os.path.join(self.directory.name, 'data', 'history.db'))
+        self.started = 0
+
+    def _record(self, service='web', outcome='passed', duration=10, startup=4, tests=6, attempts=1, image_id='a'):
+        self.started += 1
+        self.history.record(started=self.started, project='goss', service=service, outcome=outcome,
+                            duration=duration, startup=startup, tests=tests, attempts=attempts, image_id=image_id,
+                            goss_hash='goss', phases={'startup': startup})
+
+    def test_empty_history(self):
+        self.assertEqual(self.history.get_records(), [])
+        self.assertEqual(self.history.get_stats(), {})
+
+    def test_single_record(self):
+        self._record()
+
+        self.assertEqual(self.history.get_records()[0]['phases'], {'startup': 4})
+        self.assertEqual(self.history.get_stats(), {'web': {
+            'runs': 1, 'passed': 1, 'flaky': False, 'regressions': [],
+            'metrics': {'startup': (4, 4), 'tests': (6, 6), 'duration': (10, 10), 'attempts': (1, 1)}}})
+
+    def test_stats_are_aggregated_per_service(self):
+        for duration in range(1, 21):
+            self._record(duration=duration)
+        self._record('db', 'failed', startup=None, tests=None, attempts=3)
+
+        stats = self.history.get_stats()
+        self.assertEqual(stats['web']['metrics']['duration'], (10, 19))
+        self.assertEqual((stats['db']['runs'], stats['db']['passed']), (1, 0))
+        self.assertEqual(stats['db']['metrics']['startup'], (None, None))
+
+        # The attempts are only aggregated over passing runs
+        self.assertEqual(stats['db']['metrics']['attempts'], (None, None))
+
+        # Only the requested service is aggregated
+        self.assertEqual(list(self.history.get_stats('db')), ['db'])
+
+    def test_same_inputs_with_different_outcomes_are_flaky(self):
+        self._record(image_id='a')
+        self._record(outcome='failed', image_id='b')
+        self.assertFalse(self.history.get_stats()['web']['flaky'])
+
+        self._record(outcome='failed', image_id='a')
+        self.assertTrue(self.history.get_stats()['web']['flaky'])
+
+    def test_regressions_are_compared_against_the_baseline(self):
+        # Regressions are only reported once the baseline holds enough runs
+        for _ in range(5):
+            self._record(tests=30)
+        self.assertEqual(self.history.get_stats()['web']['regressions'], [])
+
+        for _ in range(5):
+            self._record(tests=6)
+        for _ in range(5):
+            self._record(tests=30)
+        self.assertEqual(self.history.get_stats()['web']['regressions'], [('tests', 6, 30)])
+
+
+class StatsTest(unittest.TestCase):
+    def test_history_is_kept_next_to_the_logs(self):
+        with mock.patch.dict(os.environ, {'GOSS_LOGS': '/data/logs'}):
+            self.assertEqual(DCGoss.get_history('/goss').path, '/data/history.db')
+
+        with mock.patch.dict(os.environ, {'GOSS_FILES_PATH': '/files'}):
+            os.environ.pop('GOSS_LOGS', None)
+            self.assertEqual(DCGoss.get_data_path('/goss'), '/files/.goss')
+
+        with mock.patch.dict(os.environ, {'GOSS_HISTORY': '/history.db'}):
+            self.assertEqual(DCGoss.get_history('/goss').path, '/history.db')
+
+    def test_empty_history_is_reported(self):
+        with TemporaryDirectory() as directory:
+            with self.assertLogs(level='INFO') as logs:
+                self.assertEqual(DCGoss.stats(RunHistory(os.path.join(directory, 'history.db'))), 0)
+
+        self.assertIn('No runs have been recorded', logs.output[0])
+
+    def test_stats_are_reported(self):
+        with TemporaryDirectory() as directory:
+            history = RunHistory(os.path.join(directory, 'history.db'))
+            history.record(started=1, project='goss', service='web', outcome='passed', duration=10, startup=4,
+                           tests=6, attempts=2, image_id='a', goss_hash='goss')
+
+            with self.assertLogs(level='INFO') as logs:
+                self.assertEqual(DCGoss.stats(history, 'web'), 0)
+
+        self.assertEqual([record.getMessage() for record in logs.records], [
+            '"web" service: 1 run(s), 1 passed',
+            '  attempts  p50: 2        p95: 2',
+            '  duration  p50: 10.0s    p95: 10.0s',
+            '  startup   p50: 4.0s     p95: 4.0s',
+            '  tests     p50: 6.0s     p95: 6.0s',
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
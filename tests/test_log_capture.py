@@ -0,0 +1,108 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gzip
+import os
+import subprocess
+import sys
+import unittest
+
+from tempfile import TemporaryDirectory
+from time import time
+
+from dcgoss.log_capture import LogCapture
+
+
+class FakeFollower(object):
+    def __init__(self, output, delay=0):
+        self.output = output
+        self.delay = delay
+        self.processes = []
+
+    def follow_log(self, service):
+        # Print the output and end the stream after the delay
+        script = ('import sys, time; sys.stdout.buffer.write(sys.argv[1].encode()); sys.stdout.flush(); '
+                  'time.sleep(float(sys.argv[2]))')
+        process = subprocess.Popen([sys.executable, '-c', script, self.output, str(self.delay)],
+                                   stdout=subprocess.PIPE)
+        self.processes.append(process)
+        return process
+
+
+class LogCaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.log_path = os.path.join(self.directory.name, 'logs')
+
+    def _capture(self, follower, services, **options):
+        capture = LogCapture(follower.follow_log, self.log_path, **options)
+        capture.start(services)
+        return capture
+
+    def _read(self, name):
+        with open(os.path.join(self.log_path, name), 'rb') as f:
+            return f.read()
+
+    def test_logs_are_saved_per_service(self):
+        follower = FakeFollower('Attaching to goss_web_1\nweb_1  | started\n')
+        capture = self._capture(follower, ['web', 'db'])
+        capture.stop()
+
+        # The line printed before attaching to the containers is skipped
+        self.assertEqual(self._read('web.log'), b'web_1  | started\n')
+        self.assertEqual(self._read('db.log'), b'web_1  | started\n')
+        self.assertEqual([process.returncode for process in follower.processes], [0, 0])
+        self.assertEqual(capture.followers, [])
+
+    def test_output_without_attaching_line_is_kept(self):
+        capture = self._capture(FakeFollower('first\nsecond\n'), ['web'])
+        capture.stop()
+
+        self.assertEqual(self._read('web.log'), b'first\nsecond\n')
+
+    def test_followers_that_do_not_end_are_stopped(self):
+        follower = FakeFollower('running\n', 60)
+        capture = self._capture(follower, ['web'])
+
+        start = time()
+        capture.stop(0.5)
+        self.assertLess(time() - start, 10)
+
+        self.assertIsNotNone(follower.processes[0].returncode)
+        self.assertEqual(self._read('web.log'), b'running\n')
+
+    def test_saved_logs_are_truncated(self):
+        # Output beyond the pipe buffer is drained without being written
+        capture = self._capture(FakeFollower('start\n' + 'x' * 100000), ['web'], max_size=10)
+        capture.stop()
+
+        self.assertEqual(self._read('web.log'), b'start\nxxxx\n... truncated after 10 bytes ...\n')
+
+    def test_logs_within_limit_are_not_truncated(self):
+        capture = self._capture(FakeFollower('start\nend\n'), ['web'], max_size=10)
+        capture.stop()
+
+        self.assertEqual(self._read('web.log'), b'start\nend\n')
+
+    def test_saved_logs_are_compressed(self):
+        capture = self._capture(FakeFollower('start\n'), ['web'], compress=True)
+        capture.stop()
+
+        self.assertEqual(gzip.decompress(self._read('web.log.gz')), b'start\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from contextlib import redirect_stderr
+from io import StringIO
+
+from dcgoss.__main__ import parse_args
+
+
+class ParseArgsTest(unittest.TestCase):
+    def test_shards_option_requires_a_count(self):
+        args = parse_args(['run', 'web', '/project', '-s', '4'])
+        self.assertEqual((args.shards, args.service, args.path), ('4', 'web', '/project'))
+
+        args = parse_args(['run', 'web', '--shards', 'AUTO'])
+        self.assertEqual((args.shards, args.service), ('auto', 'web'))
+
+    def test_service_is_not_taken_for_the_shard_count(self):
+        with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+            parse_args(['run', '-s', 'web'])
+
+    def test_all_option_before_the_path(self):
+        args = parse_args(['run', '--all', '/project'])
+        self.assertEqual((args.all, args.service, args.path), (True, None, '/project'))
+
+    def test_all_option_after_the_path(self):
+        args = parse_args(['run', '/project', '--all'])
+        self.assertEqual((args.all, args.service, args.path), (True, None, '/project'))
+
+    def test_positional_arguments_after_options(self):
+        args = parse_args(['run', '-s', '4', 'web', '/project'])
+        self.assertEqual((args.shards, args.service, args.path), ('4', 'web', '/project'))
+
+    def test_unrecognized_arguments_are_rejected(self):
+        for argv in [['run', 'web', '/project', '--unknown'], ['run', '-s', '4', 'web', '/project', 'other']]:
+            with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+                parse_args(argv)
+
+    def test_shards_default_to_a_single_shard(self):
+        self.assertEqual(parse_args(['run', 'web']).shards, '1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import subprocess
+import sys
+import unittest
+
+from time import time
+
+from dcgoss.readiness import ReadinessWatcher
+
+
+class FakeDocker(object):
+    def __init__(self, events, delay):
+        self.events_output = ''.join(json.dumps(event) + '\n' for event in events)
+        self.delay = delay
+
+    def events(self, *filters):
+        # Print the events and end the stream after the delay
+        script = 'import sys, time; sys.stdout.write(sys.argv[1]); sys.stdout.flush(); time.sleep(float(sys.argv[2]))'
+        return subprocess.Popen([sys.executable, '-c', script, self.events_output, str(self.delay)],
+                                stdout=subprocess.PIPE)
+
+
+class ReadinessWatcherTest(unittest.TestCase):
+    def _start_watcher(self, events, delay):
+        watcher = ReadinessWatcher(FakeDocker(events, delay), 'project')
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        return watcher
+
+    def test_wait_returns_service_event(self):
+        watcher = self._start_watcher([{'Action': 'health_status: healthy', 'id': 'abc', 'Actor': {
+            'Attributes': {'com.docker.compose.service': 'web'}}}], 5)
+
+        self.assertTrue(watcher.is_active())
+        self.assertEqual(watcher.wait('web', 5), ('health_status', 'abc'))
+
+    def test_wait_ends_with_event_stream(self):
+        watcher = self._start_watcher([], 0.2)
+        watcher.drain('web')
+
+        # Waiting for as long as the phase allows must not outlive the event stream
+        start = time()
+        self.assertEqual(watcher.wait('web', 30), (None, None))
+        self.assertLess(time() - start, 5)
+        watcher.thread.join(5)
+        self.assertFalse(watcher.is_active())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import unittest
+
+from tempfile import TemporaryDirectory
+from time import time
+
+from dcgoss.render_cache import RenderCache
+
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'render-cache')
+
+    def test_rendered_files_are_stored_verbatim(self):
+        cache = RenderCache(self.path)
+        self.assertIsNone(cache.get('a'))
+
+        cache.add('a', 'file:\n  /etc/passwd:\n    exists: true\n')
+        self.assertEqual(cache.get('a'), 'file:\n  /etc/passwd:\n    exists: true\n')
+        self.assertEqual(os.listdir(self.path), ['a.yaml'])
+
+    def test_empty_rendering_is_cached(self):
+        cache = RenderCache(self.path)
+        cache.add('a', '')
+
+        self.assertEqual(cache.get('a'), '')
+
+    def test_expired_renderings_are_ignored(self):
+        cache = RenderCache(self.path, max_age=60)
+        cache.add('a', 'file: {}\n')
+        path = os.path.join(self.path, 'a.yaml')
+        os.utime(path, (time() - 120, time() - 120))
+
+        self.assertIsNone(cache.get('a'))
+
+    def test_least_recently_used_renderings_are_evicted(self):
+        cache = RenderCache(self.path, max_size=10)
+        cache.add('a', 'a' * 6)
+        os.utime(os.path.join(self.path, 'a.yaml'), (time() - 30, time() - 30))
+        cache.add('b', 'b' * 6)
+
+        self.assertEqual(os.listdir(self.path), ['b.yaml'])
+
+
+if __name__ == '__main__':
+    unittest.main()
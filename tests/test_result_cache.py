@@ -0,0 +1,93 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import unittest
+
+from tempfile import TemporaryDirectory
+from time import time
+
+from dcgoss.result_cache import ResultCache
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'cache')
+
+    def _age(self, key, seconds):
+        # Move the modification time of the entry back in time
+        path = os.path.join(self.path, '{}.json'.format(key))
+        os.utime(path, (time() - seconds, time() - seconds))
+
+    def test_entries_are_stored_by_key(self):
+        cache = ResultCache(self.path)
+        self.assertIsNone(cache.get('a'))
+
+        cache.add('a', {'services': ['web']})
+        self.assertEqual(cache.get('a'), {'services': ['web']})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(os.listdir(self.path), ['a.json'])
+
+    def test_expired_entries_are_ignored(self):
+        cache = ResultCache(self.path, max_age=60)
+        cache.add('a', {})
+        cache.add('b', {})
+        self._age('a', 120)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), {})
+
+        # Expired entries are removed on the next addition
+        cache.add('c', {})
+        self.assertEqual(sorted(os.listdir(self.path)), ['b.json', 'c.json'])
+
+    def test_entries_never_expire_without_max_age(self):
+        cache = ResultCache(self.path, max_age=0)
+        cache.add('a', {})
+        self._age('a', 365 * 24 * 60 * 60)
+
+        self.assertEqual(cache.get('a'), {})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        # Each entry takes up 2 bytes, so only two of them fit
+        cache = ResultCache(self.path, max_size=4)
+        for index, key in enumerate(['a', 'b']):
+            cache.add(key, {})
+            self._age(key, 30 - index)
+
+        # Reading an entry marks it as recently used, so the other one is evicted to make room
+        self.assertEqual(cache.get('a'), {})
+        cache.add('c', {})
+        self.assertEqual(sorted(os.listdir(self.path)), ['a.json', 'c.json'])
+
+    def test_added_entry_is_kept_when_larger_than_max_size(self):
+        cache = ResultCache(self.path, max_size=1)
+        cache.add('a', {})
+        cache.add('b', {'services': ['web']})
+
+        self.assertEqual(os.listdir(self.path), ['b.json'])
+
+    def test_corrupt_entries_are_ignored(self):
+        os.makedirs(self.path)
+        with open(os.path.join(self.path, 'a.json'), 'w') as f:
+            f.write('{')
+
+        self.assertIsNone(ResultCache(self.path).get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from time import time
+from unittest import mock
+
+from dcgoss.retry_policy import RetryPolicy
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_interval_grows_up_to_the_maximum(self):
+        phase = RetryPolicy(1, 10, 2.0).start()
+
+        self.assertEqual([phase.next_interval() for _ in range(6)], [1, 2, 4, 8, 10, 10])
+
+    def test_interval_is_constant_without_maximum(self):
+        phase = RetryPolicy(1).start()
+
+        self.assertEqual([phase.next_interval() for _ in range(3)], [1, 1, 1])
+
+    def test_jitter_stays_within_bounds(self):
+        phase = RetryPolicy(1, 8, 2.0, 0.5).start()
+
+        for expected in [1, 2, 4, 8, 8, 8]:
+            interval = phase.next_interval()
+            self.assertGreaterEqual(interval, expected * 0.5)
+            self.assertLessEqual(interval, expected * 1.5)
+
+    def test_jitter_does_not_affect_the_growth(self):
+        # The interval keeps growing from the undisturbed interval rather than the jittered one
+        with mock.patch('dcgoss.retry_policy.random.uniform', return_value=1.5):
+            phase = RetryPolicy(1, 10, 2.0, 0.5).start()
+            self.assertEqual([phase.next_interval() for _ in range(3)], [1.5, 3, 6])
+
+    def test_interval_is_capped_by_the_deadline(self):
+        phase = RetryPolicy(10).start(deadline=time() + 1)
+
+        interval = phase.next_interval()
+        self.assertGreater(interval, 0)
+        self.assertLessEqual(interval, 1)
+        self.assertFalse(phase.is_expired())
+
+    def test_expired_phase_does_not_wait(self):
+        phase = RetryPolicy(10).start(deadline=time() - 1)
+
+        self.assertTrue(phase.is_expired())
+        self.assertEqual(phase.next_interval(), 0)
+
+    def test_phase_is_limited_by_the_earliest_of_timeout_and_deadline(self):
+        policy = RetryPolicy(1)
+
+        self.assertAlmostEqual(policy.start(5, time() + 60).remaining(), 5, delta=1)
+        self.assertAlmostEqual(policy.start(60, time() + 5).remaining(), 5, delta=1)
+        self.assertAlmostEqual(policy.start(0, time() + 5).remaining(), 5, delta=1)
+        self.assertIsNone(policy.start().remaining())
+        self.assertFalse(policy.start().is_expired())
+
+    def test_each_phase_starts_from_the_initial_interval(self):
+        policy = RetryPolicy(1, 10, 2.0)
+        startup = policy.start(30)
+        for _ in range(3):
+            startup.next_interval()
+
+        # Moving on to the next phase resets the backoff without affecting the previous phase
+        validate = policy.start(30)
+        self.assertEqual(validate.next_interval(), 1)
+        self.assertEqual(startup.next_interval(), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
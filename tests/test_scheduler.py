@@ -0,0 +1,123 @@
+# Copyright 2020 Shelby Allen-Franks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import threading
+import unittest
+
+from tempfile import TemporaryDirectory
+from time import time
+
+from dcgoss.scheduler import ProjectLock
+
+
+class ProjectLockTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.locks_path = '{}/locks'.format(self.directory.name)
+        self.removed = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _reap(self, project_name, has_resources, owner=''):
+        lock = ProjectLock(self.locks_path, project_name, owner)
+        lock.acquire()
+        lock.reap(lambda name: has_resources, lambda name, fileno: self.removed.append(name))
+        lock.release(remove=True)
+
+    def test_release_removes_lock_file(self):
+        lock = ProjectLock(self.locks_path, 'first')
+        self.assertTrue(lock.acquire())
+        self.assertTrue(os.path.exists('{}/first.lock'.format(self.locks_path)))
+
+        lock.release(remove=True)
+        self.assertEqual(os.listdir(self.locks_path), [])
+
+    def test_locked_project_is_not_acquired_twice(self):
+        lock = ProjectLock(self.locks_path, 'first')
+        self.assertTrue(lock.acquire())
+        self.assertFalse(ProjectLock(self.locks_path, 'first').acquire())
+        lock.release()
+
+    def test_acquire_waits_for_the_project_to_be_released(self):
+        lock = ProjectLock(self.locks_path, 'first')
+        lock.acquire()
+
+        # Wait for the project from another thread while it is still locked
+        waiting = ProjectLock(self.locks_path, 'first', poll_interval=0.05)
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: waiting.acquire(time() + 10) and acquired.set())
+        thread.start()
+        self.assertFalse(acquired.wait(0.3))
+
+        # Release the project and remove its lock file as a finished removal does
+        lock.release(remove=True)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertTrue(waiting.is_held())
+        self.assertTrue(os.path.exists('{}/first.lock'.format(self.locks_path)))
+        waiting.release(remove=True)
+
+    def test_acquire_times_out_while_the_project_is_locked(self):
+        lock = ProjectLock(self.locks_path, 'first')
+        lock.acquire()
+
+        with self.assertRaises(TimeoutError):
+            ProjectLock(self.locks_path, 'first', poll_interval=0.05).acquire(time() + 0.2)
+        lock.release()
+
+    def test_reap_skips_locked_projects(self):
+        lock = ProjectLock(self.locks_path, 'first')
+        lock.acquire()
+
+        self._reap('second', True)
+        self.assertEqual(self.removed, [])
+        lock.release()
+
+    def test_reap_removes_abandoned_projects(self):
+        # Leave the lock file behind as a run does when its removal fails
+        lock = ProjectLock(self.locks_path, 'first')
+        lock.acquire()
+        lock.release()
+
+        self._reap('second', True)
+        self.assertEqual(self.removed, ['first'])
+        self.assertEqual(os.listdir(self.locks_path), ['first.lock'])
+
+    def test_reap_forgets_removed_projects(self):
+        lock = ProjectLock(self.locks_path, 'first')
+        lock.acquire()
+        lock.release()
+
+        self._reap('second', False)
+        self.assertEqual(self.removed, [])
+        self.assertEqual(os.listdir(self.locks_path), [])
+
+    def test_reap_skips_projects_of_other_compose_files(self):
+        lock = ProjectLock(self.locks_path, 'first', '/other/docker-compose.yaml')
+        lock.acquire()
+        lock.release()
+
+        self._reap('second', True, '/project/docker-compose.yaml')
+        self.assertEqual(self.removed, [])
+        self.assertEqual(os.listdir(self.locks_path), ['first.lock'])
+
+        self._reap('third', True, '/other/docker-compose.yaml')
+        self.assertEqual(self.removed, ['first'])
+
+
+if __name__ == '__main__':
+    unittest.main()